@@ -1,30 +1,21 @@
+import asyncio
 import logging
 import os
 import django
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
 from telegram import Update, KeyboardButton, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup
-from asgiref.sync import sync_to_async
 from telegram.ext import ContextTypes, ConversationHandler
 from dotenv import load_dotenv
-import traceback
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
-import sys
-if sys.stdout.encoding != 'utf-8':
-    sys.stdout.reconfigure(encoding='utf-8')
-logger = logging.getLogger(__name__)
+from logging_config import setup_logging
 
-# Загружаем переменные окружения из файла .env после настройки логирования
+# Загружаем переменные окружения из файла .env до настройки логирования: в нём могут быть LOG_*
 load_dotenv()
-logger.info(f"Loaded .env file from {os.getcwd()}")
+
+# Настройка логирования
+setup_logging()
+logger = logging.getLogger(__name__)
+logger.info("Loaded .env file from %s", os.getcwd())
 
 # Настройка Django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'volunteer_project.settings')
@@ -32,89 +23,48 @@ try:
     django.setup()
     logger.info("Django setup completed successfully")
 except Exception as e:
-    logger.error(f"Failed to setup Django: {e}\n{traceback.format_exc()}")
+    logger.error("Failed to setup Django: %s", e, exc_info=True)
     raise
 
-from core.models import User
+from django.conf import settings
+from core.repository import get_user, create_user, get_admin, mark_bot_unblocked
+from broadcast import resume_broadcasts, stop_broadcasts
+from scheduler import start_deadline_scheduler, stop_deadline_scheduler
+from media_storage import close_media_storage
+from metrics import InstrumentedHTTPXRequest, instrument_application, start_metrics_server, stop_metrics_server
+from persistence import DatabasePersistence
+from update_processor import ChatOrderedUpdateProcessor
 from volunteer_handlers import register_handlers as register_volunteer_handlers, volunteer_menu as volunteer_start, get_volunteer_keyboard
 from organization_handlers import register_handlers as register_organization_handlers, org_menu
 
 # Загрузка токена из переменной окружения
-TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+TOKEN = settings.TELEGRAM_BOT_TOKEN
 if not TOKEN:
     logger.error("TELEGRAM_BOT_TOKEN not set in environment variables")
     raise ValueError("TELEGRAM_BOT_TOKEN not set in environment variables")
-logger.info(f"Loaded TOKEN: {TOKEN[:5]}... (partial for security)")
-
-# Создаём приложение
-try:
-    application = Application.builder().token(TOKEN).build()
-    logger.info("Application built successfully")
-except Exception as e:
-    logger.error(f"Failed to build Application: {e}\n{traceback.format_exc()}")
-    raise
+logger.info("Loaded TOKEN: %s... (partial for security)", TOKEN[:5])
 
 # Состояния для регистрации
 USERNAME_REQUEST, PHONE_REQUEST, ROLE_REQUEST, ORGANIZATION_REQUEST = range(4)
 
-# Вспомогательные функции
-@sync_to_async
-def get_user(telegram_id):
-    try:
-        user = User.objects.get(telegram_id=telegram_id)
-        logger.info(f"User found: {user.username} (telegram_id: {telegram_id})")
-        return user
-    except User.DoesNotExist:
-        logger.warning(f"User not found with telegram_id: {telegram_id}")
-        return None
-
-@sync_to_async
-def create_user(telegram_id, phone_number, username, is_organizer=False, organization_name=None):
-    try:
-        user = User.objects.create(
-            telegram_id=telegram_id,
-            phone_number=phone_number,
-            username=username,
-            rating=0,
-            is_organizer=is_organizer,
-            organization_name=organization_name
-        )
-        logger.info(f"User created: {username} (telegram_id: {telegram_id}, phone: {phone_number}, org: {organization_name})")
-        return user
-    except Exception as e:
-        logger.error(f"Error creating user: {e}\n{traceback.format_exc()}")
-        return None
-
-@sync_to_async
-def get_admin():
-    try:
-        admin = User.objects.filter(is_staff=True).first()
-        if admin:
-            logger.info(f"Admin found: {admin.username}")
-            return admin
-        else:
-            logger.warning("No admin found")
-            return None
-    except Exception as e:
-        logger.error(f"Error fetching admin: {e}\n{traceback.format_exc()}")
-        return None
-
 # Обработчик команды /start
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.message.from_user
     telegram_id = str(user.id)
-    logger.info(f"Received /start command from telegram_id: {telegram_id}")
+    logger.info("Received /start command from telegram_id: %s", telegram_id)
     db_user = await get_user(telegram_id)
 
     if db_user:
+        # Раз пользователь пишет боту, он его не блокирует
+        await mark_bot_unblocked(db_user)
         if db_user.is_staff:
-            logger.info(f"User {db_user.username} is an admin, redirecting to admin menu")
+            logger.info("User %s is an admin, redirecting to admin menu", db_user.username)
             # await admin_menu(update, context)  # Разкомментируйте, если добавите admin_handlers
         elif db_user.is_organizer:
-            logger.info(f"User {db_user.username} is an organizer, redirecting to org menu")
+            logger.info("User %s is an organizer, redirecting to org menu", db_user.username)
             await org_menu(update, context)
         else:
-            logger.info(f"User {db_user.username} is a volunteer, redirecting to volunteer menu")
+            logger.info("User %s is a volunteer, redirecting to volunteer menu", db_user.username)
             await volunteer_start(update, context)
         return ConversationHandler.END
 
@@ -234,9 +184,9 @@ async def receive_organization(update: Update, context: ContextTypes.DEFAULT_TYP
                     chat_id=admin.telegram_id,
                     text=f"Новый запрос на статус организатора:\nПользователь: {username}\nТелефон: {phone_number}\nОрганизация: {organization_name}\nПроверьте в админ-панели."
                 )
-                logger.info(f"Admin {admin.username} notified about organizer request from {username}")
+                logger.info("Admin %s notified about organizer request from %s", admin.username, username)
             except Exception as e:
-                logger.error(f"Failed to notify admin about organizer request: {e}\n{traceback.format_exc()}")
+                logger.error("Failed to notify admin about organizer request: %s", e, exc_info=True)
         else:
             logger.warning("Admin not found or telegram_id missing for admin")
         context.user_data.clear()
@@ -247,45 +197,102 @@ async def receive_organization(update: Update, context: ContextTypes.DEFAULT_TYP
 
 # Глобальный обработчик ошибок
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    logger.error(f"Update {update} caused error {context.error}\n{traceback.format_exc()}")
+    logger.error("Update %s caused error %s", update, context.error, exc_info=context.error)
     if update and update.effective_message:
         await update.effective_message.reply_text("Произошла ошибка. Пожалуйста, попробуйте снова.")
 
-# Регистрируем обработчики
-registration_conv = ConversationHandler(
-    entry_points=[CommandHandler("start", start)],
-    states={
-        USERNAME_REQUEST: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_username)],
-        PHONE_REQUEST: [MessageHandler(filters.CONTACT, receive_phone)],
-        ROLE_REQUEST: [CallbackQueryHandler(receive_role, pattern=r"^role_")],
-        ORGANIZATION_REQUEST: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_organization)],
-    },
-    fallbacks=[CommandHandler("start", start)],
-    per_message=False
-)
-application.add_handler(registration_conv)
-
-logger.info("Registering volunteer handlers...")
-register_volunteer_handlers(application)
-logger.info("Volunteer handlers registered successfully")
-
-logger.info("Registering organization handlers...")
-register_organization_handlers(application)
-logger.info("Organization handlers registered successfully")
-
 # Добавляем обработчик для всех обновлений для отладки
 async def debug_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    logger.info(f"Received update: {update}")
-application.add_handler(MessageHandler(filters.ALL, debug_update))
+    logger.debug("Unhandled update: %s", update)
 
-# register_admin_handlers(application)  # Разкомментируйте, если добавите admin_handlers
-application.add_error_handler(error_handler)
+async def post_init(application):
+    await resume_broadcasts(application)
+    await start_deadline_scheduler(application)
+    await start_metrics_server(application)
 
-# Запуск бота
-logger.info("Starting bot...")
-try:
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
-except Exception as e:
-    logger.error(f"Bot polling failed: {e}\n{traceback.format_exc()}")
-    raise
-logger.info("Bot stopped.")
\ No newline at end of file
+async def post_stop(application):
+    await stop_deadline_scheduler(application)
+    await stop_broadcasts(application)
+
+async def post_shutdown(application):
+    await stop_metrics_server(application)
+    await close_media_storage(application)
+
+def build_application(webhook=False, request=None):
+    """Создаёт Application со всеми обработчиками бота.
+
+    В режиме webhook обновления приходят через ASGI-приложение (webhook.py), поэтому
+    Updater с long polling не создаётся, а очередь обновлений ограничена по размеру.
+    Обновления разных чатов обрабатываются параллельно, одного чата — по очереди.
+    При запуске продолжаются прерванные рассылки (broadcast.py), загружаются сроки заданий
+    для напоминаний (scheduler.py) и восстанавливаются незаконченные диалоги (persistence.py). Метрики отдаются на METRICS_PORT (metrics.py).
+    request заменяет HTTP-клиент Bot API: бенчмарк bench_bot передаёт заглушку без сети.
+    """
+    builder = Application.builder().token(TOKEN).request(
+        request or InstrumentedHTTPXRequest(connection_pool_size=256)
+    ).concurrent_updates(
+        ChatOrderedUpdateProcessor(settings.TELEGRAM_CONCURRENT_UPDATES)
+    ).persistence(
+        DatabasePersistence(update_interval=settings.TELEGRAM_PERSISTENCE_INTERVAL)
+    ).post_init(post_init).post_stop(post_stop).post_shutdown(post_shutdown)
+    if webhook:
+        builder = builder.updater(None).update_queue(asyncio.Queue(maxsize=settings.TELEGRAM_UPDATE_QUEUE_SIZE))
+    try:
+        application = builder.build()
+        logger.info("Application built successfully")
+    except Exception as e:
+        logger.error("Failed to build Application: %s", e, exc_info=True)
+        raise
+
+    # Регистрируем обработчики
+    registration_conv = ConversationHandler(
+        entry_points=[CommandHandler("start", start)],
+        states={
+            USERNAME_REQUEST: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_username)],
+            PHONE_REQUEST: [MessageHandler(filters.CONTACT, receive_phone)],
+            ROLE_REQUEST: [CallbackQueryHandler(receive_role, pattern=r"^role_")],
+            ORGANIZATION_REQUEST: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_organization)],
+        },
+        fallbacks=[CommandHandler("start", start)],
+        per_message=False,
+        name='registration',
+        persistent=True
+    )
+    application.add_handler(registration_conv)
+
+    logger.info("Registering volunteer handlers...")
+    register_volunteer_handlers(application)
+    logger.info("Volunteer handlers registered successfully")
+
+    logger.info("Registering organization handlers...")
+    register_organization_handlers(application)
+    logger.info("Organization handlers registered successfully")
+
+    application.add_handler(MessageHandler(filters.ALL, debug_update))
+
+    # register_admin_handlers(application)  # Разкомментируйте, если добавите admin_handlers
+    application.add_error_handler(error_handler)
+    # Время обработчиков, запросы к БД и Telegram, очередь обновлений (metrics.py)
+    instrument_application(application)
+    return application
+
+def main():
+    if settings.TELEGRAM_WEBHOOK_SECRET:
+        # В режиме webhook бот работает внутри ASGI-приложения, polling запускать нельзя:
+        # Telegram не отдаёт getUpdates, пока установлен webhook
+        logger.error("TELEGRAM_WEBHOOK_SECRET is set: run the bot with 'uvicorn volunteer_project.asgi:application' instead of bot.py")
+        raise SystemExit(1)
+
+    application = build_application()
+
+    # Запуск бота
+    logger.info("Starting bot...")
+    try:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
+    except Exception as e:
+        logger.error("Bot polling failed: %s", e, exc_info=True)
+        raise
+    logger.info("Bot stopped.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+"""Рассылка сообщений большому числу пользователей с учётом лимитов Telegram.
+
+Рассылка и получатели сохраняются в БД заранее (core.models.Broadcast, BroadcastDelivery),
+поэтому прерванная рассылка продолжается при следующем запуске бота с того места, где
+остановилась. Сообщения отправляются параллельно через token bucket: общий лимит бота и
+отдельный лимит на чат. RetryAfter приостанавливает всю рассылку на указанное время, а
+пользователи, заблокировавшие бота (Forbidden), помечаются и больше не получают рассылок.
+"""
+import asyncio
+import logging
+import time
+import weakref
+
+from django.conf import settings
+from django.utils import timezone
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from core.repository import (
+    get_broadcast, get_unfinished_broadcast_ids, start_broadcast, get_pending_deliveries,
+    save_delivery_results, complete_broadcast,
+)
+from media_registry import media_registry
+
+logger = logging.getLogger(__name__)
+
+# Сколько раз повторять отправку при сетевых ошибках (RetryAfter не считается)
+MAX_ATTEMPTS = 3
+# Сколько доставок читать из БД за раз и сохранять одной пачкой
+BATCH_SIZE = 100
+
+
+class TokenBucket:
+    """Ограничивает частоту операций: rate в секунду с запасом capacity на всплеск."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def pause(self, seconds):
+        """Не выдавать токены seconds секунд (после RetryAfter от Telegram)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class ChatRateLimiter:
+    """Лимит сообщений в один чат: не чаще rate в секунду."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        # chat_id -> момент, раньше которого в чат писать нельзя
+        self._next_allowed = {}
+
+    async def acquire(self, chat_id):
+        now = time.monotonic()
+        allowed = self._next_allowed.get(chat_id, now)
+        self._next_allowed[chat_id] = max(allowed, now) + self.interval
+        if allowed > now:
+            await asyncio.sleep(allowed - now)
+        if len(self._next_allowed) > 10000:
+            self._next_allowed = {key: value for key, value in self._next_allowed.items() if value > now}
+
+
+class Broadcaster:
+    def __init__(self, bot, rate=None, chat_rate=None, workers=None):
+        self.bot = bot
+        self.limiter = TokenBucket(rate or settings.TELEGRAM_BROADCAST_RATE)
+        self.chat_limiter = ChatRateLimiter(chat_rate or settings.TELEGRAM_BROADCAST_CHAT_RATE)
+        self.workers = workers or settings.TELEGRAM_BROADCAST_WORKERS
+        # broadcast_id -> asyncio.Task
+        self._tasks = {}
+
+    def start(self, broadcast_id):
+        """Запускает отправку рассылки в фоне (повторный запуск той же рассылки игнорируется)"""
+        task = self._tasks.get(broadcast_id)
+        if task is None or task.done():
+            task = asyncio.create_task(self._run(broadcast_id), name=f"broadcast-{broadcast_id}")
+            self._tasks[broadcast_id] = task
+            task.add_done_callback(lambda _: self._tasks.pop(broadcast_id, None))
+        return task
+
+    async def resume(self):
+        broadcast_ids = await get_unfinished_broadcast_ids()
+        if broadcast_ids:
+            logger.info("Resuming %s unfinished broadcasts: %s", len(broadcast_ids), broadcast_ids)
+        for broadcast_id in broadcast_ids:
+            self.start(broadcast_id)
+
+    async def stop(self):
+        """Прерывает рассылки; неотправленные доставки остаются в БД и будут отправлены позже"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, broadcast_id):
+        try:
+            broadcast = await get_broadcast(broadcast_id)
+            await start_broadcast(broadcast)
+            message = await self._prepare_message(broadcast)
+            logger.info("Broadcast %s started", broadcast_id)
+
+            queue = asyncio.Queue(maxsize=BATCH_SIZE)
+            results = []
+            flush_lock = asyncio.Lock()
+
+            async def flush():
+                async with flush_lock:
+                    if results:
+                        batch = results[:]
+                        results.clear()
+                        await save_delivery_results(batch)
+
+            async def worker():
+                while True:
+                    delivery = await queue.get()
+                    try:
+                        try:
+                            await self._deliver(delivery, message)
+                        except Exception as e:
+                            logger.error("Unexpected error delivering to %s: %s", delivery.chat_id, e, exc_info=True)
+                            delivery.status = 'failed'
+                            delivery.error = str(e)
+                        results.append(delivery)
+                        if len(results) >= BATCH_SIZE:
+                            await flush()
+                    except Exception as e:
+                        logger.error("Failed to save broadcast %s results: %s", broadcast_id, e, exc_info=True)
+                    finally:
+                        queue.task_done()
+
+            workers = [asyncio.create_task(worker()) for _ in range(self.workers)]
+            try:
+                after_id = 0
+                while True:
+                    deliveries = await get_pending_deliveries(broadcast_id, after_id, BATCH_SIZE)
+                    if not deliveries:
+                        break
+                    for delivery in deliveries:
+                        await queue.put(delivery)
+                    after_id = deliveries[-1].id
+                await queue.join()
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                # Сохраняем то, что уже отправлено, и при отмене: иначе при возобновлении
+                # эти сообщения ушли бы повторно
+                await asyncio.shield(flush())
+
+            counts = await complete_broadcast(broadcast_id)
+            logger.info("Broadcast %s completed: %s", broadcast_id, counts)
+            await self._report(broadcast, counts)
+        except asyncio.CancelledError:
+            logger.info("Broadcast %s interrupted, it will be resumed on next start", broadcast_id)
+            raise
+        except Exception as e:
+            logger.error("Broadcast %s failed: %s", broadcast_id, e, exc_info=True)
+
+    async def _prepare_message(self, broadcast):
+        reply_markup = None
+        if broadcast.buttons:
+            reply_markup = InlineKeyboardMarkup([
+                [InlineKeyboardButton(label, callback_data=data) for label, data in row]
+                for row in broadcast.buttons
+            ])
+        return {'text': broadcast.text, 'photo': broadcast.photo, 'reply_markup': reply_markup}
+
+    async def _deliver(self, delivery, message):
+        """Отправляет одно сообщение и записывает результат в delivery (без сохранения)"""
+        while delivery.attempts < MAX_ATTEMPTS:
+            await self.limiter.acquire()
+            await self.chat_limiter.acquire(delivery.chat_id)
+            delivery.attempts += 1
+            try:
+                if message['photo']:
+                    # Фото загружается в Telegram один раз, остальным получателям уходит его file_id
+                    sent = await media_registry.send_photo(
+                        self.bot, delivery.chat_id, message['photo'],
+                        caption=message['text'], reply_markup=message['reply_markup']
+                    )
+                else:
+                    sent = await self.bot.send_message(
+                        chat_id=delivery.chat_id, text=message['text'], reply_markup=message['reply_markup']
+                    )
+                delivery.status = 'sent'
+                delivery.message_id = sent.message_id
+                delivery.sent_at = timezone.now()
+                delivery.error = ''
+                return
+            except RetryAfter as e:
+                # Превышен лимит: останавливаем всю рассылку, эта попытка не считается
+                logger.warning("Flood control on chat %s, pausing broadcasts for %ss", delivery.chat_id, e.retry_after)
+                self.limiter.pause(e.retry_after)
+                delivery.attempts -= 1
+            except Forbidden as e:
+                logger.info("User %s blocked the bot: %s", delivery.chat_id, e)
+                delivery.status = 'blocked'
+                delivery.error = str(e)
+                return
+            except BadRequest as e:
+                # Чат не найден, неверный запрос — повтор не поможет
+                logger.warning("Failed to deliver to %s: %s", delivery.chat_id, e)
+                delivery.status = 'failed'
+                delivery.error = str(e)
+                return
+            except NetworkError as e:
+                logger.warning("Network error delivering to %s (attempt %s): %s", delivery.chat_id, delivery.attempts, e)
+                delivery.error = str(e)
+                if delivery.attempts < MAX_ATTEMPTS:
+                    await asyncio.sleep(2 ** delivery.attempts)
+        delivery.status = 'failed'
+
+    async def _report(self, broadcast, counts):
+        creator = broadcast.creator
+        if not creator or not creator.telegram_id:
+            return
+        total = sum(counts.values())
+        text = f"Рассылка завершена: доставлено {counts.get('sent', 0)} из {total}."
+        if counts.get('blocked'):
+            text += f"\nЗаблокировали бота: {counts['blocked']}."
+        if counts.get('failed'):
+            text += f"\nНе удалось доставить: {counts['failed']}."
+        try:
+            await self.bot.send_message(chat_id=creator.telegram_id, text=text)
+        except Exception as e:
+            logger.warning("Failed to send broadcast report to %s: %s", creator.username, e)
+
+
+_broadcasters = weakref.WeakKeyDictionary()
+
+
+def get_broadcaster(application):
+    broadcaster = _broadcasters.get(application)
+    if broadcaster is None:
+        broadcaster = _broadcasters[application] = Broadcaster(application.bot)
+    return broadcaster
+
+
+async def resume_broadcasts(application):
+    """post_init: продолжает рассылки, прерванные при прошлой остановке бота"""
+    await get_broadcaster(application).resume()
+
+
+async def stop_broadcasts(application):
+    """post_stop: останавливает рассылки до закрытия соединения с Telegram"""
+    await get_broadcaster(application).stop()
@@ -1,21 +1,46 @@
+import os
+from datetime import timedelta
+
 from django.contrib import admin
 from django.db.models import Count
-from .models import User, Project, VolunteerProject, Photo, Task, TaskAssignment, timezone
+from django.utils.html import format_html
+from .cache import user_cache
+from .catalog import project_catalog
+from .derivatives import derivative_url
+from .models import (
+    User, Project, ProjectTag, Tag, VolunteerProject, Photo, Task, TaskAssignment, Broadcast, BroadcastDelivery,
+    MediaFile, BotState, RatingEvent, rating_points, timezone,
+)
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
     list_display = ('username', 'telegram_id', 'phone_number', 'organization_name', 'rating', 'is_staff', 'is_organizer')
-    list_filter = ('is_staff', 'is_organizer', 'organization_name')
+    list_filter = ('is_staff', 'is_organizer', 'bot_blocked', 'organization_name')
     search_fields = ('username', 'telegram_id', 'phone_number', 'organization_name')
     fieldsets = (
         (None, {'fields': ('username', 'password')}),
-        ('Personal info', {'fields': ('telegram_id', 'phone_number', 'organization_name', 'rating')}),
+        ('Personal info', {'fields': ('telegram_id', 'phone_number', 'organization_name', 'rating', 'bot_blocked')}),
         ('Permissions', {'fields': ('is_staff', 'is_organizer', 'groups', 'user_permissions')}),
     )
     actions = ['approve_organizer', 'reject_organizer']
 
+    def save_model(self, request, obj, form, change):
+        # Рейтинг меняется только через журнал RatingEvent, иначе recompute_ratings отменит правку:
+        # строка сохраняется с рейтингом из БД, а разница с ним записывается событием manual
+        current = User.objects.values_list('rating', flat=True).get(pk=obj.pk) if change else 0
+        delta, obj.rating = obj.rating - current, current
+        super().save_model(request, obj, form, change)
+        if delta:
+            obj.update_rating(delta, source='manual')
+
+    def invalidate_cached_users(self, queryset):
+        # queryset.update() не отправляет post_save, поэтому кэш бота сбрасываем явно
+        for pk, telegram_id in queryset.values_list('pk', 'telegram_id'):
+            user_cache.invalidate(telegram_id=telegram_id, pk=pk)
+
     def approve_organizer(self, request, queryset):
         queryset.update(is_organizer=True)
+        self.invalidate_cached_users(queryset)
         for user in queryset:
             if user.telegram_id:
                 pass
@@ -23,43 +48,89 @@ class UserAdmin(admin.ModelAdmin):
 
     def reject_organizer(self, request, queryset):
         queryset.update(is_organizer=False, organization_name=None)
+        self.invalidate_cached_users(queryset)
         for user in queryset:
             if user.telegram_id:
                 pass
     reject_organizer.short_description = "Отклонить статус организатора"
 
+class ProjectTagInline(admin.TabularInline):
+    model = ProjectTag
+    extra = 1
+    autocomplete_fields = ('tag',)
+
 @admin.register(Project)
 class ProjectAdmin(admin.ModelAdmin):
-    list_display = ('title', 'city', 'status', 'creator', 'volunteer_count')
+    list_display = ('title', 'city', 'status', 'creator', 'volunteer_count', 'capacity')
     list_filter = ('status', 'city')
     search_fields = ('title', 'city')
+    list_select_related = ('creator',)
+    inlines = [ProjectTagInline]
     actions = ['approve_projects', 'reject_projects']
 
+    def get_queryset(self, request):
+        # Количество волонтёров считается в том же запросе, а не отдельным COUNT на каждую строку
+        return super().get_queryset(request).annotate(volunteers_total=Count('volunteer_projects'))
+
     def volunteer_count(self, obj):
-        return obj.volunteer_projects.count()
+        return obj.volunteers_total
     volunteer_count.short_description = "Количество волонтёров"
+    volunteer_count.admin_order_field = 'volunteers_total'
+
+    def update_status(self, queryset, status):
+        # id берутся до update(): после него queryset с фильтром по статусу уже пуст
+        project_ids = list(queryset.values_list('pk', flat=True))
+        queryset.update(status=status)
+        # queryset.update() не отправляет post_save, поэтому каталог бота обновляем явно
+        project_catalog.invalidate(project_ids=project_ids)
 
     def approve_projects(self, request, queryset):
-        queryset.update(status='approved')
+        self.update_status(queryset, 'approved')
     approve_projects.short_description = "Одобрить выбранные проекты"
 
     def reject_projects(self, request, queryset):
-        queryset.update(status='rejected')
+        self.update_status(queryset, 'rejected')
     reject_projects.short_description = "Отклонить выбранные проекты"
 
+@admin.register(Tag)
+class TagAdmin(admin.ModelAdmin):
+    list_display = ('name', 'project_count')
+    search_fields = ('name',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(projects_total=Count('project_tags'))
+
+    def project_count(self, obj):
+        return obj.projects_total
+    project_count.short_description = "Количество проектов"
+    project_count.admin_order_field = 'projects_total'
+
 @admin.register(Photo)
 class PhotoAdmin(admin.ModelAdmin):
-    list_display = ('volunteer', 'project', 'status', 'uploaded_at', 'image_preview')
+    list_display = ('volunteer', 'project', 'status', 'uploaded_at', 'thumbnail')
     list_filter = ('status', 'uploaded_at')
     search_fields = ('volunteer__username', 'project__title')
     actions = ['approve_photos', 'reject_photos']
     readonly_fields = ('image_preview',)
 
-    def image_preview(self, obj):
-        if obj.image and hasattr(obj.image, 'url'):
-            return f'<img src="{obj.image.url}" width="100" height="100" />'
+    def preview_html(self, obj, thumb_url):
+        # Превью весит килобайты, оригинал открывается по клику
+        if thumb_url:
+            return format_html(
+                '<a href="{}" target="_blank"><img src="{}" width="100" height="100" style="object-fit: cover;" /></a>',
+                obj.image.url, thumb_url
+            )
+        if obj.image and os.path.exists(obj.image.path):
+            return format_html('<a href="{}" target="_blank">Открыть оригинал</a>', obj.image.url)
         return "No image"
-    image_preview.allow_tags = True
+
+    def thumbnail(self, obj):
+        # В списке Pillow не запускается: недостающее превью создаётся в фоне
+        return self.preview_html(obj, derivative_url(obj.image, render=False))
+    thumbnail.short_description = "Превью"
+
+    def image_preview(self, obj):
+        return self.preview_html(obj, derivative_url(obj.image))
     image_preview.short_description = "Превью"
 
     def approve_photos(self, request, queryset):
@@ -69,7 +140,9 @@ class PhotoAdmin(admin.ModelAdmin):
             
             # Обновляем рейтинг волонтера (если фото с оценкой)
             if photo.rating:
-                photo.volunteer.update_rating(photo.rating * 2)  # Умножаем на 2 для значимости
+                photo.volunteer.update_rating(
+                    rating_points(photo.rating), source='photo', stars=photo.rating, photo=photo
+                )
             
             photo.save()
             self.message_user(request, f"Фото {photo.id} одобрено!")
@@ -82,14 +155,36 @@ class PhotoAdmin(admin.ModelAdmin):
 
 @admin.register(VolunteerProject)
 class VolunteerProjectAdmin(admin.ModelAdmin):
-    list_display = ('volunteer', 'project', 'joined_at')
+    list_display = ('volunteer', 'project', 'joined_at', 'seat')
     list_filter = ('joined_at',)
     search_fields = ('volunteer__username', 'project__title')
 
+class TaskDeadlineFilter(admin.SimpleListFilter):
+    """Срок задания по сохранённому deadline: фильтр — один запрос по индексу, без проверки каждой строки"""
+    title = 'срок'
+    parameter_name = 'deadline'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('expired', 'Истёк'),
+            ('day', 'Истекает в ближайшие сутки'),
+            ('week', 'Истекает в ближайшую неделю'),
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() == 'expired':
+            return queryset.expired()
+        if self.value() == 'day':
+            return queryset.due_within(timedelta(days=1))
+        if self.value() == 'week':
+            return queryset.due_within(timedelta(days=7))
+        return queryset
+
 @admin.register(Task)
 class TaskAdmin(admin.ModelAdmin):
     list_display = ('id', 'project', 'creator', 'status', 'created_at', 'deadline_date', 'start_time', 'end_time')
-    list_filter = ('status', 'created_at')
+    list_filter = ('status', TaskDeadlineFilter, 'created_at')
+    list_select_related = ('project', 'creator')
     search_fields = ('project__title', 'creator__username')
 
     def get_queryset(self, request):
@@ -105,4 +200,45 @@ class TaskAdmin(admin.ModelAdmin):
 class TaskAssignmentAdmin(admin.ModelAdmin):
     list_display = ('task', 'volunteer', 'accepted', 'completed', 'completed_at', 'rating', 'feedback')
     list_filter = ('accepted', 'completed')
-    search_fields = ('task__id', 'volunteer__username')
\ No newline at end of file
+    search_fields = ('task__id', 'volunteer__username')
+
+@admin.register(RatingEvent)
+class RatingEventAdmin(admin.ModelAdmin):
+    # Журнал только дополняется: рейтинг меняется через User.update_rating, а не правкой записей
+    list_display = ('user', 'source', 'stars', 'points', 'photo', 'assignment', 'created_at')
+    list_filter = ('source', 'created_at')
+    search_fields = ('user__username',)
+    list_select_related = (
+        'user', 'photo__volunteer', 'assignment__volunteer', 'assignment__task__project', 'assignment__task__creator'
+    )
+    readonly_fields = ('user', 'source', 'stars', 'points', 'photo', 'assignment', 'created_at')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(Broadcast)
+class BroadcastAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'task', 'creator', 'status', 'created_at', 'completed_at')
+    list_filter = ('kind', 'status', 'created_at')
+    search_fields = ('text', 'creator__username')
+
+@admin.register(BroadcastDelivery)
+class BroadcastDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('broadcast', 'user', 'chat_id', 'status', 'attempts', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('user__username', 'chat_id')
+    list_select_related = ('broadcast', 'user')
+
+@admin.register(MediaFile)
+class MediaFileAdmin(admin.ModelAdmin):
+    list_display = ('path', 'sha256', 'size', 'file_id', 'updated_at')
+    search_fields = ('path', 'sha256', 'file_unique_id')
+
+@admin.register(BotState)
+class BotStateAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'key', 'updated_at')
+    list_filter = ('kind',)
+    search_fields = ('key',)
\ No newline at end of file
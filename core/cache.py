@@ -0,0 +1,117 @@
+"""Кэш пользователей бота по telegram_id.
+
+Почти каждый обработчик начинается с get_user(telegram_id), поэтому пользователи хранятся
+в ограниченном LRU-кэше процесса со сроком жизни записей. Кэшируются и отрицательные
+результаты (незарегистрированные пользователи). Записи сбрасываются сигналами post_save и
+post_delete модели User (core/models.py), а массовые действия админки, которые обходят
+сигналы, сбрасывают их явно. TTL ограничивает устаревание, если пользователь изменён из
+другого процесса (например, бот запущен через run_polling отдельно от админки).
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+# Значение для незарегистрированных пользователей, чтобы отличать его от промаха кэша
+MISSING = object()
+
+
+class UserCache:
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        # telegram_id -> (пользователь или MISSING, время истечения)
+        self._entries = OrderedDict()
+        # pk -> telegram_id, чтобы сбросить запись и после смены telegram_id
+        self._keys_by_pk = {}
+        # Общая для get/set/invalidate (см. db_sync); счётчики меняются под ней же
+        self._lock = threading.Lock()
+        # Растёт при каждом сбросе: результат запроса, начатого до сброса, не кэшируется
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0 and self.ttl > 0
+
+    def get(self, telegram_id):
+        """Возвращает пользователя, MISSING для известного отсутствия или None при промахе.
+
+        Возвращается копия экземпляра: обработчики меняют поля пользователя, и изменения
+        одного обработчика не должны быть видны другим до сохранения.
+        """
+        key = str(telegram_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            user = entry[0]
+        return user if user is MISSING else copy.copy(user)
+
+    @property
+    def version(self):
+        return self._version
+
+    def set(self, telegram_id, user, version=None):
+        """Кэширует пользователя (None — незарегистрированный telegram_id).
+
+        version — значение self.version до запроса к БД; если с тех пор был сброс,
+        прочитанные данные могли устареть и не кэшируются.
+        """
+        if not self.enabled:
+            return
+        key = str(telegram_id)
+        value = MISSING if user is None else copy.copy(user)
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+            self._remove(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            if value is not MISSING:
+                self._keys_by_pk[value.pk] = key
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, telegram_id=None, pk=None):
+        with self._lock:
+            self._version += 1
+            if telegram_id is not None:
+                self._remove(str(telegram_id))
+            if pk is not None and pk in self._keys_by_pk:
+                self._remove(self._keys_by_pk[pk])
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+            self._keys_by_pk.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / total if total else 0.0,
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry[0] is not MISSING:
+            self._keys_by_pk.pop(entry[0].pk, None)
+
+
+user_cache = UserCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL)
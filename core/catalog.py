@@ -0,0 +1,281 @@
+"""Каталог одобренных проектов в памяти процесса бота.
+
+Волонтёры листают один и тот же список одобренных проектов, а меняется он редко (проект
+одобряет админ). Каталог хранит компактные строки проектов (id, название, город, теги, число
+волонтёров) с индексами по городу и тегу без учёта регистра и отдаёт страницы по тому же
+курсору (created_at, id), что и запрос к БД, поэтому листание обходится без запросов.
+Проекты с координатами дополнительно лежат в сетке core.geo.GridIndex для поиска ближайших.
+
+Изменения применяются по одному проекту: сигналы Project, ProjectTag, Tag и VolunteerProject
+(core/models.py) и массовые действия админки помечают проект устаревшим, и при следующем
+обращении перечитываются только помеченные проекты. Проекты, в которых участвует волонтёр,
+кэшируются для каждого пользователя отдельно и сбрасываются теми же сигналами. Раз в
+PROJECT_CATALOG_TTL секунд каталог перечитывается целиком: изменения, сделанные в другом
+процессе (админка запущена отдельно от бота), сигналов сюда не присылают.
+"""
+import bisect
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from core.geo import GridIndex
+
+# Если устаревших проектов больше, каталог дешевле перечитать целиком
+MAX_PARTIAL_REFRESH = 500
+
+
+def normalize(value):
+    return value.strip().casefold()
+
+
+class CatalogEntry:
+    __slots__ = ('id', 'title', 'city', 'tags', 'volunteer_count', 'created_at', 'latitude', 'longitude', 'key')
+
+    def __init__(self, id, title, city, tags, volunteer_count, created_at, latitude=None, longitude=None):
+        self.id = id
+        self.title = title
+        self.city = city
+        self.tags = tags
+        self.volunteer_count = volunteer_count
+        self.created_at = created_at
+        self.latitude = latitude
+        self.longitude = longitude
+        # Порядок каталога: по убыванию (created_at, id), как у keyset-пагинации в БД
+        self.key = (created_at, id)
+
+
+def load_entries(project_ids=None):
+    """Строки каталога одобренных проектов (всех или из project_ids) тремя запросами"""
+    # Модели импортируются здесь: core.models импортирует этот модуль для сигналов
+    from django.db.models import Count
+    from core.models import Project, ProjectTag, VolunteerProject
+
+    projects = Project.objects.filter(status='approved')
+    if project_ids is not None:
+        projects = projects.filter(id__in=project_ids)
+    rows = list(projects.values_list('id', 'title', 'city', 'created_at', 'latitude', 'longitude'))
+
+    tags = {}
+    for project_id, name in ProjectTag.objects.filter(
+        project__in=projects.values('id')
+    ).values_list('project_id', 'tag__name').order_by('tag__name'):
+        tags.setdefault(project_id, []).append(name)
+
+    counts = dict(
+        VolunteerProject.objects.filter(project__in=projects.values('id'))
+        .values('project_id').annotate(total=Count('id')).values_list('project_id', 'total')
+    )
+    return [
+        CatalogEntry(
+            project_id, title, city, tuple(tags.get(project_id, ())), counts.get(project_id, 0), created_at,
+            latitude, longitude
+        )
+        for project_id, title, city, created_at, latitude, longitude in rows
+    ]
+
+
+def load_joined(user_id):
+    from core.models import VolunteerProject
+    return frozenset(VolunteerProject.objects.filter(volunteer_id=user_id).values_list('project_id', flat=True))
+
+
+class ProjectCatalog:
+    def __init__(self, ttl, max_users):
+        self.ttl = ttl
+        self.max_users = max_users
+        # id -> CatalogEntry
+        self._entries = {}
+        # Ключи (created_at, id) всех проектов по возрастанию
+        self._keys = []
+        # Нормализованный город или тег -> множество id проектов
+        self._by_city = {}
+        self._by_tag = {}
+        self._grid = GridIndex()
+        # (город, тег) -> отсортированные ключи проектов с этим фильтром; сбрасывается при изменениях
+        self._filtered = {}
+        # id пользователя -> frozenset id проектов, в которых он участвует (LRU)
+        self._joined = OrderedDict()
+        # Проекты, которые нужно перечитать из БД
+        self._stale = set()
+        self._expires_at = 0.0
+        # Растёт при сбросе участия: набор, прочитанный до сброса, не кэшируется
+        self._joined_version = 0
+        # См. db_sync. Сигналы только помечают проекты в _stale, индексы перестраивает refresh под ней же
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def needs_refresh(self):
+        return self._expires_at <= time.monotonic() or bool(self._stale)
+
+    def get_joined(self, user_id):
+        with self._lock:
+            joined = self._joined.get(user_id)
+            if joined is not None:
+                self._joined.move_to_end(user_id)
+            return joined
+
+    def refresh(self, user_id=None):
+        """Перечитывает устаревшие проекты (или весь каталог) и участие пользователя user_id.
+
+        Выполняет запросы к БД, вызывать из потока пула (core.repository). Возвращает
+        набор проектов пользователя или None, если user_id не передан.
+        """
+        with self._lock:
+            full = self._expires_at <= time.monotonic() or len(self._stale) > MAX_PARTIAL_REFRESH
+            # Проекты, помеченные во время чтения, останутся в _stale до следующего обращения
+            stale, self._stale = self._stale, set()
+        if full:
+            self._replace(load_entries())
+        elif stale:
+            self._update(stale, load_entries(stale))
+
+        if user_id is None:
+            return None
+        joined = self.get_joined(user_id)
+        if joined is None:
+            with self._lock:
+                version = self._joined_version
+            joined = load_joined(user_id)
+            self._set_joined(user_id, joined, version)
+        return joined
+
+    def page(self, joined, city=None, tag=None, after=None, before=None, limit=5):
+        """Страница каталога без проектов из joined; after и before — ключи (created_at, id).
+
+        Возвращает то же, что get_approved_projects_page: список (строка, название, город, теги)
+        и признак того, что в этом направлении есть ещё проекты.
+        """
+        with self._lock:
+            keys = self._filtered_keys(normalize(city) if city else None, normalize(tag) if tag else None)
+            if before:
+                start = bisect.bisect_right(keys, before)
+                candidates = (keys[i] for i in range(start, len(keys)))
+            else:
+                end = bisect.bisect_left(keys, after) if after else len(keys)
+                candidates = (keys[i] for i in range(end - 1, -1, -1))
+            page = []
+            for _, project_id in candidates:
+                if project_id in joined:
+                    continue
+                page.append(self._entries[project_id])
+                if len(page) > limit:
+                    break
+            self.hits += 1
+        has_more = len(page) > limit
+        page = page[:limit]
+        if before:
+            page.reverse()
+        return [(entry, entry.title, entry.city, list(entry.tags)) for entry in page], has_more
+
+    def nearest(self, joined, latitude, longitude, limit=5):
+        """Ближайшие к точке проекты без проектов из joined: список (строка, название, город, теги, км)"""
+        with self._lock:
+            found = [(self._entries[project_id], distance) for distance, project_id in
+                     self._grid.nearest(latitude, longitude, limit, skip=joined)]
+            self.hits += 1
+        return [(entry, entry.title, entry.city, list(entry.tags), distance) for entry, distance in found]
+
+    def invalidate(self, project_ids=(), user_id=None):
+        """Помечает проекты устаревшими и сбрасывает участие пользователя"""
+        with self._lock:
+            self._stale.update(project_ids)
+            if user_id is not None:
+                self._joined_version += 1
+                self._joined.pop(user_id, None)
+
+    def clear(self):
+        """Весь каталог перечитается при следующем обращении (например, после переименования тега)"""
+        with self._lock:
+            self._expires_at = 0.0
+            self._joined_version += 1
+            self._joined.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'projects': len(self._entries),
+                'users': len(self._joined),
+                'stale': len(self._stale),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def _set_joined(self, user_id, joined, version):
+        with self._lock:
+            if version != self._joined_version or self.max_users <= 0:
+                return
+            self._joined[user_id] = joined
+            self._joined.move_to_end(user_id)
+            while len(self._joined) > self.max_users:
+                self._joined.popitem(last=False)
+
+    def _replace(self, entries):
+        with self._lock:
+            self._entries = {}
+            self._by_city = {}
+            self._by_tag = {}
+            self._grid = GridIndex()
+            for entry in entries:
+                self._add(entry)
+            self._keys = sorted(entry.key for entry in self._entries.values())
+            self._filtered = {}
+            self._expires_at = time.monotonic() + self.ttl
+            self.misses += 1
+
+    def _update(self, project_ids, entries):
+        with self._lock:
+            for project_id in project_ids:
+                self._remove(project_id)
+            for entry in entries:
+                self._add(entry)
+                bisect.insort(self._keys, entry.key)
+            self._filtered = {}
+            self.misses += 1
+
+    def _add(self, entry):
+        self._entries[entry.id] = entry
+        self._by_city.setdefault(normalize(entry.city), set()).add(entry.id)
+        for name in entry.tags:
+            self._by_tag.setdefault(normalize(name), set()).add(entry.id)
+        if entry.latitude is not None and entry.longitude is not None:
+            self._grid.add(entry.id, entry.latitude, entry.longitude)
+
+    def _remove(self, project_id):
+        entry = self._entries.pop(project_id, None)
+        if entry is None:
+            return
+        index = bisect.bisect_left(self._keys, entry.key)
+        if index < len(self._keys) and self._keys[index] == entry.key:
+            del self._keys[index]
+        if entry.latitude is not None and entry.longitude is not None:
+            self._grid.remove(project_id, entry.latitude, entry.longitude)
+        for index_map, values in ((self._by_city, [entry.city]), (self._by_tag, entry.tags)):
+            for value in values:
+                ids = index_map.get(normalize(value))
+                if ids is not None:
+                    ids.discard(project_id)
+                    if not ids:
+                        del index_map[normalize(value)]
+
+    def _filtered_keys(self, city, tag):
+        if city is None and tag is None:
+            return self._keys
+        keys = self._filtered.get((city, tag))
+        if keys is None:
+            ids = None
+            for index_map, value in ((self._by_city, city), (self._by_tag, tag)):
+                if value is not None:
+                    matching = index_map.get(value, set())
+                    ids = matching if ids is None else ids & matching
+            keys = self._filtered[(city, tag)] = sorted(self._entries[project_id].key for project_id in ids)
+        return keys
+
+
+project_catalog = ProjectCatalog(settings.PROJECT_CATALOG_TTL, settings.USER_CACHE_SIZE)
@@ -0,0 +1,131 @@
+"""Очередь сроков заданий для планировщика бота (scheduler.py).
+
+У активного задания (open, in_progress) с дедлайном в очереди лежат до трёх событий:
+напоминание перед началом (starts_at - TASK_REMINDER_MINUTES), напоминание перед окончанием
+(deadline - TASK_REMINDER_MINUTES) и истечение срока (deadline). События хранятся в куче по
+времени, поэтому планировщик спит до ближайшего события, а не опрашивает таблицу заданий.
+
+Очередь заполняется при запуске бота одним запросом по индексу (status, deadline), дальше
+её обновляют сигналы Task (core/models.py). Изменённое задание получает новую версию: события
+прежней версии остаются в куче и пропускаются при извлечении, так что правка задания стоит
+O(log n) без поиска по куче.
+"""
+import heapq
+import itertools
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+START_REMINDER = 'start'
+END_REMINDER = 'end'
+EXPIRY = 'expiry'
+
+ACTIVE_STATUSES = ('open', 'in_progress')
+
+
+class DeadlineQueue:
+    def __init__(self, remind_before):
+        self.remind_before = remind_before
+        # (момент, порядковый номер, вид события, id задания, версия задания)
+        self._heap = []
+        # id задания -> текущая версия; у заданий, не менявшихся после загрузки, версия 0
+        self._versions = {}
+        self._seq = itertools.count()
+        # См. db_sync; защищает кучу и _versions вместе, чтобы pop не вернул отменённое событие
+        self._lock = threading.Lock()
+        # Изменения, пришедшие во время чтения заданий из БД: применяются поверх прочитанного
+        self._changed_during_load = None
+        # Будит планировщик, когда ближайшее событие могло стать раньше; вызывается из любого потока
+        self._waker = None
+        self.reminded = 0
+        self.expired = 0
+
+    @property
+    def active(self):
+        # Без запущенного планировщика (админка, команды manage.py) очередь не копится
+        return self._waker is not None
+
+    def set_waker(self, waker):
+        with self._lock:
+            self._waker = waker
+            if waker is None:
+                self._heap, self._versions = [], {}
+
+    def events(self, starts_at, deadline, start_reminded, end_reminded, now):
+        """События задания: (момент, вид). О начале и окончании, которые уже прошли, не напоминаем"""
+        events = []
+        if starts_at is not None and not start_reminded and starts_at > now:
+            events.append((starts_at - self.remind_before, START_REMINDER))
+        if not end_reminded and deadline > now:
+            events.append((deadline - self.remind_before, END_REMINDER))
+        events.append((deadline, EXPIRY))
+        return events
+
+    def begin_load(self):
+        with self._lock:
+            self._changed_during_load = {}
+
+    def load(self, rows, now=None):
+        """Заменяет содержимое очереди; rows — (id, starts_at, deadline, start_reminded, end_reminded)
+        активных заданий с дедлайном"""
+        now = now or timezone.now()
+        heap = [
+            (when, next(self._seq), kind, task_id, 0)
+            for task_id, starts_at, deadline, start_reminded, end_reminded in rows
+            for when, kind in self.events(starts_at, deadline, start_reminded, end_reminded, now)
+        ]
+        heapq.heapify(heap)
+        with self._lock:
+            changed, self._changed_during_load = self._changed_during_load or {}, None
+            self._heap, self._versions = heap, {}
+            for task_id, args in changed.items():
+                self._push(task_id, *args, now=now)
+        self._wake()
+
+    def schedule(self, task_id, status, starts_at, deadline, start_reminded, end_reminded):
+        """Заменяет события задания после его создания или изменения"""
+        if not self.active:
+            return
+        args = (status, starts_at, deadline, start_reminded, end_reminded)
+        with self._lock:
+            if self._changed_during_load is not None:
+                self._changed_during_load[task_id] = args
+            self._push(task_id, *args, now=timezone.now())
+        self._wake()
+
+    def cancel(self, task_id):
+        self.schedule(task_id, None, None, None, True, True)
+
+    def pop_due(self, now, limit):
+        """До limit наступивших событий: список (вид, id задания)"""
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and len(due) < limit:
+                _, _, kind, task_id, version = heapq.heappop(self._heap)
+                if self._versions.get(task_id, 0) == version:
+                    due.append((kind, task_id))
+        return due
+
+    def next_time(self):
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def stats(self):
+        with self._lock:
+            return {'events': len(self._heap), 'reminded': self.reminded, 'expired': self.expired}
+
+    def _push(self, task_id, status, starts_at, deadline, start_reminded, end_reminded, now):
+        version = self._versions[task_id] = self._versions.get(task_id, 0) + 1
+        if status in ACTIVE_STATUSES and deadline is not None:
+            for when, kind in self.events(starts_at, deadline, start_reminded, end_reminded, now):
+                heapq.heappush(self._heap, (when, next(self._seq), kind, task_id, version))
+
+    def _wake(self):
+        waker = self._waker
+        if waker is not None:
+            waker()
+
+
+deadline_queue = DeadlineQueue(timedelta(minutes=settings.TASK_REMINDER_MINUTES))
@@ -0,0 +1,176 @@
+"""Уменьшенные копии фото: превью и версия для веба.
+
+Копии лежат рядом с оригиналом (<имя>.thumb.jpg, <имя>.medium.jpg) и создаются Pillow в
+пуле процессов, чтобы сжатие не занимало цикл событий бота и GIL. После загрузки фото бот
+ставит их создание в фон. Список фото в админке показывает только готовые превью и ставит
+недостающие в тот же пул, на месте копия создаётся лишь на странице одного фото. Команда
+generate_derivatives досоздаёт копии для уже загруженных файлов.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Название копии -> максимальная сторона в пикселях
+SIZES = {
+    'thumb': 200,
+    'medium': 1024,
+}
+JPEG_QUALITY = 82
+
+_process_pool = None
+_background_tasks = set()
+# Файлы, копии которых создаются сейчас или не создались: повторно в пул не ставятся,
+# поэтому каждая загрузка списка в админке не повторяет неудачную попытку
+_pending = set()
+_failed = set()
+# Админка ставит копии из нескольких потоков
+_lock = threading.Lock()
+
+
+def derivative_name(name, size):
+    """Путь копии относительно MEDIA_ROOT для оригинала name"""
+    return f"{os.path.splitext(name)[0]}.{size}.jpg"
+
+
+def render_derivatives(full_path, sizes=None, force=False):
+    """Создаёт копии файла full_path и возвращает список созданных путей.
+
+    Выполняется в дочернем процессе, поэтому не обращается к Django.
+    """
+    sizes = sizes or SIZES
+    created = []
+    targets = {
+        size: f"{os.path.splitext(full_path)[0]}.{size}.jpg"
+        for size in sizes
+    }
+    targets = {size: path for size, path in targets.items() if force or not os.path.exists(path)}
+    if not targets:
+        return created
+
+    with Image.open(full_path) as original:
+        # Ориентация из EXIF: иначе фото с телефона окажутся повёрнутыми
+        image = ImageOps.exif_transpose(original).convert('RGB')
+    # От большей копии к меньшей: каждая следующая уменьшается из предыдущей
+    for size, path in sorted(targets.items(), key=lambda item: -sizes[item[0]]):
+        image.thumbnail((sizes[size], sizes[size]), Image.Resampling.LANCZOS)
+        tmp_path = f"{path}.tmp"
+        image.save(tmp_path, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+        os.replace(tmp_path, path)
+        created.append(path)
+    return created
+
+
+def get_process_pool():
+    global _process_pool
+    if _process_pool is None:
+        # spawn, а не fork: бот многопоточный (пул БД, asyncio), fork такого процесса небезопасен
+        _process_pool = ProcessPoolExecutor(
+            max_workers=settings.DERIVATIVE_WORKERS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return _process_pool
+
+
+def shutdown_process_pool():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=True, cancel_futures=True)
+        _process_pool = None
+
+
+async def generate_derivatives(name, force=False):
+    """Создаёт копии файла name (путь относительно MEDIA_ROOT) в пуле процессов"""
+    full_path = os.path.join(settings.MEDIA_ROOT, name)
+    loop = asyncio.get_running_loop()
+    created = await loop.run_in_executor(get_process_pool(), render_derivatives, full_path, SIZES, force)
+    if created:
+        logger.info("Derivatives generated for %s: %s files", name, len(created))
+    return created
+
+
+def _claim(name):
+    """Отмечает, что копии name начали создаваться; False — уже создаются или не создались"""
+    with _lock:
+        if name in _pending or name in _failed:
+            return False
+        _pending.add(name)
+        return True
+
+
+def _finish(name, error=None):
+    with _lock:
+        _pending.discard(name)
+        if error is not None:
+            _failed.add(name)
+    if error is not None:
+        logger.error("Failed to generate derivatives for %s: %s", name, error)
+
+
+def schedule_derivatives(name):
+    """Запускает создание копий в фоне, не задерживая ответ пользователю.
+
+    В цикле событий бота — задачей asyncio, в админке (без цикла событий) — сразу в пуле
+    процессов. Возвращает задачу или future; None, если копии уже создаются, не создались
+    раньше или оригинала нет на диске.
+    """
+    if not os.path.exists(os.path.join(settings.MEDIA_ROOT, name)):
+        with _lock:
+            _failed.add(name)
+        return None
+    if not _claim(name):
+        return None
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        future = get_process_pool().submit(render_derivatives, os.path.join(settings.MEDIA_ROOT, name), SIZES)
+        future.add_done_callback(lambda done: _finish(name, None if done.cancelled() else done.exception()))
+        return future
+
+    async def run():
+        try:
+            await generate_derivatives(name)
+        except Exception as e:
+            _finish(name, e)
+        else:
+            _finish(name)
+
+    task = asyncio.create_task(run())
+    # Ссылка на задачу нужна, иначе сборщик мусора может удалить её до завершения
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+def derivative_url(field_file, size='thumb', render=True):
+    """URL копии для файла из ImageField или None, если копии нет.
+
+    render=True — отсутствующая копия создаётся на месте (страница одного фото), иначе
+    ставится в пул процессов и показывается при следующей загрузке (список фото). Файл,
+    копию которого создать не удалось, повторно не обрабатывается.
+    """
+    if not field_file:
+        return None
+    name = derivative_name(field_file.name, size)
+    if os.path.exists(os.path.join(settings.MEDIA_ROOT, name)):
+        return field_file.storage.url(name)
+    if not render:
+        schedule_derivatives(field_file.name)
+        return None
+    with _lock:
+        if field_file.name in _failed:
+            return None
+    try:
+        render_derivatives(os.path.join(settings.MEDIA_ROOT, field_file.name), {size: SIZES[size]})
+    except (OSError, ValueError) as e:
+        _finish(field_file.name, e)
+        return None
+    return field_file.storage.url(name)
@@ -0,0 +1,119 @@
+"""Поиск ближайших проектов по координатам.
+
+Проекты с координатами раскладываются по ячейкам двух сеток: мелкой (~0,5 км) и крупной
+(~5 км). Ближайшие к точке ищутся по кольцам ячеек вокруг неё: расстояние (haversine)
+считается только для проектов из просмотренных ячеек, а поиск останавливается, как только
+найдено limit проектов ближе любой ещё не просмотренной ячейки. В плотном центре города
+хватает нескольких колец мелкой сетки, за городом поиск продолжается по крупной, поэтому
+время зависит от плотности проектов рядом с точкой, а не от размера каталога.
+"""
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Стороны ячеек сеток в градусах, от мелкой к крупной. В Алматы 0,005° — это ~0,55 км по
+# широте и ~0,4 км по долготе
+LEVELS = (0.005, 0.05)
+
+# Сколько колец мелкой сетки просматривать, прежде чем перейти к крупной
+FINE_RINGS = 8
+
+# Дальше этого проекты «рядом» не ищутся
+MAX_DISTANCE_KM = 50
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def cell_of(latitude, longitude, degrees):
+    return math.floor(latitude / degrees), math.floor(longitude / degrees)
+
+
+def ring(cell, radius):
+    """Ячейки на границе квадрата (2 * radius + 1) × (2 * radius + 1) с центром в cell"""
+    row, col = cell
+    if radius == 0:
+        yield cell
+        return
+    for d in range(-radius, radius + 1):
+        yield row - radius, col + d
+        yield row + radius, col + d
+    for d in range(-radius + 1, radius):
+        yield row + d, col - radius
+        yield row + d, col + radius
+
+
+def cell_width_km(latitude, degrees):
+    """Наименьшая сторона ячейки около latitude: ячейки по долготе сужаются к полюсам"""
+    lat_km = math.radians(degrees) * EARTH_RADIUS_KM
+    return lat_km * max(math.cos(math.radians(min(abs(latitude) + degrees, 90))), 0.01)
+
+
+def bounding_box(latitude, longitude, distance_km):
+    """(min_lat, max_lat, min_lon, max_lon) квадрата, в который попадает круг радиуса distance_km"""
+    dlat = math.degrees(distance_km / EARTH_RADIUS_KM)
+    dlon = math.degrees(distance_km / (EARTH_RADIUS_KM * max(math.cos(math.radians(latitude)), 0.01)))
+    return latitude - dlat, latitude + dlat, longitude - dlon, longitude + dlon
+
+
+class GridIndex:
+    """Сетки id проектов по ячейкам. Не потокобезопасна: блокировку держит владелец (ProjectCatalog)"""
+
+    def __init__(self, levels=LEVELS):
+        self.levels = levels
+        # Для каждой сетки: ячейка -> {id: (широта, долгота)}
+        self._cells = [{} for _ in levels]
+
+    def __len__(self):
+        return sum(len(points) for points in self._cells[0].values())
+
+    def add(self, item_id, latitude, longitude):
+        for degrees, cells in zip(self.levels, self._cells):
+            cells.setdefault(cell_of(latitude, longitude, degrees), {})[item_id] = (latitude, longitude)
+
+    def remove(self, item_id, latitude, longitude):
+        for degrees, cells in zip(self.levels, self._cells):
+            cell = cell_of(latitude, longitude, degrees)
+            points = cells.get(cell)
+            if points is not None:
+                points.pop(item_id, None)
+                if not points:
+                    del cells[cell]
+
+    def nearest(self, latitude, longitude, limit, skip=frozenset(), max_distance_km=MAX_DISTANCE_KM):
+        """До limit пар (расстояние в км, id) от ближайшей, кроме id из skip"""
+        for level in range(len(self.levels)):
+            coarsest = level == len(self.levels) - 1
+            found = self._search(level, latitude, longitude, limit, skip, max_distance_km, None if coarsest else FINE_RINGS)
+            if found is not None:
+                return found
+
+    def _search(self, level, latitude, longitude, limit, skip, max_distance_km, max_rings):
+        """Поиск по одной сетке; None — за max_rings колец не удалось найти limit проектов"""
+        degrees, cells = self.levels[level], self._cells[level]
+        center = cell_of(latitude, longitude, degrees)
+        width = cell_width_km(latitude, degrees)
+        max_radius = math.ceil(max_distance_km / width) + 1
+        found = []
+        for radius in range(max_radius + 1):
+            for cell in ring(center, radius):
+                for item_id, (lat, lon) in cells.get(cell, {}).items():
+                    if item_id not in skip:
+                        distance = haversine_km(latitude, longitude, lat, lon)
+                        if distance <= max_distance_km:
+                            found.append((distance, item_id))
+            # Всё, что вне просмотренного квадрата, дальше radius ширин ячейки от точки
+            bound = radius * width
+            if len(found) >= limit:
+                found.sort()
+                if found[limit - 1][0] <= bound:
+                    break
+            if bound >= max_distance_km:
+                break
+            if max_rings is not None and radius >= max_rings:
+                return None
+        found.sort()
+        return found[:limit]
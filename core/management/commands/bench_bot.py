@@ -0,0 +1,413 @@
+import asyncio
+import itertools
+import json
+import os
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from collections import Counter
+from datetime import date, time as dtime, timedelta
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_databases, teardown_databases
+from telegram import Update
+from telegram.request import BaseRequest
+
+from core import repository
+from core.models import User, Project, Tag, VolunteerProject, Task, Photo
+
+# Токен-заглушка: запросы к Bot API всё равно не выходят за пределы процесса
+BENCH_TOKEN = '123456:BENCH'
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+
+
+class StubRequest(BaseRequest):
+    """Bot API без сети: отвечает на каждый метод правдоподобным результатом и считает вызовы.
+
+    latency — задержка ответа в секундах, имитирует сетевую задержку до api.telegram.org.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        # chat_id -> callback_data кнопок последнего сообщения бота в этом чате
+        self.buttons = {}
+        self._message_ids = itertools.count(1)
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit('/', 1)[-1]
+        self.calls[api_method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        parameters = request_data.parameters if request_data else {}
+        keyboard = parameters.get('reply_markup')
+        if isinstance(keyboard, dict) and 'inline_keyboard' in keyboard:
+            self.buttons[int(parameters['chat_id'])] = [
+                button['callback_data'] for row in keyboard['inline_keyboard'] for button in row if 'callback_data' in button
+            ]
+        return 200, json.dumps({'ok': True, 'result': self.result(api_method, parameters)}).encode('utf-8')
+
+    def result(self, api_method, parameters):
+        if api_method == 'getMe':
+            return BOT_USER
+        if not api_method.startswith(('send', 'edit')):
+            return True
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': int(parameters.get('chat_id') or 0), 'type': 'private'},
+            'from': BOT_USER,
+        }
+        if api_method == 'sendPhoto':
+            # media_registry запоминает file_id из ответа
+            message['photo'] = [{'file_id': 'bench-photo', 'file_unique_id': 'bench-photo', 'width': 200, 'height': 200}]
+            message['caption'] = parameters.get('caption', '')
+        else:
+            message['text'] = parameters.get('text') or parameters.get('caption') or ''
+        return message
+
+
+class UpdateFactory:
+    """Синтетические обновления от пользователя telegram_id в его личном чате с ботом"""
+
+    def __init__(self, bot, request):
+        self.bot = bot
+        self.request = request
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    @staticmethod
+    def _user(telegram_id):
+        return {'id': telegram_id, 'is_bot': False, 'first_name': f'User {telegram_id}'}
+
+    def _message(self, telegram_id, sender, **fields):
+        return {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': telegram_id, 'type': 'private'},
+            'from': sender,
+            **fields,
+        }
+
+    def _update(self, **fields):
+        return Update.de_json({'update_id': next(self._update_ids), **fields}, self.bot)
+
+    def text(self, telegram_id, text):
+        fields = {'text': text}
+        if text.startswith('/'):
+            fields['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return self._update(message=self._message(telegram_id, self._user(telegram_id), **fields))
+
+    def contact(self, telegram_id, phone_number):
+        contact = {'phone_number': phone_number, 'first_name': f'User {telegram_id}', 'user_id': telegram_id}
+        return self._update(message=self._message(telegram_id, self._user(telegram_id), contact=contact))
+
+    def callback(self, telegram_id, data):
+        return self._update(callback_query={
+            'id': str(next(self._update_ids)),
+            'from': self._user(telegram_id),
+            'chat_instance': str(telegram_id),
+            'data': data,
+            # Кнопка нажата под сообщением бота
+            'message': self._message(telegram_id, BOT_USER, text='...'),
+        })
+
+    def button(self, telegram_id, prefix):
+        """Нажатие кнопки с callback_data, начинающимся с prefix, из последнего ответа бота"""
+        for data in self.request.buttons.get(telegram_id, []):
+            if data.startswith(prefix):
+                return self.callback(telegram_id, data)
+        return None
+
+
+# Сценарии: обновления одного сеанса пользователя. Обновления сеанса отправляются по одному,
+# каждое после обработки предыдущего — как живой пользователь, ждущий ответа. Сценарий может
+# быть генератором и нажимать кнопки из ответа бота на предыдущее обновление
+
+def registration(updates, users, worker, iteration):
+    telegram_id = next(users.new_ids)
+    return [
+        updates.text(telegram_id, '/start'),
+        updates.text(telegram_id, f'Волонтёр {telegram_id}'),
+        updates.contact(telegram_id, f'+7700{telegram_id % 10 ** 7:07d}'),
+        updates.callback(telegram_id, 'role_volunteer'),
+    ]
+
+
+def browse(updates, users, worker, iteration):
+    telegram_id = users.volunteers[worker]
+    yield updates.callback(telegram_id, 'list_projects')
+    for prefix in ('next_', 'next_', 'prev_'):
+        update = updates.button(telegram_id, prefix)
+        if update is None:
+            return
+        yield update
+
+
+def search(updates, users, worker, iteration):
+    telegram_id = users.volunteers[worker]
+    yield updates.text(telegram_id, '/search уборка алм')
+    update = updates.button(telegram_id, 'search_page_')
+    if update is not None:
+        yield update
+
+
+def join(updates, users, worker, iteration):
+    # Каждый сеанс — новый волонтёр без проектов: иначе упрёмся в MAX_PROJECTS_PER_VOLUNTEER
+    telegram_id = users.newcomers[worker][iteration]
+    yield updates.callback(telegram_id, 'join_project')
+    update = updates.button(telegram_id, 'join_next_')
+    if update is not None:
+        yield update
+    update = updates.button(telegram_id, 'join_id_')
+    if update is not None:
+        yield update
+
+
+def moderation(updates, users, worker, iteration):
+    telegram_id = users.organizers[worker]
+    return [
+        updates.callback(telegram_id, 'check_photos'),
+        updates.callback(telegram_id, 'mod_photo_action_0_approve'),
+        updates.callback(telegram_id, 'rating_5'),
+        updates.callback(telegram_id, 'cancel_moderate'),
+    ]
+
+
+def send_task(updates, users, worker, iteration):
+    telegram_id = users.organizers[worker]
+    year = date.today().year + 1
+    return [
+        updates.callback(telegram_id, 'send_task'),
+        updates.callback(telegram_id, 'task_project_0'),
+        updates.callback(telegram_id, 'task_recipients_all'),
+        updates.text(telegram_id, 'Собрать мусор в парке'),
+        updates.callback(telegram_id, f'deadline_date_year_{year}'),
+        updates.callback(telegram_id, 'deadline_date_month_6'),
+        updates.callback(telegram_id, 'deadline_date_day_15'),
+        updates.callback(telegram_id, 'deadline_start_time_9'),
+        updates.callback(telegram_id, 'deadline_end_time_18'),
+        updates.callback(telegram_id, 'task_photo_no'),
+        updates.callback(telegram_id, 'task_confirm_send'),
+    ]
+
+
+# send_task последним: рассылки заданий продолжаются в фоне и нагружали бы следующие сценарии
+SCENARIOS = {
+    'registration': registration,
+    'browse': browse,
+    'search': search,
+    'join': join,
+    'moderation': moderation,
+    'send_task': send_task,
+}
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест бота целиком: собирает тот же Application, что и bot.py, подаёт ему "
+        "синтетические обновления и отвечает на запросы к Bot API заглушкой. Для каждого сценария "
+        "выводит пропускную способность и задержку обработки обновления (p50/p95/p99). "
+        "Работает на отдельной временной базе с тестовыми данными."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenario', action='append', choices=list(SCENARIOS), dest='scenarios',
+            help="Сценарий (можно указать несколько раз), по умолчанию все"
+        )
+        parser.add_argument('--concurrency', type=int, default=20, help="Одновременных пользователей")
+        parser.add_argument('--iterations', type=int, default=10, help="Сеансов сценария на пользователя")
+        parser.add_argument('--projects', type=int, default=100, help="Одобренных проектов в каталоге")
+        parser.add_argument('--volunteers', type=int, default=500, help="Волонтёров в проектах")
+        parser.add_argument('--api-latency', type=float, default=0.0, help="Задержка ответа Bot API, мс")
+        parser.add_argument('--log-level', default='WARNING', help="Уровень логов бота во время теста")
+        parser.add_argument('--json', dest='json_path', help="Сохранить результаты в JSON")
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['iterations'] < 1:
+            raise CommandError("--concurrency and --iterations must be positive")
+        scenarios = options['scenarios'] or list(SCENARIOS)
+
+        # Логирование настраивает bot.py при импорте: без файла, чтобы тест не засорял bot.log
+        os.environ['LOG_LEVEL'] = options['log_level']
+        os.environ['LOG_FILE'] = ''
+        settings.TELEGRAM_BOT_TOKEN = BENCH_TOKEN
+
+        # Файловая база, а не in-memory: иначе потоки пула делят одно соединение с общим кэшем
+        test_db = os.path.join(tempfile.mkdtemp(), 'bench_bot.sqlite3')
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = test_db
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            users = self.seed(options)
+            results, api_calls = asyncio.run(self.run(scenarios, users, options))
+        finally:
+            repository.shutdown_db_executor()
+            teardown_databases(old_config, verbosity=0)
+
+        self.stdout.write(
+            f"{'scenario':<14} {'updates':>8} {'errors':>7} {'upd/s':>10} "
+            f"{'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'max ms':>10}"
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<14} {result['updates']:>8} {result['errors']:>7} {result['updates_per_second']:>10.1f} "
+                f"{result['p50_ms']:>10.2f} {result['p95_ms']:>10.2f} {result['p99_ms']:>10.2f} {result['max_ms']:>10.2f}"
+            )
+        self.stdout.write("Bot API calls: " + ", ".join(f"{method}={count}" for method, count in api_calls.most_common()))
+
+        if options['json_path']:
+            report = {
+                'revision': git_revision(),
+                'options': {
+                    key: options[key]
+                    for key in ('concurrency', 'iterations', 'projects', 'volunteers', 'api_latency', 'log_level')
+                },
+                'results': results,
+                'api_calls': dict(api_calls),
+            }
+            with open(options['json_path'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+
+    def seed(self, options):
+        rnd = random.Random(42)
+        concurrency, iterations = options['concurrency'], options['iterations']
+        projects_count = max(options['projects'], concurrency)
+
+        organizers = User.objects.bulk_create([
+            User(username=f"org{i}", telegram_id=str(900000000 + i), is_organizer=True)
+            for i in range(concurrency)
+        ])
+        volunteers = User.objects.bulk_create([
+            User(username=f"vol{i}", telegram_id=str(100000000 + i))
+            for i in range(max(options['volunteers'], concurrency))
+        ])
+        newcomers = User.objects.bulk_create([
+            User(username=f"new{i}", telegram_id=str(200000000 + i))
+            for i in range(concurrency * iterations)
+        ])
+        # Первый проект каждого организатора получает своих волонтёров для рассылки задания
+        projects = Project.objects.bulk_create([
+            Project(
+                title=f"Проект {i}", description="Уборка территории", city=rnd.choice(['Алматы', 'Астана']),
+                creator=organizers[i % concurrency], status='approved'
+            )
+            for i in range(projects_count)
+        ])
+        tags = Tag.objects.for_names(['экология', 'уборка', 'парк'])
+        for project in projects:
+            project.tags.add(rnd.choice(tags))
+        VolunteerProject.objects.bulk_create([
+            VolunteerProject(volunteer=volunteer, project=projects[i % projects_count])
+            for i, volunteer in enumerate(volunteers)
+        ], batch_size=500)
+        tasks = [
+            Task(
+                project=projects[i], creator=organizers[i], text="Собрать мусор",
+                deadline_date=date.today() + timedelta(days=1), start_time=dtime(9), end_time=dtime(18)
+            )
+            for i in range(concurrency)
+        ]
+        for task in tasks:
+            task.update_deadline()
+        tasks = Task.objects.bulk_create(tasks)
+        # На каждый сеанс модерации по фото, и ещё одно, чтобы после оценки было что показать
+        Photo.objects.bulk_create([
+            Photo(
+                volunteer=volunteers[i % len(volunteers)], project=task.project, task=task,
+                image=f"photos/bench/{task.id}_{i}.jpg", file_id=f"bench-{task.id}-{i}", status='pending'
+            )
+            for task in tasks for i in range(iterations + 1)
+        ], batch_size=500)
+
+        return SimpleNamespace(
+            organizers=[int(user.telegram_id) for user in organizers],
+            volunteers=[int(user.telegram_id) for user in volunteers],
+            newcomers=[
+                [int(user.telegram_id) for user in newcomers[i * iterations:(i + 1) * iterations]]
+                for i in range(concurrency)
+            ],
+            new_ids=itertools.count(300000000),
+        )
+
+    async def run(self, scenarios, users, options):
+        # Импорт здесь: bot.py при импорте настраивает логирование и читает токен
+        from bot import build_application
+
+        request = StubRequest(options['api_latency'] / 1000)
+        application = build_application(webhook=True, request=request)
+        errors = Counter()
+
+        async def count_error(update, context):
+            errors['total'] += 1
+
+        application.add_error_handler(count_error)
+        updates = UpdateFactory(application.bot, request)
+
+        results = {}
+        # post_init (метрики, возобновление рассылок) не вызывается: он не участвует в обработке
+        await application.initialize()
+        await application.start()
+        try:
+            for name in scenarios:
+                errors_before = errors['total']
+                results[name] = await self.run_scenario(
+                    application, updates, users, SCENARIOS[name], options['concurrency'], options['iterations']
+                )
+                results[name]['errors'] = errors['total'] - errors_before
+        finally:
+            await application.stop()
+            await application.shutdown()
+        return results, request.calls
+
+    async def run_scenario(self, application, updates, users, scenario, concurrency, iterations):
+        processor = application.update_processor
+        latencies = []
+
+        async def user_session(worker):
+            for iteration in range(iterations):
+                for update in scenario(updates, users, worker, iteration):
+                    started = time.perf_counter()
+                    # Так же, как Application обрабатывает обновление из очереди
+                    await processor.process_update(update, application.process_update(update))
+                    latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user_session(worker) for worker in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+        quantiles = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+        return {
+            'updates': len(latencies),
+            'seconds': elapsed,
+            'updates_per_second': len(latencies) / elapsed,
+            'p50_ms': quantiles[49] * 1000,
+            'p95_ms': quantiles[94] * 1000,
+            'p99_ms': quantiles[98] * 1000,
+            'max_ms': max(latencies) * 1000,
+        }
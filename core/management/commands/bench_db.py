@@ -0,0 +1,178 @@
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_databases, teardown_databases
+
+from core import repository
+from core.models import User, Project, Tag, VolunteerProject, Task, Photo
+
+
+# Прежние обработчики: каждый вызов через sync_to_async(thread_sensitive=True),
+# то есть все запросы всех пользователей выполняются в одном потоке
+
+@sync_to_async
+def legacy_get_user(telegram_id):
+    try:
+        return User.objects.get(telegram_id=telegram_id)
+    except User.DoesNotExist:
+        return None
+
+
+@sync_to_async
+def legacy_get_approved_projects(volunteer):
+    projects = Project.objects.filter(status='approved')
+    joined_project_ids = VolunteerProject.objects.filter(volunteer=volunteer).values_list('project__id', flat=True)
+    projects = projects.exclude(id__in=joined_project_ids)
+    return [(project, project.title, project.city, [tag.name for tag in project.tags.all()]) for project in projects]
+
+
+@sync_to_async
+def legacy_get_volunteer_projects(volunteer):
+    return [(vp, vp.project.title) for vp in VolunteerProject.objects.filter(volunteer=volunteer).select_related('project')]
+
+
+@sync_to_async
+def legacy_get_pending_photos_for_organizer(organizer, page, per_page):
+    photos = Photo.objects.filter(project__creator=organizer, status='pending').select_related('volunteer', 'project', 'task')
+    total = photos.count()
+    photos = photos[page * per_page:(page + 1) * per_page]
+    return [(photo, photo.volunteer.username, photo.project.title, photo.task) for photo in photos], total
+
+
+IMPLEMENTATIONS = {
+    'legacy': {
+        'get_user': legacy_get_user,
+        'get_approved_projects': legacy_get_approved_projects,
+        'get_volunteer_projects': legacy_get_volunteer_projects,
+        'get_pending_photos_for_organizer': legacy_get_pending_photos_for_organizer,
+    },
+    'repository': {
+        'get_user': repository.get_user,
+        'get_approved_projects': repository.get_approved_projects,
+        'get_volunteer_projects': repository.get_volunteer_projects,
+        'get_pending_photos_for_organizer': repository.get_pending_photos_for_organizer,
+    },
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает пропускную способность доступа к БД из бота: прежние обёртки sync_to_async "
+        "и core.repository. Работает на отдельной временной базе с тестовыми данными."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help="Количество одновременных пользователей")
+        parser.add_argument('--iterations', type=int, default=10, help="Сценариев на пользователя")
+        parser.add_argument('--projects', type=int, default=100, help="Одобренных проектов в каталоге")
+        parser.add_argument('--json', dest='json_path', help="Сохранить результаты в JSON")
+
+    def handle(self, *args, **options):
+        # Файловая база, а не in-memory: иначе потоки пула делят одно соединение с общим кэшем
+        test_db = os.path.join(tempfile.mkdtemp(), 'bench_db.sqlite3')
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = test_db
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            volunteers, organizers = self.seed(options['users'], options['projects'])
+            results = {}
+            for name in IMPLEMENTATIONS:
+                results[name] = asyncio.run(self.run(name, volunteers, organizers, options['iterations']))
+        finally:
+            repository.shutdown_db_executor()
+            teardown_databases(old_config, verbosity=0)
+
+        self.stdout.write(f"{'implementation':<12} {'ops/s':>10} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<12} {result['ops_per_second']:>10.1f} {result['p50_ms']:>10.2f} "
+                f"{result['p95_ms']:>10.2f} {result['p99_ms']:>10.2f}"
+            )
+        speedup = results['repository']['ops_per_second'] / results['legacy']['ops_per_second']
+        self.stdout.write(f"speedup: x{speedup:.2f}")
+
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as f:
+                json.dump({'options': {k: options[k] for k in ('users', 'iterations', 'projects')}, 'results': results}, f, indent=2)
+
+    def seed(self, users, projects):
+        rnd = random.Random(42)
+        organizers_count = max(1, users // 5)
+        volunteers_count = users - organizers_count
+        organizers = User.objects.bulk_create([
+            User(username=f"org{i}", telegram_id=f"9{i:08d}", is_organizer=True)
+            for i in range(organizers_count)
+        ])
+        volunteers = User.objects.bulk_create([
+            User(username=f"vol{i}", telegram_id=f"1{i:08d}")
+            for i in range(volunteers_count)
+        ])
+        project_objs = Project.objects.bulk_create([
+            Project(
+                title=f"Проект {i}", description="Уборка территории", city=rnd.choice(['Алматы', 'Астана']),
+                creator=organizers[i % organizers_count], status='approved'
+            )
+            for i in range(projects)
+        ])
+        tags = Tag.objects.for_names(['экология', 'уборка', 'парк'])
+        for project in project_objs:
+            project.tags.add(rnd.choice(tags))
+        VolunteerProject.objects.bulk_create([
+            VolunteerProject(volunteer=volunteer, project=project_objs[i % projects])
+            for i, volunteer in enumerate(volunteers)
+        ])
+        tasks = Task.objects.bulk_create([
+            Task(project=project, creator=project.creator, text="Собрать мусор")
+            for project in project_objs
+        ])
+        Photo.objects.bulk_create([
+            Photo(volunteer=volunteer, project=tasks[i % projects].project, task=tasks[i % projects],
+                  image=f"photos/bench/{i}.jpg")
+            for i, volunteer in enumerate(volunteers * 5)
+        ])
+        return volunteers, organizers
+
+    async def run(self, name, volunteers, organizers, iterations):
+        impl = IMPLEMENTATIONS[name]
+        latencies = []
+
+        async def timed(coro):
+            started = time.perf_counter()
+            result = await coro
+            latencies.append(time.perf_counter() - started)
+            return result
+
+        async def volunteer_session(telegram_id):
+            for _ in range(iterations):
+                user = await timed(impl['get_user'](telegram_id))
+                await timed(impl['get_approved_projects'](user))
+                await timed(impl['get_volunteer_projects'](user))
+
+        async def organizer_session(telegram_id):
+            for _ in range(iterations):
+                user = await timed(impl['get_user'](telegram_id))
+                await timed(impl['get_pending_photos_for_organizer'](user, 0, 5))
+
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(volunteer_session(v.telegram_id) for v in volunteers),
+            *(organizer_session(o.telegram_id) for o in organizers),
+        )
+        elapsed = time.perf_counter() - started
+
+        quantiles = statistics.quantiles(latencies, n=100)
+        return {
+            'operations': len(latencies),
+            'seconds': elapsed,
+            'ops_per_second': len(latencies) / elapsed,
+            'p50_ms': quantiles[49] * 1000,
+            'p95_ms': quantiles[94] * 1000,
+            'p99_ms': quantiles[98] * 1000,
+        }
@@ -0,0 +1,51 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.derivatives import SIZES, render_derivatives
+from core.models import Photo, Task
+
+
+class Command(BaseCommand):
+    help = (
+        "Создаёт превью и веб-версии для уже загруженных фотоотчётов и изображений заданий. "
+        "Существующие копии пропускаются, если не указан --force."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Количество процессов")
+        parser.add_argument('--force', action='store_true', help="Пересоздать существующие копии")
+
+    def handle(self, *args, **options):
+        names = set(Photo.objects.exclude(image='').values_list('image', flat=True))
+        names |= set(Task.objects.exclude(task_image='').exclude(task_image=None).values_list('task_image', flat=True))
+
+        paths = {}
+        missing = 0
+        for name in sorted(names):
+            full_path = os.path.join(settings.MEDIA_ROOT, name)
+            if os.path.exists(full_path):
+                paths[full_path] = name
+            else:
+                missing += 1
+        self.stdout.write(f"Files: {len(paths)}, missing on disk: {missing}")
+
+        created = failed = 0
+        with ProcessPoolExecutor(options['workers'], mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = {
+                pool.submit(render_derivatives, full_path, SIZES, options['force']): name
+                for full_path, name in paths.items()
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                try:
+                    created += len(future.result())
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"{futures[future]}: {e}")
+                if done % 100 == 0:
+                    self.stdout.write(f"Processed {done}/{len(futures)}")
+
+        self.stdout.write(self.style.SUCCESS(f"Derivatives created: {created}, failed files: {failed}"))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from core.models import RatingEvent, User, clamp_rating, rating_points
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает рейтинги всех пользователей по журналу RatingEvent: баллы за оценки "
+        "считаются по текущей формуле core.models.rating_points, рейтинг — их сумма в пределах 0..100. "
+        "Два UPDATE на всю таблицу, без чтения пользователей в Python."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Показать, сколько рейтингов изменится, без записи")
+
+    def handle(self, *args, **options):
+        totals = (
+            RatingEvent.objects.filter(user=OuterRef('pk')).order_by().values('user')
+            .annotate(total=Sum('points')).values('total')
+        )
+        new_rating = clamp_rating(Coalesce(Subquery(totals), Value(0)))
+
+        with transaction.atomic():
+            # Баллы за звёзды по новой формуле; ручные изменения и initial остаются как есть
+            rescored = RatingEvent.objects.filter(stars__isnull=False).exclude(
+                points=rating_points(F('stars'))
+            ).update(points=rating_points(F('stars')))
+            changed = User.objects.alias(new_rating=new_rating).exclude(rating=F('new_rating'))
+            if options['dry_run']:
+                updated = changed.count()
+                transaction.set_rollback(True)
+            else:
+                updated = changed.update(rating=new_rating)
+
+        if options['dry_run']:
+            self.stdout.write(f"Events to rescore: {rescored}, ratings to change: {updated}")
+            return
+        # Запущенный бот увидит новые рейтинги, когда пользователи истекут в его кэше (USER_CACHE_TTL)
+        self.stdout.write(self.style.SUCCESS(f"Events rescored: {rescored}, ratings changed: {updated}"))
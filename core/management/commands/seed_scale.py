@@ -0,0 +1,307 @@
+import os
+import random
+import time
+from datetime import date, time as dtime, timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from core.models import User, Project, ProjectTag, Tag, VolunteerProject, Task, TaskAssignment, Photo, RatingEvent
+
+# Города с весами: большинство проектов в Алматы и Астане
+CITIES = {
+    'Алматы': 40, 'Астана': 25, 'Шымкент': 10, 'Караганда': 7, 'Актобе': 5,
+    'Тараз': 4, 'Павлодар': 4, 'Усть-Каменогорск': 3, 'Семей': 2,
+}
+# Центры городов для координат проектов (разброс ±0,1°)
+CITY_CENTERS = {
+    'Алматы': (43.238, 76.946), 'Астана': (51.128, 71.430), 'Шымкент': (42.341, 69.590),
+    'Караганда': (49.807, 73.088), 'Актобе': (50.283, 57.167), 'Тараз': (42.901, 71.378),
+    'Павлодар': (52.287, 76.967), 'Усть-Каменогорск': (49.949, 82.628), 'Семей': (50.411, 80.227),
+}
+TAGS = [
+    'экология', 'уборка', 'парк', 'река', 'горы', 'субботник', 'посадка деревьев',
+    'переработка', 'пластик', 'дети', 'животные', 'двор',
+]
+PROJECT_TITLES = [
+    'Уборка парка', 'Очистка берега реки', 'Субботник во дворе', 'Посадка деревьев',
+    'Сбор пластика', 'Уборка в горах', 'Раздельный сбор', 'Чистый пляж',
+]
+TASK_TEXTS = [
+    'Собрать мусор на выделенном участке', 'Рассортировать собранный пластик',
+    'Покрасить скамейки', 'Высадить саженцы', 'Вынести мешки к точке сбора',
+]
+# Распределения статусов: значение -> вес
+PROJECT_STATUSES = {'approved': 80, 'pending': 15, 'rejected': 5}
+TASK_STATUSES = {'open': 40, 'in_progress': 20, 'completed': 40}
+PHOTO_STATUSES = {'approved': 70, 'pending': 20, 'rejected': 10}
+# Фиктивные telegram_id выше диапазона реальных пользователей
+TELEGRAM_ID_BASE = 9_000_000_000_000
+
+
+def weighted(rnd, choices):
+    return rnd.choices(list(choices), weights=list(choices.values()))[0]
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет базу синтетическими данными для нагрузочных тестов и проверки планов запросов: "
+        "волонтёры, организаторы, персонал, проекты с тегами по городам, участие в проектах, задания "
+        "со сроками, назначения и фотоотчёты с небольшими файлами изображений. Данные вставляются "
+        "пачками через bulk_create; при одинаковом --seed результат повторяется."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000, help="Волонтёров")
+        parser.add_argument('--organizers', type=int, default=200, help="Организаторов")
+        parser.add_argument('--staff', type=int, default=5, help="Сотрудников (is_staff)")
+        parser.add_argument('--projects', type=int, default=2000, help="Проектов")
+        parser.add_argument('--memberships', type=int, default=2, help="Проектов на волонтёра (в среднем)")
+        parser.add_argument('--tasks', type=int, default=5, help="Заданий на проект")
+        parser.add_argument('--assignments', type=int, default=10, help="Назначений на задание (не больше участников)")
+        parser.add_argument('--photos', type=int, default=50000, help="Фотоотчётов")
+        parser.add_argument('--image-files', type=int, default=50, help="Разных файлов изображений для фотоотчётов")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Строк в одном bulk_create")
+        parser.add_argument('--seed', type=int, default=42, help="Начальное значение генератора")
+        parser.add_argument('--prefix', default='seed', help="Префикс имён пользователей сгенерированных данных")
+        parser.add_argument('--clear', action='store_true', help="Удалить ранее сгенерированные с этим префиксом данные")
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.rnd = random.Random(options['seed'])
+        self.prefix = options['prefix']
+        if options['users'] < 1 or options['organizers'] < 1 or options['projects'] < 1:
+            raise CommandError("--users, --organizers and --projects must be positive")
+
+        seeded = User.objects.filter(username__startswith=f"{self.prefix}_")
+        if options['clear']:
+            self.clear(seeded)
+        elif seeded.exists():
+            raise CommandError(f"Data with prefix '{self.prefix}' already exists, use --clear or another --prefix")
+
+        started = time.perf_counter()
+        volunteer_ids, organizer_ids = self.create_users(options)
+        project_ids = self.create_projects(organizer_ids, options['projects'])
+        members = self.create_memberships(volunteer_ids, project_ids, options['memberships'])
+        tasks = self.create_tasks(project_ids, options['tasks'])
+        self.create_assignments(tasks, members, options['assignments'])
+        image_names = self.create_image_files(options['image_files'])
+        self.create_photos(tasks, members, volunteer_ids, image_names, options['photos'])
+        self.stdout.write(self.style.SUCCESS(f"Done in {time.perf_counter() - started:.1f}s"))
+
+    def bulk_create(self, model, objects, total):
+        """Вставляет объекты из генератора пачками по batch_size, каждая пачка — своя транзакция"""
+        batch = []
+        created = 0
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                created += self._insert(model, batch)
+                batch = []
+                self.stdout.write(f"  {model._meta.verbose_name_plural}: {created}/{total}", ending='\r')
+        if batch:
+            created += self._insert(model, batch)
+        self.stdout.write(f"  {model._meta.verbose_name_plural}: {created}")
+        return created
+
+    def _insert(self, model, batch):
+        with transaction.atomic():
+            model.objects.bulk_create(batch, batch_size=self.batch_size)
+        return len(batch)
+
+    def clear(self, seeded):
+        self.stdout.write(f"Deleting data with prefix '{self.prefix}'...")
+        Photo.objects.filter(volunteer__in=seeded).delete()
+        TaskAssignment.objects.filter(volunteer__in=seeded).delete()
+        projects = Project.objects.filter(creator__in=seeded)
+        Task.objects.filter(project__in=projects).delete()
+        VolunteerProject.objects.filter(project__in=projects).delete()
+        projects.delete()
+        seeded.delete()
+
+    def create_users(self, options):
+        password = make_password(None)
+        index = iter(range(10 ** 9))
+
+        def user(role, i, **fields):
+            n = next(index)
+            return User(
+                username=f"{self.prefix}_{role}_{i}", password=password,
+                telegram_id=str(TELEGRAM_ID_BASE + n), phone_number=f"+70{n:09d}",
+                first_name=f"{role.capitalize()} {i}", rating=self.rnd.randint(0, 100) if role == 'vol' else 0,
+                **fields
+            )
+
+        self.stdout.write("Users")
+        self.bulk_create(User, (user('staff', i, is_staff=True) for i in range(options['staff'])), options['staff'])
+        self.bulk_create(User, (
+            user('org', i, is_organizer=True, organization_name=f"Организация {i}")
+            for i in range(options['organizers'])
+        ), options['organizers'])
+        self.bulk_create(User, (user('vol', i) for i in range(options['users'])), options['users'])
+
+        volunteer_ids = list(
+            User.objects.filter(username__startswith=f"{self.prefix}_vol_").order_by('id').values_list('id', flat=True)
+        )
+        organizer_ids = list(
+            User.objects.filter(username__startswith=f"{self.prefix}_org_").order_by('id').values_list('id', flat=True)
+        )
+        # Начальные рейтинги записываются в журнал, иначе recompute_ratings их обнулит
+        ratings = User.objects.filter(username__startswith=f"{self.prefix}_vol_", rating__gt=0).values_list('id', 'rating')
+        self.bulk_create(RatingEvent, (
+            RatingEvent(user_id=user_id, source='initial', points=rating) for user_id, rating in ratings.iterator()
+        ), ratings.count())
+        return volunteer_ids, organizer_ids
+
+    def create_projects(self, organizer_ids, count):
+        self.stdout.write("Projects")
+
+        def generate():
+            for i in range(count):
+                city = weighted(self.rnd, CITIES)
+                latitude, longitude = CITY_CENTERS[city]
+                yield Project(
+                    title=f"{self.rnd.choice(PROJECT_TITLES)} #{i}",
+                    description="Сгенерированный проект для нагрузочного тестирования",
+                    city=city,
+                    creator_id=self.rnd.choice(organizer_ids),
+                    status=weighted(self.rnd, PROJECT_STATUSES),
+                    latitude=latitude + self.rnd.uniform(-0.1, 0.1),
+                    longitude=longitude + self.rnd.uniform(-0.1, 0.1),
+                    # Каждый пятый проект с ограниченным числом мест
+                    capacity=self.rnd.randint(5, 50) if self.rnd.random() < 0.2 else None,
+                )
+
+        self.bulk_create(Project, generate(), count)
+        project_ids = list(
+            Project.objects.filter(creator__username__startswith=f"{self.prefix}_org_")
+            .order_by('id').values_list('id', flat=True)
+        )
+
+        tags = [tag.id for tag in Tag.objects.for_names(TAGS)]
+        # От одного до трёх тегов на проект
+        self.bulk_create(ProjectTag, (
+            ProjectTag(project_id=project_id, tag_id=tag_id)
+            for project_id in project_ids for tag_id in self.rnd.sample(tags, self.rnd.randint(1, 3))
+        ), len(project_ids) * 2)
+        return project_ids
+
+    def create_memberships(self, volunteer_ids, project_ids, memberships):
+        """Возвращает project_id -> список id волонтёров проекта.
+
+        Участия нумеруются, как в core.repository.create_volunteer_project: не больше
+        MAX_PROJECTS_PER_VOLUNTEER у волонтёра и capacity у проекта.
+        """
+        self.stdout.write("Memberships")
+        members = {}
+        capacities = dict(Project.objects.filter(id__in=project_ids).values_list('id', 'capacity'))
+        # Половина волонтёров с лимитом в 1 проект остаётся без участия и может вступить в бенчмарке
+        per_volunteer = min(2 * memberships, settings.MAX_PROJECTS_PER_VOLUNTEER)
+
+        def generate():
+            for volunteer_id in volunteer_ids:
+                # У популярных проектов (в начале списка) волонтёров больше
+                count = min(len(project_ids), self.rnd.randint(0, per_volunteer))
+                chosen = set()
+                for _ in range(4 * count):
+                    if len(chosen) >= count:
+                        break
+                    project_id = project_ids[int(len(project_ids) * self.rnd.random() ** 2)]
+                    capacity = capacities[project_id]
+                    if capacity is None or len(members.get(project_id, ())) < capacity:
+                        chosen.add(project_id)
+                for slot, project_id in enumerate(chosen, start=1):
+                    project_members = members.setdefault(project_id, [])
+                    project_members.append(volunteer_id)
+                    yield VolunteerProject(
+                        volunteer_id=volunteer_id, project_id=project_id, is_active=self.rnd.random() > 0.05,
+                        seat=len(project_members), slot=slot,
+                    )
+
+        self.bulk_create(VolunteerProject, generate(), len(volunteer_ids) * per_volunteer // 2)
+        return members
+
+    def create_tasks(self, project_ids, per_project):
+        """Возвращает список (task_id, project_id)"""
+        self.stdout.write("Tasks")
+        creators = dict(
+            Project.objects.filter(creator__username__startswith=f"{self.prefix}_org_").values_list('id', 'creator_id')
+        )
+        today = date.today()
+
+        def generate():
+            for project_id in project_ids:
+                for _ in range(per_project):
+                    start_hour = self.rnd.randint(8, 16)
+                    task = Task(
+                        project_id=project_id, creator_id=creators[project_id],
+                        text=self.rnd.choice(TASK_TEXTS),
+                        deadline_date=today + timedelta(days=self.rnd.randint(-180, 60)),
+                        start_time=dtime(start_hour), end_time=dtime(start_hour + self.rnd.randint(1, 4)),
+                        status=weighted(self.rnd, TASK_STATUSES),
+                    )
+                    # bulk_create не вызывает save(), где считается срок для планировщика
+                    task.update_deadline()
+                    yield task
+
+        self.bulk_create(Task, generate(), len(project_ids) * per_project)
+        return list(
+            Task.objects.filter(project__creator__username__startswith=f"{self.prefix}_org_")
+            .order_by('id').values_list('id', 'project_id')
+        )
+
+    def create_assignments(self, tasks, members, per_task):
+        self.stdout.write("Task assignments")
+        now = timezone.now()
+
+        def generate():
+            for task_id, project_id in tasks:
+                volunteers = members.get(project_id, [])
+                for volunteer_id in self.rnd.sample(volunteers, min(per_task, len(volunteers))):
+                    completed = self.rnd.random() < 0.4
+                    yield TaskAssignment(
+                        task_id=task_id, volunteer_id=volunteer_id,
+                        accepted=completed or self.rnd.random() < 0.6, completed=completed,
+                        completed_at=now - timedelta(days=self.rnd.randint(0, 180)) if completed else None,
+                        rating=self.rnd.randint(1, 5) if completed else None,
+                    )
+
+        self.bulk_create(TaskAssignment, generate(), len(tasks) * per_task)
+
+    def create_image_files(self, count):
+        """Небольшие JPEG в media/photos/<prefix>/: фотоотчёты ссылаются на них по кругу"""
+        directory = os.path.join('photos', self.prefix)
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, directory), exist_ok=True)
+        names = []
+        for i in range(max(1, count)):
+            name = os.path.join(directory, f"{i}.jpg")
+            color = tuple(self.rnd.randint(0, 255) for _ in range(3))
+            Image.new('RGB', (320, 240), color).save(os.path.join(settings.MEDIA_ROOT, name), 'JPEG', quality=70)
+            names.append(name)
+        self.stdout.write(f"  image files: {len(names)} in {os.path.join(settings.MEDIA_ROOT, directory)}")
+        return names
+
+    def create_photos(self, tasks, members, volunteer_ids, image_names, count):
+        self.stdout.write("Photos")
+        if not tasks:
+            return
+        now = timezone.now()
+
+        def generate():
+            for i in range(count):
+                task_id, project_id = self.rnd.choice(tasks)
+                status = weighted(self.rnd, PHOTO_STATUSES)
+                yield Photo(
+                    volunteer_id=self.rnd.choice(members.get(project_id) or volunteer_ids),
+                    project_id=project_id, task_id=task_id,
+                    image=image_names[i % len(image_names)],
+                    status=status,
+                    rating=self.rnd.randint(1, 5) if status == 'approved' and self.rnd.random() < 0.8 else None,
+                    moderated_at=now - timedelta(days=self.rnd.randint(0, 180)) if status != 'pending' else None,
+                )
+
+        self.bulk_create(Photo, generate(), count)
@@ -0,0 +1,60 @@
+# Generated by Django 5.2 on 2026-10-16 23:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_alter_photo_options_alter_project_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='bot_blocked',
+            field=models.BooleanField(default=False, help_text='Заблокировал ли пользователь бота (рассылки ему не отправляются)'),
+        ),
+        migrations.CreateModel(
+            name='Broadcast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('task', 'Задание'), ('announcement', 'Объявление')], default='announcement', help_text='Тип рассылки', max_length=20)),
+                ('text', models.TextField(help_text='Текст сообщения (подпись к фото)')),
+                ('photo', models.CharField(blank=True, help_text='Путь к фото относительно MEDIA_ROOT', max_length=255, null=True)),
+                ('buttons', models.JSONField(blank=True, default=list, help_text='Inline-кнопки: список рядов [[текст, callback_data], ...]')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает отправки'), ('sending', 'Отправляется'), ('completed', 'Завершена')], db_index=True, default='pending', help_text='Статус рассылки', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('completed_at', models.DateTimeField(blank=True, help_text='Дата завершения', null=True)),
+                ('creator', models.ForeignKey(blank=True, help_text='Кто запустил рассылку (получит отчёт о доставке)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='broadcasts', to=settings.AUTH_USER_MODEL)),
+                ('task', models.ForeignKey(blank=True, help_text='Задание, о котором рассылка', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='broadcasts', to='core.task')),
+            ],
+            options={
+                'verbose_name': 'Рассылка',
+                'verbose_name_plural': 'Рассылки',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BroadcastDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chat_id', models.CharField(help_text='telegram_id получателя на момент рассылки', max_length=50)),
+                ('status', models.CharField(choices=[('pending', 'Ожидает отправки'), ('sent', 'Доставлено'), ('failed', 'Ошибка'), ('blocked', 'Бот заблокирован')], default='pending', help_text='Статус доставки', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0, help_text='Количество попыток отправки')),
+                ('error', models.TextField(blank=True, default='', help_text='Последняя ошибка Telegram')),
+                ('message_id', models.BigIntegerField(blank=True, help_text='ID отправленного сообщения', null=True)),
+                ('sent_at', models.DateTimeField(blank=True, help_text='Дата доставки', null=True)),
+                ('broadcast', models.ForeignKey(help_text='Рассылка', on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='core.broadcast')),
+                ('user', models.ForeignKey(help_text='Получатель', on_delete=django.db.models.deletion.CASCADE, related_name='broadcast_deliveries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Доставка рассылки',
+                'verbose_name_plural': 'Доставки рассылок',
+                'indexes': [models.Index(fields=['broadcast', 'status'], name='core_broadc_broadca_3e94d0_idx')],
+                'unique_together': {('broadcast', 'user')},
+            },
+        ),
+    ]
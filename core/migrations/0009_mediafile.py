@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-16 23:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_broadcast'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(help_text='Путь к файлу относительно MEDIA_ROOT', max_length=255, unique=True)),
+                ('sha256', models.CharField(db_index=True, help_text='SHA-256 содержимого файла', max_length=64)),
+                ('size', models.PositiveIntegerField(default=0, help_text='Размер файла в байтах')),
+                ('file_id', models.CharField(blank=True, help_text='file_id в Telegram', max_length=255, null=True)),
+                ('file_unique_id', models.CharField(blank=True, db_index=True, help_text='file_unique_id в Telegram', max_length=64, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Медиафайл',
+                'verbose_name_plural': 'Медиафайлы',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-16 23:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_mediafile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='file_id',
+            field=models.CharField(blank=True, help_text='file_id фото в Telegram: по нему фото пересылается организатору без чтения с диска', max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='file_unique_id',
+            field=models.CharField(blank=True, help_text='file_unique_id фото в Telegram', max_length=64, null=True),
+        ),
+    ]
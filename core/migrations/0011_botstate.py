@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-16 23:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_photo_file_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BotState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(help_text='user_data, chat_data или conversation:<имя диалога>', max_length=100)),
+                ('key', models.CharField(help_text='ID пользователя, чата или ключ диалога', max_length=100)),
+                ('data', models.TextField(help_text='Состояние в JSON')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Состояние бота',
+                'verbose_name_plural': 'Состояния бота',
+                'unique_together': {('kind', 'key')},
+            },
+        ),
+    ]
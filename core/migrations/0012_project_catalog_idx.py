@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-16 23:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_botstate'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='project_catalog_idx'),
+        ),
+    ]
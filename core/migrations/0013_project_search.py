@@ -0,0 +1,94 @@
+from django.db import migrations
+
+# Индекс FTS5 для поиска проектов (core/search.py). Его держат в актуальном состоянии триггеры
+# SQLite, а не сигналы: так в индекс попадают и bulk_create, и queryset.update() из админки,
+# и изменения из других процессов
+
+
+def fold(expression):
+    # Как core.search.normalize: unicode61 не снимает диакритику с «ё»
+    return f"replace(replace({expression}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+PROJECT_CONTENT_TYPE = (
+    "(SELECT id FROM django_content_type WHERE app_label = 'core' AND model = 'project')"
+)
+
+
+TAGS = (
+    "coalesce((SELECT group_concat(t.name, ' ') FROM taggit_taggeditem ti JOIN taggit_tag t ON t.id = ti.tag_id "
+    f"WHERE ti.content_type_id = {PROJECT_CONTENT_TYPE} AND ti.object_id = p.id), '')"
+)
+
+
+def reindex(project_ids):
+    """Удаляет строки проектов project_ids (SQL-список или подзапрос) и добавляет заново одобренные"""
+    return (
+        f"DELETE FROM core_project_search WHERE rowid IN ({project_ids}); "
+        "INSERT INTO core_project_search (rowid, title, description, city, tags) "
+        f"SELECT p.id, {fold('p.title')}, {fold('p.description')}, {fold('p.city')}, {fold(TAGS)} "
+        f"FROM core_project p WHERE p.id IN ({project_ids}) AND p.status = 'approved';"
+    )
+
+
+TRIGGERS = {
+    'core_project_search_ai': f"AFTER INSERT ON core_project BEGIN {reindex('NEW.id')} END",
+    'core_project_search_au': (
+        f"AFTER UPDATE OF title, description, city, status ON core_project BEGIN {reindex('NEW.id')} END"
+    ),
+    'core_project_search_ad': "AFTER DELETE ON core_project BEGIN DELETE FROM core_project_search WHERE rowid = OLD.id; END",
+    'core_project_search_tags_ai': (
+        f"AFTER INSERT ON taggit_taggeditem WHEN NEW.content_type_id = {PROJECT_CONTENT_TYPE} "
+        f"BEGIN {reindex('NEW.object_id')} END"
+    ),
+    'core_project_search_tags_au': (
+        f"AFTER UPDATE ON taggit_taggeditem WHEN {PROJECT_CONTENT_TYPE} IN (OLD.content_type_id, NEW.content_type_id) "
+        f"BEGIN {reindex('OLD.object_id, NEW.object_id')} END"
+    ),
+    'core_project_search_tags_ad': (
+        f"AFTER DELETE ON taggit_taggeditem WHEN OLD.content_type_id = {PROJECT_CONTENT_TYPE} "
+        f"BEGIN {reindex('OLD.object_id')} END"
+    ),
+    # Переименованный тег меняет текст всех его проектов
+    'core_project_search_tag_au': (
+        "AFTER UPDATE OF name ON taggit_tag BEGIN "
+        + reindex(
+            f"SELECT object_id FROM taggit_taggeditem WHERE tag_id = NEW.id AND content_type_id = {PROJECT_CONTENT_TYPE}"
+        )
+        + " END"
+    ),
+}
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE core_project_search USING fts5("
+        "title, description, city, tags, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    for name, body in TRIGGERS.items():
+        schema_editor.execute(f"CREATE TRIGGER {name} {body}")
+    # Существующие проекты: UPDATE без изменений запускает триггер индексации
+    schema_editor.execute("UPDATE core_project SET status = status WHERE status = 'approved'")
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name in TRIGGERS:
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {name}")
+    schema_editor.execute("DROP TABLE IF EXISTS core_project_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_project_catalog_idx'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2026-10-16 23:45
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_project_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='latitude',
+            field=models.FloatField(blank=True, help_text='Широта места проведения (для поиска проектов рядом)', null=True, validators=[django.core.validators.MinValueValidator(-90), django.core.validators.MaxValueValidator(90)]),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='longitude',
+            field=models.FloatField(blank=True, help_text='Долгота места проведения', null=True, validators=[django.core.validators.MinValueValidator(-180), django.core.validators.MaxValueValidator(180)]),
+        ),
+    ]
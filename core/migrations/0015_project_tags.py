@@ -0,0 +1,136 @@
+import importlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def normalize_tag(name):
+    # Копия core.models.normalize_tag на момент миграции
+    return ' '.join(name.replace('#', ' ').split()).casefold().replace('ё', 'е')[:100]
+
+
+def copy_taggit_tags(apps, schema_editor):
+    """Переносит теги проектов из taggit: одинаковые после нормализации теги сливаются в один"""
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    TaggedItem = apps.get_model('taggit', 'TaggedItem')
+    Tag = apps.get_model('core', 'Tag')
+    ProjectTag = apps.get_model('core', 'ProjectTag')
+    db = schema_editor.connection.alias
+
+    content_type = ContentType.objects.using(db).filter(app_label='core', model='project').first()
+    if content_type is None:
+        return
+    items = list(
+        TaggedItem.objects.using(db).filter(content_type=content_type).values_list('object_id', 'tag__name')
+    )
+    names = {name: normalize_tag(name) for name in {name for _, name in items}}
+    Tag.objects.using(db).bulk_create(
+        [Tag(name=name) for name in set(names.values()) if name], ignore_conflicts=True
+    )
+    tag_ids = dict(Tag.objects.using(db).values_list('name', 'id'))
+    ProjectTag.objects.using(db).bulk_create([
+        ProjectTag(project_id=project_id, tag_id=tag_ids[names[name]])
+        for project_id, name in items if names[name]
+    ], batch_size=1000, ignore_conflicts=True)
+
+
+def fold(expression):
+    return f"replace(replace({expression}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+TAGS = (
+    "coalesce((SELECT group_concat(t.name, ' ') FROM core_projecttag pt JOIN core_tag t ON t.id = pt.tag_id "
+    "WHERE pt.project_id = p.id), '')"
+)
+
+
+def reindex(project_ids):
+    return (
+        f"DELETE FROM core_project_search WHERE rowid IN ({project_ids}); "
+        "INSERT INTO core_project_search (rowid, title, description, city, tags) "
+        f"SELECT p.id, {fold('p.title')}, {fold('p.description')}, {fold('p.city')}, {TAGS} "
+        f"FROM core_project p WHERE p.id IN ({project_ids}) AND p.status = 'approved';"
+    )
+
+
+# Триггеры поискового индекса (0013) теперь читают теги из core_projecttag и core_tag
+TRIGGERS = {
+    'core_project_search_ai': f"AFTER INSERT ON core_project BEGIN {reindex('NEW.id')} END",
+    'core_project_search_au': (
+        f"AFTER UPDATE OF title, description, city, status ON core_project BEGIN {reindex('NEW.id')} END"
+    ),
+    'core_project_search_ad': "AFTER DELETE ON core_project BEGIN DELETE FROM core_project_search WHERE rowid = OLD.id; END",
+    'core_project_search_tags_ai': f"AFTER INSERT ON core_projecttag BEGIN {reindex('NEW.project_id')} END",
+    'core_project_search_tags_au': (
+        f"AFTER UPDATE ON core_projecttag BEGIN {reindex('OLD.project_id, NEW.project_id')} END"
+    ),
+    'core_project_search_tags_ad': f"AFTER DELETE ON core_projecttag BEGIN {reindex('OLD.project_id')} END",
+    'core_project_search_tag_au': (
+        f"AFTER UPDATE OF name ON core_tag BEGIN {reindex('SELECT project_id FROM core_projecttag WHERE tag_id = NEW.id')} END"
+    ),
+}
+
+
+def replace_triggers(schema_editor, triggers):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name, body in triggers.items():
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        schema_editor.execute(f"CREATE TRIGGER {name} {body}")
+    # Пересобрать индекс: UPDATE без изменений запускает триггер индексации
+    schema_editor.execute("DELETE FROM core_project_search")
+    schema_editor.execute("UPDATE core_project SET status = status WHERE status = 'approved'")
+
+
+def use_project_tags(apps, schema_editor):
+    replace_triggers(schema_editor, TRIGGERS)
+
+
+def use_taggit_tags(apps, schema_editor):
+    previous = importlib.import_module('core.migrations.0013_project_search')
+    replace_triggers(schema_editor, previous.TRIGGERS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_project_location'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Название тега в нижнем регистре', max_length=100, unique=True)),
+            ],
+            options={
+                'verbose_name': 'Тег',
+                'verbose_name_plural': 'Теги',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProjectTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='project_tags', to='core.project')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='project_tags', to='core.tag')),
+            ],
+            options={
+                'verbose_name': 'Тег проекта',
+                'verbose_name_plural': 'Теги проектов',
+                'indexes': [models.Index(fields=['tag', 'project'], name='projecttag_tag_project_idx')],
+                'unique_together': {('project', 'tag')},
+            },
+        ),
+        migrations.RunPython(copy_taggit_tags, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='project',
+            name='tags',
+            field=models.ManyToManyField(blank=True, help_text='Теги проекта', related_name='projects', through='core.ProjectTag', to='core.tag'),
+        ),
+        migrations.RunPython(use_project_tags, use_taggit_tags),
+    ]
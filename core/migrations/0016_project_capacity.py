@@ -0,0 +1,56 @@
+# Generated by Django 5.2 on 2026-10-17 00:04
+
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+
+def number_memberships(apps, schema_editor):
+    """Нумерует существующие участия по времени вступления: места в каждом проекте и участия
+    каждого волонтёра, чтобы их учитывали ограничения capacity и MAX_PROJECTS_PER_VOLUNTEER"""
+    VolunteerProject = apps.get_model('core', 'VolunteerProject')
+    db = schema_editor.connection.alias
+    memberships = VolunteerProject.objects.using(db).annotate(
+        seat_number=Window(RowNumber(), partition_by=[F('project_id')], order_by=[F('joined_at').asc(), F('id').asc()]),
+        slot_number=Window(RowNumber(), partition_by=[F('volunteer_id')], order_by=[F('joined_at').asc(), F('id').asc()]),
+    ).only('id')
+    updated = []
+    for membership in memberships.iterator(chunk_size=2000):
+        membership.seat, membership.slot = membership.seat_number, membership.slot_number
+        updated.append(membership)
+    VolunteerProject.objects.using(db).bulk_update(updated, ['seat', 'slot'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_project_tags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='capacity',
+            field=models.PositiveIntegerField(blank=True, help_text='Сколько волонтёров может участвовать; пусто — без ограничения', null=True, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='volunteerproject',
+            name='seat',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text='Номер места в проекте', null=True),
+        ),
+        migrations.AddField(
+            model_name='volunteerproject',
+            name='slot',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text='Номер участия волонтёра', null=True),
+        ),
+        migrations.RunPython(number_memberships, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='volunteerproject',
+            constraint=models.UniqueConstraint(fields=('project', 'seat'), name='volunteerproject_unique_seat'),
+        ),
+        migrations.AddConstraint(
+            model_name='volunteerproject',
+            constraint=models.UniqueConstraint(fields=('volunteer', 'slot'), name='volunteerproject_unique_slot'),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2 on 2026-10-17 00:10
+
+import zoneinfo
+from datetime import datetime, time
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_deadlines(apps, schema_editor):
+    """starts_at и deadline существующих заданий, как в Task.update_deadline на момент миграции"""
+    Task = apps.get_model('core', 'Task')
+    db = schema_editor.connection.alias
+    tz = zoneinfo.ZoneInfo(settings.TASK_TIME_ZONE)
+    tasks = []
+    for task in Task.objects.using(db).filter(deadline_date__isnull=False).only('deadline_date', 'start_time', 'end_time').iterator(chunk_size=2000):
+        if task.start_time:
+            task.starts_at = timezone.make_aware(datetime.combine(task.deadline_date, task.start_time), tz)
+        task.deadline = timezone.make_aware(datetime.combine(task.deadline_date, task.end_time or time.max), tz)
+        tasks.append(task)
+    Task.objects.using(db).bulk_update(tasks, ['starts_at', 'deadline'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_project_capacity'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='broadcast',
+            name='kind',
+            field=models.CharField(choices=[('task', 'Задание'), ('announcement', 'Объявление'), ('reminder', 'Напоминание о задании')], default='announcement', help_text='Тип рассылки', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='deadline',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Срок выполнения задания', null=True),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='end_reminded',
+            field=models.BooleanField(default=False, editable=False, help_text='Напоминание об окончании отправлено'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='start_reminded',
+            field=models.BooleanField(default=False, editable=False, help_text='Напоминание о начале отправлено'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='starts_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Начало задания', null=True),
+        ),
+        migrations.AddField(
+            model_name='taskassignment',
+            name='expired',
+            field=models.BooleanField(default=False, help_text='Срок задания истёк до выполнения'),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='status',
+            field=models.CharField(choices=[('open', 'Открыта'), ('in_progress', 'В работе'), ('completed', 'Выполнена'), ('expired', 'Срок истёк')], db_index=True, default='open', help_text='Статус задания', max_length=20),
+        ),
+        migrations.RunPython(fill_deadlines, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['status', 'deadline'], name='task_deadline_idx'),
+        ),
+    ]
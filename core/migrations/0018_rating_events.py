@@ -0,0 +1,70 @@
+# Generated by Django 5.2 on 2026-10-17 00:20
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Баллы за звезду на момент миграции (core.models.RATING_POINTS_PER_STAR)
+POINTS_PER_STAR = 2
+
+
+def fill_rating_events(apps, schema_editor):
+    """Журнал из уже выставленных оценок фото и заданий; разница с текущим рейтингом
+    записывается событием initial, чтобы пересчёт по журналу дал те же рейтинги"""
+    User = apps.get_model('core', 'User')
+    Photo = apps.get_model('core', 'Photo')
+    TaskAssignment = apps.get_model('core', 'TaskAssignment')
+    RatingEvent = apps.get_model('core', 'RatingEvent')
+    db = schema_editor.connection.alias
+
+    events = [
+        RatingEvent(user_id=user_id, source='photo', stars=stars, points=stars * POINTS_PER_STAR, photo_id=photo_id)
+        for photo_id, user_id, stars in Photo.objects.using(db).filter(status='approved', rating__gte=1, rating__lte=5)
+        .values_list('id', 'volunteer_id', 'rating')
+    ]
+    events += [
+        RatingEvent(user_id=user_id, source='task', stars=stars, points=stars * POINTS_PER_STAR, assignment_id=assignment_id)
+        for assignment_id, user_id, stars in TaskAssignment.objects.using(db).filter(rating__gte=1, rating__lte=5)
+        .values_list('id', 'volunteer_id', 'rating')
+    ]
+    totals = {}
+    for event in events:
+        totals[event.user_id] = totals.get(event.user_id, 0) + event.points
+    events += [
+        RatingEvent(user_id=user_id, source='initial', points=rating - totals.get(user_id, 0))
+        for user_id, rating in User.objects.using(db).values_list('id', 'rating')
+        if rating != totals.get(user_id, 0)
+    ]
+    RatingEvent.objects.using(db).bulk_create(events, batch_size=1000)
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_task_deadlines'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('photo', 'Оценка фотоотчёта'), ('task', 'Отзыв о задании'), ('manual', 'Ручное изменение'), ('initial', 'Рейтинг до появления журнала')], help_text='Источник изменения', max_length=20)),
+                ('stars', models.PositiveSmallIntegerField(blank=True, help_text='Оценка от 1 до 5 звезд; баллы за неё пересчитываются при изменении формулы', null=True, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(5)])),
+                ('points', models.IntegerField(help_text='Изменение рейтинга')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('assignment', models.ForeignKey(blank=True, help_text='Назначение, по которому оставлен отзыв', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='rating_events', to='core.taskassignment')),
+                ('photo', models.ForeignKey(blank=True, help_text='Оценённый фотоотчёт', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='rating_events', to='core.photo')),
+                ('user', models.ForeignKey(help_text='Пользователь', on_delete=django.db.models.deletion.CASCADE, related_name='rating_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Изменение рейтинга',
+                'verbose_name_plural': 'Журнал рейтинга',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.RunPython(fill_rating_events, migrations.RunPython.noop),
+    ]
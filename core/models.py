@@ -1,13 +1,23 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, Value
+from django.db.models.functions import Greatest, Least
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator, RegexValidator
-from taggit.managers import TaggableManager
 from django.utils import timezone
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from telegram.ext import Application
 from asgiref.sync import async_to_sync
 import os
+import random
+import zoneinfo
+from datetime import datetime, time
+
+from django.conf import settings
+
+from .cache import user_cache
+from .catalog import project_catalog
+from .deadlines import ACTIVE_STATUSES, deadline_queue
 
 bot = Application.builder().token('7633935996:AAH1VW2r-6akFzay6nQW2wSkYa8j7JgWQvI').build()
 
@@ -21,6 +31,19 @@ def task_image_upload_path(instance, filename):
     date = timezone.now().strftime("%Y/%m/%d")
     return os.path.join('tasks', date, filename)
 
+# Баллы рейтинга за одну звезду оценки. После изменения формулы рейтинги пересчитываются
+# по журналу командой recompute_ratings
+RATING_POINTS_PER_STAR = 2
+MAX_RATING = 100
+
+def rating_points(stars):
+    """Баллы за оценку; stars — число или выражение (F('stars')) для пересчёта в БД"""
+    return stars * RATING_POINTS_PER_STAR
+
+def clamp_rating(expression):
+    """Выражение рейтинга в пределах 0..MAX_RATING, вычисляемое в БД"""
+    return Greatest(Value(0), Least(Value(MAX_RATING), expression))
+
 class User(AbstractUser):
     telegram_id = models.CharField(max_length=50, unique=True, blank=True, null=True)
     phone_number = models.CharField(
@@ -42,11 +65,28 @@ class User(AbstractUser):
         default=False,
         help_text="Является ли пользователь организатором"
     )
+    bot_blocked = models.BooleanField(
+        default=False,
+        help_text="Заблокировал ли пользователь бота (рассылки ему не отправляются)"
+    )
 
-    def update_rating(self, points):
-        """Обновляет рейтинг пользователя с учетом ограничений"""
-        self.rating = max(0, min(100, self.rating + points))
-        self.save()
+    def update_rating(self, points, source='manual', **event):
+        """Записывает изменение рейтинга в журнал RatingEvent и меняет рейтинг в той же транзакции.
+
+        Рейтинг меняется одним UPDATE с F(), а не сохранением прочитанного значения, поэтому
+        одновременные оценки не теряются, а остальные поля пользователя не перезаписываются.
+        event — stars, photo, assignment события. Возвращает новый рейтинг.
+        """
+        with transaction.atomic():
+            RatingEvent.objects.create(user=self, points=points, source=source, **event)
+            User.objects.filter(pk=self.pk).update(rating=clamp_rating(F('rating') + points))
+            self.rating = User.objects.values_list('rating', flat=True).get(pk=self.pk)
+        # update() не отправляет post_save: кэш бота сбрасываем так же, как invalidate_user_cache
+        def invalidate():
+            user_cache.invalidate(telegram_id=self.telegram_id, pk=self.pk)
+        invalidate()
+        transaction.on_commit(invalidate)
+        return self.rating
 
     def __str__(self):
         return f"{self.username} (ID: {self.telegram_id}, Phone: {self.phone_number}, Org: {self.organization_name})"
@@ -56,6 +96,56 @@ class User(AbstractUser):
         verbose_name_plural = 'Пользователи'
         ordering = ['-rating', 'username']
 
+def normalize_tag(name):
+    """Тег в каноническом виде: без лишних пробелов и «#», в нижнем регистре, «ё» как «е»"""
+    return ' '.join(name.replace('#', ' ').split()).casefold().replace('ё', 'е')[:100]
+
+class TagQuerySet(models.QuerySet):
+    def for_names(self, names):
+        """Теги для списка названий (нормализуются), недостающие создаются одним запросом"""
+        names = list(dict.fromkeys(filter(None, map(normalize_tag, names))))
+        if names:
+            self.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+        tags = {tag.name: tag for tag in self.filter(name__in=names)}
+        return [tags[name] for name in names]
+
+class Tag(models.Model):
+    """Тег проекта. Название хранится нормализованным (normalize_tag), поэтому «Экология»,
+    «экология» и «#экология» — один тег"""
+    name = models.CharField(max_length=100, unique=True, help_text="Название тега в нижнем регистре")
+
+    objects = TagQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        self.name = normalize_tag(self.name)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = 'Тег'
+        verbose_name_plural = 'Теги'
+        ordering = ['name']
+
+class ProjectQuerySet(models.QuerySet):
+    def tagged(self, names, match_all=False):
+        """Проекты с любым (match_all=False) или со всеми тегами из names — одним запросом без дублей.
+
+        Фильтр — подзапрос по индексу (tag, project) таблицы ProjectTag, а не JOIN, поэтому
+        проект с несколькими подходящими тегами не повторяется.
+        """
+        names = list(dict.fromkeys(filter(None, map(normalize_tag, names))))
+        if not names:
+            return self
+        if not match_all:
+            return self.filter(Exists(ProjectTag.objects.filter(project=OuterRef('pk'), tag__name__in=names)))
+        matching = (
+            ProjectTag.objects.filter(tag__name__in=names).values('project')
+            .annotate(matched=Count('tag')).filter(matched=len(names)).values('project')
+        )
+        return self.filter(pk__in=matching)
+
 class Project(models.Model):
     STATUS_CHOICES = (
         ('pending', 'Ожидает проверки'),
@@ -79,7 +169,25 @@ class Project(models.Model):
         db_index=True,
         help_text="Статус модерации проекта"
     )
-    tags = TaggableManager(help_text="Теги проекта")
+    tags = models.ManyToManyField(
+        Tag,
+        through='ProjectTag',
+        related_name='projects',
+        blank=True,
+        help_text="Теги проекта"
+    )
+    latitude = models.FloatField(
+        null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)],
+        help_text="Широта места проведения (для поиска проектов рядом)"
+    )
+    longitude = models.FloatField(
+        null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)],
+        help_text="Долгота места проведения"
+    )
+    capacity = models.PositiveIntegerField(
+        null=True, blank=True, validators=[MinValueValidator(1)],
+        help_text="Сколько волонтёров может участвовать; пусто — без ограничения"
+    )
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     volunteers = models.ManyToManyField(
         User,
@@ -89,6 +197,8 @@ class Project(models.Model):
         help_text="Волонтеры проекта"
     )
 
+    objects = ProjectQuerySet.as_manager()
+
     def approve(self):
         """Одобряет проект"""
         self.status = 'approved'
@@ -106,6 +216,39 @@ class Project(models.Model):
         verbose_name = 'Проект'
         verbose_name_plural = 'Проекты'
         ordering = ['-created_at']
+        # Каталог одобренных проектов листается по (created_at, id)
+        indexes = [models.Index(fields=['status', 'created_at', 'id'], name='project_catalog_idx')]
+
+class ProjectTag(models.Model):
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='project_tags')
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='project_tags')
+
+    class Meta:
+        unique_together = ('project', 'tag')
+        # unique_together даёт индекс (project, tag); для фильтра по тегу нужен обратный
+        indexes = [models.Index(fields=['tag', 'project'], name='projecttag_tag_project_idx')]
+        verbose_name = 'Тег проекта'
+        verbose_name_plural = 'Теги проектов'
+
+    def __str__(self):
+        return f"{self.project.title}: {self.tag.name}"
+
+def free_number(taken, limit):
+    """Номер для нового участия из 1..limit или None, если мест нет; taken — номера существующих
+    участий (None у участий без номера).
+
+    Участия без номера и с номером больше limit (после уменьшения capacity) уникальное ограничение
+    не видит, поэтому свободных номеров тогда больше, чем оставшихся мест. Выбор идёт только среди
+    первых limit - len(taken) свободных номеров: одновременные вступления, прочитавшие одни и те
+    же участия, выбирают из одного набора и вместе не превысят limit.
+    """
+    remaining = limit - len(taken)
+    if remaining <= 0:
+        return None
+    used = set(taken)
+    candidates = [number for number in range(1, limit + 1) if number not in used][:remaining]
+    # Случайный свободный номер: одновременные вступления реже выбирают один и тот же
+    return random.choice(candidates)
 
 class VolunteerProject(models.Model):
     volunteer = models.ForeignKey(
@@ -123,22 +266,78 @@ class VolunteerProject(models.Model):
     )
     joined_at = models.DateTimeField(auto_now_add=True, db_index=True)
     is_active = models.BooleanField(default=True, help_text="Активно ли участие")
+    # Номер занятого места в проекте (1..capacity) и номер участия волонтёра
+    # (1..MAX_PROJECTS_PER_VOLUNTEER). Их выдаёт core.repository.create_volunteer_project, а участиям
+    # из админки — save(); уникальность в БД не даёт двум одновременным вступлениям занять одно место
+    seat = models.PositiveIntegerField(null=True, blank=True, editable=False, help_text="Номер места в проекте")
+    slot = models.PositiveIntegerField(null=True, blank=True, editable=False, help_text="Номер участия волонтёра")
 
     class Meta:
         unique_together = ('volunteer', 'project')
+        constraints = [
+            models.UniqueConstraint(fields=['project', 'seat'], name='volunteerproject_unique_seat'),
+            models.UniqueConstraint(fields=['volunteer', 'slot'], name='volunteerproject_unique_slot'),
+        ]
         verbose_name = 'Участие волонтера'
         verbose_name_plural = 'Участия волонтеров'
         ordering = ['-joined_at']
 
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.slot is None:
+            self.assign_numbers()
+        super().save(*args, **kwargs)
+
+    def assign_numbers(self):
+        """Номера участия, созданного в обход create_volunteer_project (например, в админке), чтобы
+        его видели уникальные ограничения. Если лимит уже исчерпан, участие остаётся без номера"""
+        members = VolunteerProject.objects.exclude(pk=self.pk)
+        self.slot = free_number(
+            list(members.filter(volunteer_id=self.volunteer_id).values_list('slot', flat=True)),
+            settings.MAX_PROJECTS_PER_VOLUNTEER
+        )
+        capacity = Project.objects.filter(pk=self.project_id).values_list('capacity', flat=True).first()
+        if self.seat is None and capacity is not None:
+            self.seat = free_number(list(members.filter(project_id=self.project_id).values_list('seat', flat=True)), capacity)
+
     def __str__(self):
         status = "активно" if self.is_active else "неактивно"
         return f"{self.volunteer.username} in {self.project.title} ({status})"
 
+class TaskQuerySet(models.QuerySet):
+    """Отбор заданий по сроку. Все методы — условия по status и deadline, то есть один запрос
+    по индексу task_deadline_idx без пересчёта сроков в Python"""
+
+    def active(self):
+        return self.filter(status__in=ACTIVE_STATUSES)
+
+    def overdue(self, now=None):
+        """Активные задания, срок которых прошёл, но планировщик ещё не пометил их истёкшими"""
+        return self.active().filter(deadline__lte=now or timezone.now())
+
+    def expired(self, now=None):
+        """Истёкшие задания: помеченные планировщиком и ещё не помеченные"""
+        return self.filter(
+            Q(status='expired') | Q(status__in=ACTIVE_STATUSES, deadline__lte=now or timezone.now())
+        )
+
+    def due_within(self, delta, now=None):
+        """Активные задания, срок которых наступит в ближайшие delta"""
+        now = now or timezone.now()
+        return self.active().filter(deadline__gt=now, deadline__lte=now + delta)
+
+    def active_for(self, volunteer, now=None):
+        """Задания волонтёра, которые ещё можно выполнить: назначены ему, не выполнены и не истекли"""
+        assigned = TaskAssignment.objects.filter(volunteer=volunteer, completed=False).values('task')
+        return self.active().filter(
+            Q(deadline__isnull=True) | Q(deadline__gt=now or timezone.now()), pk__in=assigned
+        )
+
 class Task(models.Model):
     STATUS_CHOICES = (
         ('open', 'Открыта'),
         ('in_progress', 'В работе'),
         ('completed', 'Выполнена'),
+        ('expired', 'Срок истёк'),
     )
     project = models.ForeignKey(
         Project,
@@ -164,6 +363,12 @@ class Task(models.Model):
     deadline_date = models.DateField(null=True, blank=True, help_text="Дата дедлайна")
     start_time = models.TimeField(null=True, blank=True, help_text="Время начала")
     end_time = models.TimeField(null=True, blank=True, help_text="Время окончания")
+    # Дата и время из полей выше в TASK_TIME_ZONE, пересчитываются в save(). По deadline
+    # планировщик бота (scheduler.py) загружает сроки заданий при запуске
+    starts_at = models.DateTimeField(null=True, blank=True, editable=False, help_text="Начало задания")
+    deadline = models.DateTimeField(null=True, blank=True, editable=False, help_text="Срок выполнения задания")
+    start_reminded = models.BooleanField(default=False, editable=False, help_text="Напоминание о начале отправлено")
+    end_reminded = models.BooleanField(default=False, editable=False, help_text="Напоминание об окончании отправлено")
     status = models.CharField(
         max_length=20,
         choices=STATUS_CHOICES,
@@ -179,15 +384,33 @@ class Task(models.Model):
         help_text="Волонтеры, выполняющие задание"
     )
 
+    objects = TaskQuerySet.as_manager()
+
+    def update_deadline(self):
+        """Пересчитывает starts_at и deadline; при переносе срока напоминание отправится заново"""
+        starts_at = deadline = None
+        if self.deadline_date:
+            tz = zoneinfo.ZoneInfo(settings.TASK_TIME_ZONE)
+            if self.start_time:
+                starts_at = timezone.make_aware(datetime.combine(self.deadline_date, self.start_time), tz)
+            # Без времени окончания задание можно выполнить до конца дня
+            deadline = timezone.make_aware(datetime.combine(self.deadline_date, self.end_time or time.max), tz)
+        if starts_at != self.starts_at:
+            self.starts_at, self.start_reminded = starts_at, False
+        if deadline != self.deadline:
+            self.deadline, self.end_reminded = deadline, False
+
+    def save(self, *args, **kwargs):
+        self.update_deadline()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'starts_at', 'deadline', 'start_reminded', 'end_reminded'}
+        super().save(*args, **kwargs)
+
     def is_expired(self):
         """Проверяет, истек ли срок выполнения задания"""
-        if not self.deadline_date:
-            return False
-        now = timezone.now()
-        return now.date() > self.deadline_date or (
-            now.date() == self.deadline_date and 
-            self.end_time and now.time() > self.end_time
-        )
+        if self.status == 'expired':
+            return True
+        return self.deadline is not None and self.deadline <= timezone.now()
 
     def __str__(self):
         return f"Task {self.id} for {self.project.title} by {self.creator.username}"
@@ -196,6 +419,8 @@ class Task(models.Model):
         verbose_name = 'Задание'
         verbose_name_plural = 'Задания'
         ordering = ['-created_at']
+        # Сроки активных заданий читаются планировщиком бота и TaskQuerySet
+        indexes = [models.Index(fields=['status', 'deadline'], name='task_deadline_idx')]
 
 class Photo(models.Model):
     STATUS_CHOICES = (
@@ -228,6 +453,11 @@ class Photo(models.Model):
         upload_to=photo_upload_path,
         help_text="Фотоотчет"
     )
+    file_id = models.CharField(
+        max_length=255, null=True, blank=True,
+        help_text="file_id фото в Telegram: по нему фото пересылается организатору без чтения с диска"
+    )
+    file_unique_id = models.CharField(max_length=64, null=True, blank=True, help_text="file_unique_id фото в Telegram")
     status = models.CharField(
         max_length=20,
         choices=STATUS_CHOICES,
@@ -258,7 +488,7 @@ class Photo(models.Model):
         self.save()
         # Обновляем рейтинг волонтера
         if rating:
-            self.volunteer.update_rating(rating * 2)
+            self.volunteer.update_rating(rating_points(rating), source='photo', stars=rating, photo=self)
 
     def reject(self, feedback=None):
         """Отклоняет фото с комментарием"""
@@ -298,6 +528,7 @@ class TaskAssignment(models.Model):
     )
     accepted = models.BooleanField(default=False, help_text="Принял ли волонтер задание")
     completed = models.BooleanField(default=False, help_text="Выполнено ли задание")
+    expired = models.BooleanField(default=False, help_text="Срок задания истёк до выполнения")
     completed_at = models.DateTimeField(null=True, blank=True, help_text="Дата выполнения")
     rating = models.IntegerField(
         null=True,
@@ -317,6 +548,177 @@ class TaskAssignment(models.Model):
         status = "выполнено" if self.completed else "не выполнено"
         return f"Assignment: {self.volunteer.username} -> {self.task} ({status})"
 
+class RatingEvent(models.Model):
+    """Запись журнала рейтинга. Журнал только дополняется: User.rating — сумма баллов событий
+    пользователя в пределах 0..MAX_RATING, и его можно пересчитать командой recompute_ratings"""
+    SOURCE_CHOICES = (
+        ('photo', 'Оценка фотоотчёта'),
+        ('task', 'Отзыв о задании'),
+        ('manual', 'Ручное изменение'),
+        ('initial', 'Рейтинг до появления журнала'),
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='rating_events',
+        help_text="Пользователь"
+    )
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, help_text="Источник изменения")
+    stars = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(1), MaxValueValidator(5)],
+        help_text="Оценка от 1 до 5 звезд; баллы за неё пересчитываются при изменении формулы"
+    )
+    points = models.IntegerField(help_text="Изменение рейтинга")
+    photo = models.ForeignKey(
+        'Photo',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='rating_events',
+        help_text="Оценённый фотоотчёт"
+    )
+    assignment = models.ForeignKey(
+        'TaskAssignment',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='rating_events',
+        help_text="Назначение, по которому оставлен отзыв"
+    )
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.user.username}: {self.points:+d} ({self.get_source_display()})"
+
+    class Meta:
+        verbose_name = 'Изменение рейтинга'
+        verbose_name_plural = 'Журнал рейтинга'
+        ordering = ['-created_at']
+
+class MediaFile(models.Model):
+    """Файл из media, уже загруженный в Telegram: повторно отправляется по file_id без загрузки"""
+    path = models.CharField(max_length=255, unique=True, help_text="Путь к файлу относительно MEDIA_ROOT")
+    sha256 = models.CharField(max_length=64, db_index=True, help_text="SHA-256 содержимого файла")
+    size = models.PositiveIntegerField(default=0, help_text="Размер файла в байтах")
+    file_id = models.CharField(max_length=255, null=True, blank=True, help_text="file_id в Telegram")
+    file_unique_id = models.CharField(
+        max_length=64, null=True, blank=True, db_index=True, help_text="file_unique_id в Telegram"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.path} ({self.sha256[:12]})"
+
+    class Meta:
+        verbose_name = 'Медиафайл'
+        verbose_name_plural = 'Медиафайлы'
+
+class Broadcast(models.Model):
+    STATUS_CHOICES = (
+        ('pending', 'Ожидает отправки'),
+        ('sending', 'Отправляется'),
+        ('completed', 'Завершена'),
+    )
+    KIND_CHOICES = (
+        ('task', 'Задание'),
+        ('announcement', 'Объявление'),
+        ('reminder', 'Напоминание о задании'),
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='announcement', help_text="Тип рассылки")
+    task = models.ForeignKey(
+        Task,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='broadcasts',
+        help_text="Задание, о котором рассылка"
+    )
+    creator = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='broadcasts',
+        help_text="Кто запустил рассылку (получит отчёт о доставке)"
+    )
+    text = models.TextField(help_text="Текст сообщения (подпись к фото)")
+    photo = models.CharField(max_length=255, null=True, blank=True, help_text="Путь к фото относительно MEDIA_ROOT")
+    buttons = models.JSONField(
+        default=list,
+        blank=True,
+        help_text="Inline-кнопки: список рядов [[текст, callback_data], ...]"
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending',
+        db_index=True,
+        help_text="Статус рассылки"
+    )
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    completed_at = models.DateTimeField(null=True, blank=True, help_text="Дата завершения")
+
+    def __str__(self):
+        return f"Broadcast {self.id} ({self.get_kind_display()}, {self.get_status_display()})"
+
+    class Meta:
+        verbose_name = 'Рассылка'
+        verbose_name_plural = 'Рассылки'
+        ordering = ['-created_at']
+
+class BroadcastDelivery(models.Model):
+    STATUS_CHOICES = (
+        ('pending', 'Ожидает отправки'),
+        ('sent', 'Доставлено'),
+        ('failed', 'Ошибка'),
+        ('blocked', 'Бот заблокирован'),
+    )
+    broadcast = models.ForeignKey(
+        Broadcast,
+        on_delete=models.CASCADE,
+        related_name='deliveries',
+        help_text="Рассылка"
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='broadcast_deliveries',
+        help_text="Получатель"
+    )
+    chat_id = models.CharField(max_length=50, help_text="telegram_id получателя на момент рассылки")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', help_text="Статус доставки")
+    attempts = models.PositiveSmallIntegerField(default=0, help_text="Количество попыток отправки")
+    error = models.TextField(blank=True, default='', help_text="Последняя ошибка Telegram")
+    message_id = models.BigIntegerField(null=True, blank=True, help_text="ID отправленного сообщения")
+    sent_at = models.DateTimeField(null=True, blank=True, help_text="Дата доставки")
+
+    class Meta:
+        unique_together = ('broadcast', 'user')
+        indexes = [models.Index(fields=['broadcast', 'status'])]
+        verbose_name = 'Доставка рассылки'
+        verbose_name_plural = 'Доставки рассылок'
+
+    def __str__(self):
+        return f"Delivery {self.id}: broadcast {self.broadcast_id} -> {self.chat_id} ({self.status})"
+
+class BotState(models.Model):
+    """Состояние бота между перезапусками: user_data, chat_data и шаги диалогов (persistence.py)"""
+    kind = models.CharField(max_length=100, help_text="user_data, chat_data или conversation:<имя диалога>")
+    key = models.CharField(max_length=100, help_text="ID пользователя, чата или ключ диалога")
+    data = models.TextField(help_text="Состояние в JSON")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('kind', 'key')
+        verbose_name = 'Состояние бота'
+        verbose_name_plural = 'Состояния бота'
+
+    def __str__(self):
+        return f"{self.kind} {self.key}"
+
 @receiver(post_save, sender=TaskAssignment)
 def update_completed_at(sender, instance, **kwargs):
     """Обновляет дату выполнения при завершении задания"""
@@ -338,6 +740,72 @@ def user_status_changed(sender, instance, created, **kwargs):
     except AttributeError:
         pass
 
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_cache(sender, instance, **kwargs):
+    """Сбрасывает пользователя в кэше бота (включая запись о незарегистрированном telegram_id)"""
+    def invalidate():
+        user_cache.invalidate(telegram_id=instance.telegram_id, pk=instance.pk)
+    invalidate()
+    # Повторно после коммита: до него другой поток мог снова закэшировать старые данные
+    transaction.on_commit(invalidate)
+
+def _invalidate_project_catalog(project_ids=(), user_id=None):
+    def invalidate():
+        project_catalog.invalidate(project_ids=project_ids, user_id=user_id)
+    invalidate()
+    # Как и для кэша пользователей: до коммита другой поток мог перечитать старые данные
+    transaction.on_commit(invalidate)
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def invalidate_catalog_project(sender, instance, **kwargs):
+    """Перечитывает проект в каталоге бота (одобрение, отклонение, правка, удаление)"""
+    _invalidate_project_catalog(project_ids=[instance.pk])
+
+@receiver(m2m_changed, sender=ProjectTag)
+def invalidate_catalog_project_tags(sender, instance, action, pk_set, **kwargs):
+    """project.tags.add/remove/clear (и tag.projects.add/remove) меняют теги проектов в каталоге"""
+    if not action.startswith('post_'):
+        return
+    if isinstance(instance, Project):
+        _invalidate_project_catalog(project_ids=[instance.pk])
+    elif pk_set:
+        _invalidate_project_catalog(project_ids=list(pk_set))
+    else:
+        # tag.projects.clear(): затронутые проекты уже не найти
+        project_catalog.clear()
+        transaction.on_commit(project_catalog.clear)
+
+@receiver(post_save, sender=ProjectTag)
+@receiver(post_delete, sender=ProjectTag)
+def invalidate_catalog_project_tag(sender, instance, **kwargs):
+    """Теги, изменённые в обход project.tags (например, в админке)"""
+    _invalidate_project_catalog(project_ids=[instance.project_id])
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_catalog_tag(sender, instance, **kwargs):
+    """Переименованный или удалённый тег может быть у любого проекта: каталог перечитывается целиком"""
+    project_catalog.clear()
+    transaction.on_commit(project_catalog.clear)
+
+@receiver(post_save, sender=Task)
+def schedule_task_deadline(sender, instance, **kwargs):
+    """Передаёт новые сроки задания планировщику бота после коммита: до него событие не нашло бы задание в БД"""
+    args = (instance.pk, instance.status, instance.starts_at, instance.deadline, instance.start_reminded, instance.end_reminded)
+    transaction.on_commit(lambda: deadline_queue.schedule(*args))
+
+@receiver(post_delete, sender=Task)
+def cancel_task_deadline(sender, instance, **kwargs):
+    deadline_queue.cancel(instance.pk)
+
+@receiver(post_save, sender=VolunteerProject)
+@receiver(post_delete, sender=VolunteerProject)
+def invalidate_catalog_membership(sender, instance, **kwargs):
+    """Меняет число волонтёров проекта и список проектов, скрытых от волонтёра"""
+    _invalidate_project_catalog(project_ids=[instance.project_id], user_id=instance.volunteer_id)
+
 def __init__(self, *args, **kwargs):
     super().__init__(*args, **kwargs)
     self._original_is_organizer = self.is_organizer
\ No newline at end of file
@@ -0,0 +1,837 @@
+"""Общий слой доступа к данным для обработчиков бота.
+
+Простые запросы используют асинхронный ORM Django (aget, acreate, acount, async for).
+Составные операции (транзакции, теги) выполняются синхронно в ограниченном пуле потоков
+без thread_sensitive: запросы разных пользователей не выстраиваются в очередь к одному
+потоку, а соединения в потоках пула закрываются по CONN_MAX_AGE через close_old_connections.
+"""
+import difflib
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, prefetch_related_objects
+from django.utils import timezone
+
+from core.cache import MISSING, user_cache
+from core import geo, search
+from core.catalog import project_catalog
+from core.deadlines import START_REMINDER
+from core.models import (
+    User, Project, Tag, VolunteerProject, normalize_tag, Task, TaskAssignment, Photo, Broadcast, BroadcastDelivery, MediaFile, BotState,
+    rating_points, free_number,
+)
+
+logger = logging.getLogger(__name__)
+
+# Максимальное количество проектов для волонтёра
+MAX_PROJECTS_PER_VOLUNTEER = settings.MAX_PROJECTS_PER_VOLUNTEER
+
+# Результаты create_volunteer_project
+JOINED = 'joined'
+PROJECT_FULL = 'full'
+LIMIT_REACHED = 'limit_reached'
+ALREADY_JOINED = 'already_joined'
+PROJECT_UNAVAILABLE = 'unavailable'
+
+# Сколько раз выбрать место заново, если его одновременно занял другой волонтёр
+JOIN_ATTEMPTS = 10
+
+_db_executor = None
+
+
+def get_db_executor():
+    global _db_executor
+    if _db_executor is None:
+        _db_executor = ThreadPoolExecutor(
+            max_workers=settings.DB_THREAD_POOL_SIZE,
+            thread_name_prefix='db'
+        )
+    return _db_executor
+
+
+def shutdown_db_executor():
+    global _db_executor
+    if _db_executor is not None:
+        _db_executor.shutdown(wait=True)
+        _db_executor = None
+
+
+def db_sync(func):
+    """Превращает синхронную функцию работы с БД в корутину, выполняемую в пуле потоков.
+
+    При DB_THREAD_POOL_SIZE = 0 функция выполняется как обычный sync_to_async (в одном
+    потоке) — это нужно тестам, где данные видны только внутри транзакции основного потока.
+
+    Поэтому сигналы моделей, сохраняемых в db_sync-функциях, срабатывают в потоках пула, а
+    сохранённых в админке — в потоках веб-сервера, тогда как обработчики читают те же данные из
+    цикла событий. Общие структуры процесса, которые эти сигналы обновляют (user_cache,
+    project_catalog, deadline_queue), защищают своё состояние собственной блокировкой.
+    """
+    def run_with_connection(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if settings.DB_THREAD_POOL_SIZE <= 0:
+            return await sync_to_async(func)(*args, **kwargs)
+        return await sync_to_async(
+            run_with_connection, thread_sensitive=False, executor=get_db_executor()
+        )(*args, **kwargs)
+    return wrapper
+
+
+# Пользователи
+
+async def get_user(telegram_id):
+    cached = user_cache.get(telegram_id)
+    if cached is MISSING:
+        logger.debug("User not found with telegram_id: %s (cached)", telegram_id)
+        return None
+    if cached is not None:
+        logger.debug("User found: %s (telegram_id: %s, cached)", cached.username, telegram_id)
+        return cached
+
+    version = user_cache.version
+    try:
+        user = await User.objects.aget(telegram_id=telegram_id)
+        logger.info("User found: %s (telegram_id: %s)", user.username, telegram_id)
+    except User.DoesNotExist:
+        logger.warning("User not found with telegram_id: %s", telegram_id)
+        user = None
+    user_cache.set(telegram_id, user, version)
+    return user
+
+
+async def create_user(telegram_id, phone_number, username, is_organizer=False, organization_name=None):
+    try:
+        user = await User.objects.acreate(
+            telegram_id=telegram_id,
+            phone_number=phone_number,
+            username=username,
+            rating=0,
+            is_organizer=is_organizer,
+            organization_name=organization_name
+        )
+        logger.info("User created: %s (telegram_id: %s, phone: %s, org: %s)", username, telegram_id, phone_number, organization_name)
+        return user
+    except Exception as e:
+        logger.error("Error creating user: %s", e, exc_info=True)
+        return None
+
+
+async def mark_bot_unblocked(user):
+    """Пользователь снова написал боту — рассылки ему можно отправлять"""
+    if user.bot_blocked:
+        user.bot_blocked = False
+        await user.asave(update_fields=['bot_blocked'])
+        logger.info("User %s unblocked the bot", user.username)
+
+
+async def get_admin():
+    try:
+        admin = await User.objects.filter(is_staff=True).afirst()
+        if admin:
+            logger.info("Admin found: %s", admin.username)
+            return admin
+        else:
+            logger.warning("No admin found")
+            return None
+    except Exception as e:
+        logger.error("Error fetching admin: %s", e, exc_info=True)
+        return None
+
+
+async def get_users_by_ids(user_ids):
+    """Пользователи по списку id в том же порядке (отсутствующие пропускаются)"""
+    users = {user.id: user async for user in User.objects.filter(id__in=user_ids)}
+    return [users[user_id] for user_id in user_ids if user_id in users]
+
+
+# Проекты и участие волонтёров
+
+@db_sync
+def create_project(title, description, city, tags, creator, latitude=None, longitude=None):
+    logger.info("Creating project: %s by %s", title, creator.username)
+    try:
+        with transaction.atomic():
+            project = Project.objects.create(
+                title=title,
+                description=description,
+                city=city,
+                creator=creator,
+                latitude=latitude,
+                longitude=longitude,
+                status='pending'
+            )
+            project.tags.add(*Tag.objects.for_names(tags))
+        logger.info("Project created: %s (id: %s)", project.title, project.id)
+        return project
+    except Exception as e:
+        logger.error("Error creating project: %s", e, exc_info=True)
+        raise
+
+
+@db_sync
+def suggest_tags(names, limit=3):
+    """Похожие существующие теги для новых тегов из names: продолжения («эко» -> «экология»)
+    и почти совпадающие («экологя» -> «экология»), сначала популярные.
+
+    Возвращает {нормализованное название: [похожие теги]} только для тегов, которых ещё нет.
+    """
+    names = list(dict.fromkeys(filter(None, map(normalize_tag, names))))
+    existing = set(Tag.objects.filter(name__in=names).values_list('name', flat=True))
+    suggestions = {}
+    for name in names:
+        if name in existing:
+            continue
+        # Кандидаты по первым буквам: опечатки обычно бывают дальше начала слова
+        candidates = list(
+            Tag.objects.filter(name__startswith=name[:2]).annotate(projects_total=Count('project_tags'))
+            .order_by('-projects_total', 'name').values_list('name', flat=True)[:200]
+        )
+        similar = [candidate for candidate in candidates if candidate.startswith(name)]
+        similar += difflib.get_close_matches(name, candidates, n=limit, cutoff=0.75)
+        similar = list(dict.fromkeys(similar))[:limit]
+        if similar:
+            suggestions[name] = similar
+    logger.info("Tag suggestions for %s: %s", names, suggestions)
+    return suggestions
+
+
+async def get_project(project_id):
+    try:
+        return await Project.objects.select_related('creator').aget(id=project_id)
+    except Project.DoesNotExist:
+        logger.warning("Project %s not found", project_id)
+        return None
+
+
+@db_sync
+def get_approved_projects(volunteer, city=None, tag=None):
+    logger.info("Fetching approved projects for volunteer %s (city=%s, tag=%s)", volunteer.username, city, tag)
+    projects = Project.objects.filter(status='approved')
+    if city:
+        projects = projects.filter(city__iexact=city)
+    if tag:
+        projects = projects.tagged([tag])
+
+    joined_project_ids = VolunteerProject.objects.filter(volunteer=volunteer).values_list('project__id', flat=True)
+    # Теги всех проектов одним запросом вместо запроса на каждый проект
+    projects = projects.exclude(id__in=joined_project_ids).prefetch_related('tags')
+
+    result = [(project, project.title, project.city, [tag.name for tag in project.tags.all()]) for project in projects]
+    logger.info("Found %s approved projects for volunteer %s", len(result), volunteer.username)
+    return result
+
+
+CURSOR_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def encode_project_cursor(project):
+    """Позиция проекта в каталоге для callback_data: '<микросекунды created_at>_<id>'"""
+    return f"{(project.created_at - CURSOR_EPOCH) // timedelta(microseconds=1)}_{project.id}"
+
+
+def decode_project_cursor(cursor):
+    micros, project_id = cursor.split('_')
+    return CURSOR_EPOCH + timedelta(microseconds=int(micros)), int(project_id)
+
+
+@db_sync
+def refresh_project_catalog(volunteer):
+    return project_catalog.refresh(user_id=volunteer.pk)
+
+
+async def get_catalog_joined(volunteer):
+    """Обновляет устаревший каталог и возвращает проекты волонтёра (без запросов, если всё в кэше)"""
+    joined = None if project_catalog.needs_refresh() else project_catalog.get_joined(volunteer.pk)
+    if joined is None:
+        joined = await refresh_project_catalog(volunteer)
+    return joined
+
+
+async def get_approved_projects_page(volunteer, city=None, tag=None, after=None, before=None, limit=5):
+    """Страница каталога одобренных проектов, в которых волонтёр ещё не участвует.
+
+    Проекты упорядочены от новых к старым по (created_at, id). after — курсор последнего
+    проекта текущей страницы (следующая страница), before — курсор первого (предыдущая).
+    Возвращает (список (project, title, city, теги), есть ли ещё страницы в этом направлении);
+    при включённом каталоге (core/catalog.py) вместо project — строка каталога с id и created_at.
+    """
+    if not project_catalog.enabled:
+        return await _get_approved_projects_page(volunteer, city, tag, after, before, limit)
+
+    joined = await get_catalog_joined(volunteer)
+    result = project_catalog.page(
+        joined, city=city, tag=normalize_tag(tag) if tag else None,
+        after=decode_project_cursor(after) if after else None,
+        before=decode_project_cursor(before) if before else None,
+        limit=limit
+    )
+    logger.debug("Catalog page for %s from cache: %s projects (after=%s, before=%s)", volunteer.username, len(result[0]), after, before)
+    return result
+
+
+@db_sync
+def _get_approved_projects_page(volunteer, city, tag, after, before, limit):
+    """Страница каталога запросом к БД: читается limit + 1 строк по индексу, поэтому время
+    не зависит от размера каталога"""
+    projects = Project.objects.filter(status='approved').exclude(
+        Exists(VolunteerProject.objects.filter(volunteer=volunteer, project=OuterRef('pk')))
+    )
+    if city:
+        projects = projects.filter(city__iexact=city)
+    if tag:
+        projects = projects.tagged([tag])
+
+    if after:
+        created_at, project_id = decode_project_cursor(after)
+        projects = projects.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=project_id)
+        ).order_by('-created_at', '-id')
+    elif before:
+        created_at, project_id = decode_project_cursor(before)
+        projects = projects.filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=project_id)
+        ).order_by('created_at', 'id')
+    else:
+        projects = projects.order_by('-created_at', '-id')
+
+    page = list(projects.prefetch_related('tags')[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+    if before:
+        page.reverse()
+    logger.debug("Catalog page for %s: %s projects (after=%s, before=%s)", volunteer.username, len(page), after, before)
+    return [(project, project.title, project.city, [tag.name for tag in project.tags.all()]) for project in page], has_more
+
+
+async def get_nearest_projects(volunteer, latitude, longitude, limit=5):
+    """Ближайшие к точке одобренные проекты с координатами, в которых волонтёр ещё не участвует.
+
+    Возвращает список (project, title, city, теги, расстояние в км) от ближайшего, не дальше
+    geo.MAX_DISTANCE_KM. При включённом каталоге ответ строится по сетке в памяти без запросов.
+    """
+    if project_catalog.enabled:
+        joined = await get_catalog_joined(volunteer)
+        result = project_catalog.nearest(joined, latitude, longitude, limit=limit)
+    else:
+        result = await _get_nearest_projects(volunteer, latitude, longitude, limit)
+    logger.info("Found %s projects near (%.4f, %.4f) for %s", len(result), latitude, longitude, volunteer.username)
+    return result
+
+
+@db_sync
+def _get_nearest_projects(volunteer, latitude, longitude, limit):
+    min_lat, max_lat, min_lon, max_lon = geo.bounding_box(latitude, longitude, geo.MAX_DISTANCE_KM)
+    projects = Project.objects.filter(
+        status='approved', latitude__range=(min_lat, max_lat), longitude__range=(min_lon, max_lon)
+    ).exclude(
+        Exists(VolunteerProject.objects.filter(volunteer=volunteer, project=OuterRef('pk')))
+    )
+    found = sorted(
+        (geo.haversine_km(latitude, longitude, project.latitude, project.longitude), project.id, project)
+        for project in projects
+    )
+    found = [(distance, project) for distance, _, project in found if distance <= geo.MAX_DISTANCE_KM][:limit]
+    prefetch_related_objects([project for _, project in found], 'tags')
+    return [(project, project.title, project.city, [tag.name for tag in project.tags.all()], distance) for distance, project in found]
+
+
+@db_sync
+def search_approved_projects(volunteer, text, page=0, limit=5):
+    """Одобренные проекты, подходящие под text, без проектов волонтёра: от самых релевантных.
+
+    Ищет по индексу FTS5 (core/search.py); страница — номер от 0. Возвращает тот же формат,
+    что get_approved_projects_page.
+    """
+    if search.is_available():
+        ids = search.search_project_ids(text, exclude_volunteer=volunteer, offset=page * limit, limit=limit + 1)
+        projects = Project.objects.filter(id__in=ids[:limit]).prefetch_related('tags').in_bulk()
+        page_projects = [projects[project_id] for project_id in ids[:limit] if project_id in projects]
+        has_more = len(ids) > limit
+    else:
+        # Без SQLite индекса нет: все слова ищутся подстрокой, от новых проектов к старым
+        words = search.query_words(text)
+        projects = Project.objects.filter(status='approved').exclude(
+            Exists(VolunteerProject.objects.filter(volunteer=volunteer, project=OuterRef('pk')))
+        )
+        for word in words:
+            projects = projects.filter(
+                Q(title__icontains=word) | Q(description__icontains=word) | Q(city__icontains=word)
+                | Q(tags__name__icontains=word)
+            )
+        found = list(
+            projects.distinct().order_by('-created_at', '-id').prefetch_related('tags')[page * limit:(page + 1) * limit + 1]
+        ) if words else []
+        page_projects, has_more = found[:limit], len(found) > limit
+    logger.info("Search %r for %s: %s projects on page %s", text, volunteer.username, len(page_projects), page)
+    return [(project, project.title, project.city, [tag.name for tag in project.tags.all()]) for project in page_projects], has_more
+
+
+async def get_organizer_projects(organizer):
+    logger.info("Fetching projects for organizer: %s", organizer.username)
+    try:
+        result = [(project, project.title) async for project in Project.objects.filter(creator=organizer, status='approved')]
+        logger.info("Found %s projects for organizer %s", len(result), organizer.username)
+        return result
+    except Exception as e:
+        logger.error("Error fetching organizer projects: %s", e, exc_info=True)
+        raise
+
+
+async def get_volunteers_for_project(creator):
+    logger.info("Fetching volunteers for creator: %s", creator.username)
+    try:
+        # Два запроса вместо prefetch_related: prefetch передаёт id всех проектов в IN (...),
+        # а у организатора с тысячами проектов такой запрос упирается в лимиты SQLite
+        volunteers = {}
+        async for project_id, username in VolunteerProject.objects.filter(
+            project__creator=creator
+        ).values_list('project_id', 'volunteer__username').order_by('id'):
+            volunteers.setdefault(project_id, []).append(username)
+        result = [
+            (title, volunteers.get(project_id, []))
+            async for project_id, title in Project.objects.filter(creator=creator).values_list('id', 'title')
+        ]
+        logger.info("Found %s projects with volunteers for %s", len(result), creator.username)
+        return result
+    except Exception as e:
+        logger.error("Error fetching volunteers: %s", e, exc_info=True)
+        raise
+
+
+async def get_project_volunteers(project):
+    logger.info("Fetching volunteers for project: %s (id: %s)", project.title, project.id)
+    try:
+        volunteer_projects = [
+            vp async for vp in VolunteerProject.objects.filter(project=project, is_active=True).select_related('volunteer')
+        ]
+        logger.info("Found %s VolunteerProject records", len(volunteer_projects))
+        result = []
+        for vp in volunteer_projects:
+            if vp.volunteer:
+                logger.info("Found volunteer: %s (telegram_id: %s)", vp.volunteer.username, vp.volunteer.telegram_id)
+                result.append((vp.volunteer, vp.volunteer.username, vp.volunteer.telegram_id))
+            else:
+                logger.warning("VolunteerProject %s has no volunteer", vp.id)
+        logger.info("Total volunteers found: %s", len(result))
+        return result
+    except Exception as e:
+        logger.error("Error fetching project volunteers: %s", e, exc_info=True)
+        raise
+
+
+async def get_project_memberships(project):
+    return [vp async for vp in VolunteerProject.objects.filter(project=project).select_related('volunteer')]
+
+
+async def get_volunteer_projects(volunteer):
+    logger.info("Fetching projects for volunteer %s", volunteer.username)
+    result = [
+        (vp, vp.project.title)
+        async for vp in VolunteerProject.objects.filter(volunteer=volunteer).select_related('project')
+    ]
+    logger.info("Found %s projects for volunteer %s", len(result), volunteer.username)
+    return result
+
+
+async def get_active_tasks(volunteer, limit=10):
+    """Ближайшие по сроку задания, которые волонтёр ещё может выполнить"""
+    return [
+        task async for task in Task.objects.active_for(volunteer).select_related('project')
+        .order_by(F('deadline').asc(nulls_last=True), 'id')[:limit]
+    ]
+
+
+def _allocate_seat(volunteer, project_id):
+    project = Project.objects.filter(pk=project_id, status='approved').only('id', 'title', 'capacity').first()
+    if project is None:
+        return PROJECT_UNAVAILABLE, None
+
+    seats, slots = [], []
+    for member_project_id, member_id, seat, slot in VolunteerProject.objects.filter(
+        Q(project=project) | Q(volunteer=volunteer)
+    ).values_list('project_id', 'volunteer_id', 'seat', 'slot'):
+        if member_project_id == project.id and member_id == volunteer.pk:
+            return ALREADY_JOINED, project
+        if member_project_id == project.id:
+            seats.append(seat)
+        else:
+            slots.append(slot)
+
+    slot = free_number(slots, MAX_PROJECTS_PER_VOLUNTEER)
+    if slot is None:
+        return LIMIT_REACHED, project
+    seat = None
+    if project.capacity is not None:
+        seat = free_number(seats, project.capacity)
+        if seat is None:
+            return PROJECT_FULL, project
+
+    VolunteerProject.objects.create(volunteer=volunteer, project=project, seat=seat, slot=slot)
+    return JOINED, project
+
+
+@db_sync
+def create_volunteer_project(volunteer, project_id):
+    """Записывает волонтёра в одобренный проект, если в проекте есть место, а у волонтёра — лимит.
+
+    Участие получает номер места в проекте (1..capacity) и номер участия волонтёра
+    (1..MAX_PROJECTS_PER_VOLUNTEER), см. core.models.free_number. Уникальные ограничения
+    (project, seat) и (volunteer, slot) в БД не дают одновременным вступлениям занять одно
+    место: проигравшая транзакция откатывается и выбирает номер заново.
+    Возвращает (результат, проект): JOINED, PROJECT_FULL, LIMIT_REACHED, ALREADY_JOINED
+    или PROJECT_UNAVAILABLE (проекта нет или он не одобрен; проект тогда None).
+    """
+    for attempt in range(1, JOIN_ATTEMPTS + 1):
+        try:
+            with transaction.atomic():
+                result, project = _allocate_seat(volunteer, project_id)
+        except IntegrityError as e:
+            logger.info("Seat conflict for %s in project %s (attempt %s): %s", volunteer.username, project_id, attempt, e)
+            continue
+        logger.info("Join of %s to project %s: %s", volunteer.username, project_id, result)
+        return result, project
+    logger.warning("Volunteer %s could not get a seat in project %s after %s attempts", volunteer.username, project_id, JOIN_ATTEMPTS)
+    project = Project.objects.filter(pk=project_id).only('id', 'title').first()
+    return PROJECT_FULL if project else PROJECT_UNAVAILABLE, project
+
+
+async def get_volunteer_project(volunteer_project_id, volunteer):
+    try:
+        return await VolunteerProject.objects.aget(id=volunteer_project_id, volunteer=volunteer)
+    except VolunteerProject.DoesNotExist:
+        return None
+
+
+async def delete_volunteer_project(volunteer_project):
+    logger.info("Deleting volunteer project %s", volunteer_project.id)
+    await volunteer_project.adelete()
+    logger.info("Volunteer project %s deleted", volunteer_project.id)
+
+
+# Задания
+
+async def create_task(project, creator, text, deadline_date, start_time, end_time, photo_path=None):
+    logger.info("Creating task for project: %s by %s", project.title, creator.username)
+    try:
+        task = await Task.objects.acreate(
+            project=project, creator=creator, text=text, deadline_date=deadline_date,
+            start_time=start_time, end_time=end_time, task_image=photo_path or None
+        )
+        logger.info("Task created: %s", task.id)
+        return task
+    except Exception as e:
+        logger.error("Error creating task: %s", e, exc_info=True)
+        raise
+
+
+async def get_task(task_id):
+    try:
+        task = await Task.objects.select_related('project__creator').aget(id=task_id)
+        logger.info("Task %s loaded with project and creator", task_id)
+        return task
+    except Task.DoesNotExist:
+        logger.warning("Task %s not found", task_id)
+        return None
+
+
+async def get_task_assignment(task, volunteer):
+    try:
+        return await TaskAssignment.objects.aget(task=task, volunteer=volunteer)
+    except TaskAssignment.DoesNotExist:
+        logger.error("TaskAssignment not found for task %s and volunteer %s", task.id, volunteer.username)
+        return None
+
+
+async def update_task_assignment(task, volunteer, accepted=None, completed=None):
+    assignment = await get_task_assignment(task, volunteer)
+    if assignment is None:
+        return None
+    if accepted is not None:
+        assignment.accepted = accepted
+    if completed is not None:
+        assignment.completed = completed
+        assignment.completed_at = timezone.now()
+    await assignment.asave()
+    return assignment
+
+
+# Фотоотчёты
+
+async def create_photo(volunteer, project, file_path, task=None, file_id=None, file_unique_id=None):
+    logger.info("Creating photo for volunteer %s in project %s", volunteer.username, project.title)
+    photo = await Photo.objects.acreate(
+        volunteer=volunteer, project=project, image=file_path, status='pending', task=task,
+        file_id=file_id, file_unique_id=file_unique_id
+    )
+    logger.info("Photo created: %s", photo.id)
+    return photo
+
+
+async def get_photo(photo_id):
+    return await Photo.objects.select_related('volunteer', 'project', 'task').aget(id=photo_id)
+
+
+async def get_pending_photos_for_organizer(organizer, page, per_page):
+    logger.info("Fetching pending photos for organizer: %s, page: %s", organizer.username, page)
+    try:
+        photos = Photo.objects.filter(project__creator=organizer, status='pending').select_related('volunteer', 'project', 'task')
+        total = await photos.acount()
+        result = [
+            (photo, photo.volunteer.username, photo.project.title, photo.task)
+            async for photo in photos[page * per_page:(page + 1) * per_page]
+        ]
+        logger.info("Found %s pending photos for organizer %s on page %s", len(result), organizer.username, page)
+        return result, total
+    except Exception as e:
+        logger.error("Error fetching pending photos: %s", e, exc_info=True)
+        raise
+
+
+async def approve_photo(photo):
+    logger.info("Approving photo from %s for project %s", photo.volunteer.username, photo.project.title)
+    try:
+        photo.status = 'approved'
+        photo.moderated_at = timezone.now()
+        await photo.asave()
+        logger.info("Photo approved: %s", photo.id)
+    except Exception as e:
+        logger.error("Error approving photo: %s", e, exc_info=True)
+        raise
+
+
+
+@db_sync
+def rate_volunteer(volunteer, stars, source, photo=None, assignment=None):
+    """Начисляет волонтёру баллы за оценку stars через журнал рейтинга; возвращает новый рейтинг"""
+    rating = volunteer.update_rating(rating_points(stars), source=source, stars=stars, photo=photo, assignment=assignment)
+    logger.info("Volunteer %s rated %s stars (%s), rating is now %s", volunteer.username, stars, source, rating)
+    return rating
+
+
+# Медиафайлы, загруженные в Telegram
+
+async def get_media_file(path):
+    return await MediaFile.objects.filter(path=path).afirst()
+
+
+async def get_media_file_by_unique_id(file_unique_id):
+    return await MediaFile.objects.filter(file_unique_id=file_unique_id).afirst()
+
+
+async def find_file_id_by_hash(sha256):
+    """file_id любого файла с тем же содержимым (один и тот же снимок мог сохраниться под разными путями)"""
+    return await MediaFile.objects.filter(sha256=sha256, file_id__isnull=False).values_list('file_id', flat=True).afirst()
+
+
+async def register_media_file(path, sha256, size, file_id=None, file_unique_id=None):
+    media_file, created = await MediaFile.objects.aupdate_or_create(
+        path=path,
+        defaults={'sha256': sha256, 'size': size, 'file_id': file_id, 'file_unique_id': file_unique_id}
+    )
+    logger.info("Media file %s: %s (file_id: %s)", 'registered' if created else 'updated', path, file_id)
+    return media_file
+
+
+async def clear_media_file_id(file_id):
+    """Telegram больше не принимает file_id — файлы будут загружены заново"""
+    await MediaFile.objects.filter(file_id=file_id).aupdate(file_id=None)
+
+
+# Рассылки
+
+def _create_broadcast(recipients, text, kind, creator=None, task=None, photo=None, buttons=None):
+    """Создаёт рассылку и записи о доставке для каждого получателя (вызывать внутри транзакции)"""
+    broadcast = Broadcast.objects.create(
+        kind=kind, task=task, creator=creator, text=text, photo=photo or None, buttons=buttons or [], status='pending'
+    )
+    recipients = [user for user in recipients if user.telegram_id]
+    # Флаг читаем из БД: экземпляры получателей могли быть загружены до блокировки
+    blocked_ids = set(
+        User.objects.filter(id__in=[user.id for user in recipients], bot_blocked=True).values_list('id', flat=True)
+    )
+    deliveries = [
+        BroadcastDelivery(
+            broadcast=broadcast,
+            user=user,
+            chat_id=user.telegram_id,
+            # Тем, кто заблокировал бота, не отправляем, но фиксируем в отчёте
+            status='blocked' if user.id in blocked_ids else 'pending'
+        )
+        for user in recipients
+    ]
+    BroadcastDelivery.objects.bulk_create(deliveries, batch_size=500)
+    return broadcast, len(deliveries)
+
+
+@db_sync
+def create_task_broadcast(task, volunteers, text, buttons):
+    """Назначает задание волонтёрам и создаёт рассылку о нём одной транзакцией"""
+    logger.info("Creating task broadcast for task %s to %s volunteers", task.id, len(volunteers))
+    with transaction.atomic():
+        TaskAssignment.objects.bulk_create(
+            [TaskAssignment(task=task, volunteer=volunteer) for volunteer in volunteers],
+            batch_size=500,
+            ignore_conflicts=True
+        )
+        broadcast, total = _create_broadcast(
+            volunteers, text, 'task', creator=task.creator, task=task, photo=task.task_image.name or None, buttons=buttons
+        )
+    logger.info("Broadcast %s created with %s deliveries", broadcast.id, total)
+    return broadcast
+
+
+@db_sync
+def get_pending_deadlines():
+    """Сроки активных заданий для очереди планировщика: (id, starts_at, deadline, start_reminded, end_reminded)"""
+    rows = list(
+        Task.objects.active().filter(deadline__isnull=False)
+        .values_list('id', 'starts_at', 'deadline', 'start_reminded', 'end_reminded')
+    )
+    logger.info("Loaded %s pending task deadlines", len(rows))
+    return rows
+
+
+@db_sync
+def expire_tasks(task_ids):
+    """Помечает истёкшими задания из task_ids, срок которых прошёл, и их невыполненные назначения.
+
+    Два UPDATE на всю пачку; возвращает id истёкших заданий.
+    """
+    with transaction.atomic():
+        expired_ids = list(
+            Task.objects.overdue().filter(id__in=task_ids)
+            .values_list('id', flat=True)
+        )
+        if expired_ids:
+            TaskAssignment.objects.filter(task_id__in=expired_ids, completed=False).update(expired=True)
+            Task.objects.filter(id__in=expired_ids).update(status='expired')
+    logger.info("Expired %s of %s tasks", len(expired_ids), len(task_ids))
+    return expired_ids
+
+
+@db_sync
+def create_task_reminders(task_ids, kind, make_text):
+    """Рассылки-напоминания о заданиях из task_ids волонтёрам, которые приняли и ещё не выполнили их.
+
+    kind — deadlines.START_REMINDER или deadlines.END_REMINDER, make_text(task, kind) — текст
+    напоминания. Напоминание отмечается отправленным в той же транзакции, поэтому после
+    перезапуска бота оно не повторится, а недоставленные сообщения дошлёт broadcast.py.
+    Возвращает id созданных рассылок.
+    """
+    field = 'start_reminded' if kind == START_REMINDER else 'end_reminded'
+    with transaction.atomic():
+        tasks = list(
+            Task.objects.active().filter(id__in=task_ids, **{field: False})
+            .select_related('project')
+        )
+        recipients = {}
+        for assignment in TaskAssignment.objects.filter(
+            task__in=tasks, accepted=True, completed=False
+        ).select_related('volunteer'):
+            recipients.setdefault(assignment.task_id, []).append(assignment.volunteer)
+
+        broadcast_ids = []
+        for task in tasks:
+            if task.id in recipients:
+                broadcast, _ = _create_broadcast(recipients[task.id], make_text(task, kind), 'reminder', task=task)
+                broadcast_ids.append(broadcast.id)
+        Task.objects.filter(id__in=[task.id for task in tasks]).update(**{field: True})
+    logger.info("Created %s %s reminder broadcasts for %s tasks", len(broadcast_ids), kind, len(tasks))
+    return broadcast_ids
+
+
+@db_sync
+def create_announcement(recipients, text, creator=None, photo=None):
+    with transaction.atomic():
+        broadcast, total = _create_broadcast(recipients, text, 'announcement', creator=creator, photo=photo)
+    logger.info("Announcement broadcast %s created with %s deliveries", broadcast.id, total)
+    return broadcast
+
+
+async def get_broadcast(broadcast_id):
+    return await Broadcast.objects.select_related('creator').aget(id=broadcast_id)
+
+
+async def get_unfinished_broadcast_ids():
+    return [broadcast_id async for broadcast_id in Broadcast.objects.exclude(status='completed').values_list('id', flat=True)]
+
+
+async def start_broadcast(broadcast):
+    if broadcast.status == 'pending':
+        broadcast.status = 'sending'
+        await broadcast.asave(update_fields=['status'])
+
+
+async def get_pending_deliveries(broadcast_id, after_id, limit):
+    """Следующая порция неотправленных доставок (курсор по id, чтобы не пропускать и не повторять)"""
+    return [
+        delivery
+        async for delivery in BroadcastDelivery.objects.filter(
+            broadcast_id=broadcast_id, status='pending', id__gt=after_id
+        ).order_by('id').only('id', 'user_id', 'chat_id', 'attempts')[:limit]
+    ]
+
+
+@db_sync
+def save_delivery_results(deliveries):
+    """Сохраняет результаты отправки пачкой; заблокировавших бота помечает в профиле"""
+    with transaction.atomic():
+        BroadcastDelivery.objects.bulk_update(deliveries, ['status', 'attempts', 'error', 'message_id', 'sent_at'])
+        blocked_user_ids = [d.user_id for d in deliveries if d.status == 'blocked']
+        if blocked_user_ids:
+            User.objects.filter(id__in=blocked_user_ids).update(bot_blocked=True)
+    # update() не отправляет post_save, поэтому кэш сбрасываем явно
+    for user_id in blocked_user_ids:
+        user_cache.invalidate(pk=user_id)
+
+
+@db_sync
+def complete_broadcast(broadcast_id):
+    """Завершает рассылку и возвращает количество доставок по статусам"""
+    counts = dict(
+        BroadcastDelivery.objects.filter(broadcast_id=broadcast_id)
+        .values_list('status').annotate(total=Count('id')).order_by()
+    )
+    if not counts.get('pending'):
+        Broadcast.objects.filter(id=broadcast_id).update(status='completed', completed_at=timezone.now())
+    return counts
+
+
+# Состояние бота между перезапусками (persistence.py)
+
+async def load_bot_state(kind):
+    """Все сохранённые записи вида kind: [(key, data), ...]"""
+    return [row async for row in BotState.objects.filter(kind=kind).values_list('key', 'data')]
+
+
+@db_sync
+def save_bot_state(changes):
+    """Сохраняет пачку изменений {(kind, key): data} одной транзакцией; data=None удаляет запись"""
+    updated = [BotState(kind=kind, key=key, data=data) for (kind, key), data in changes.items() if data is not None]
+    deleted = {}
+    for (kind, key), data in changes.items():
+        if data is None:
+            deleted.setdefault(kind, []).append(key)
+    with transaction.atomic():
+        if updated:
+            BotState.objects.bulk_create(
+                updated,
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=['kind', 'key'],
+                update_fields=['data', 'updated_at']
+            )
+        for kind, keys in deleted.items():
+            BotState.objects.filter(kind=kind, key__in=keys).delete()
@@ -0,0 +1,69 @@
+"""Полнотекстовый поиск по одобренным проектам (SQLite FTS5).
+
+Таблица core_project_search (миграция 0013) хранит название, описание, город и теги каждого
+одобренного проекта, rowid строки совпадает с id проекта. Её обновляют триггеры SQLite на
+core_project, core_projecttag и core_tag (миграция 0015), поэтому индекс не отстаёт и после
+bulk_create или queryset.update(). Токенизатор unicode61 приводит к нижнему регистру кириллицу, включая
+казахские буквы; «ё» заменяется на «е» отдельно (в триггерах и здесь), потому что unicode61
+снимает диакритику только с латиницы. Каждое слово запроса ищется по префиксу («парк»
+находит «парка», «парковая»), результаты упорядочены по bm25 с большим весом названия и тегов;
+ранжируются все совпадения, при равном ранге новые проекты идут первыми.
+"""
+import re
+
+from django.db import connection
+
+TABLE = 'core_project_search'
+
+# Веса колонок для bm25: title, description, city, tags
+RANK = f'bm25({TABLE}, 10.0, 1.0, 4.0, 6.0)'
+
+# Лишние слова запроса отбрасываются: каждое добавляет проход по индексу
+MAX_QUERY_WORDS = 8
+
+# Более короткие слова ищутся целиком: по префиксу из одной буквы совпадает почти всё
+MIN_PREFIX_LENGTH = 2
+
+WORD_RE = re.compile(r'\w+')
+
+
+def normalize(text):
+    return text.replace('ё', 'е').replace('Ё', 'Е')
+
+
+def query_words(text):
+    return WORD_RE.findall(normalize(text).casefold())[:MAX_QUERY_WORDS]
+
+
+def build_match_query(text):
+    """Запрос FTS5 из текста пользователя: все слова обязательны, каждое ищется по префиксу.
+
+    Слова берутся в кавычки, поэтому операторы FTS5 (AND, NEAR, *, ^) в тексте не работают
+    и не вызывают синтаксических ошибок. None — в тексте нет слов.
+    """
+    words = query_words(text)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' if len(word) >= MIN_PREFIX_LENGTH else f'"{word}"' for word in words)
+
+
+def is_available():
+    # Таблица и триггеры создаются только на SQLite
+    return connection.vendor == 'sqlite'
+
+
+def search_project_ids(text, exclude_volunteer=None, offset=0, limit=5):
+    """id одобренных проектов, подходящих под text, от самых релевантных"""
+    match = build_match_query(text)
+    if match is None:
+        return []
+    sql = f"SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s"
+    params = [match]
+    if exclude_volunteer is not None:
+        sql += " AND rowid NOT IN (SELECT project_id FROM core_volunteerproject WHERE volunteer_id = %s)"
+        params.append(exclude_volunteer.pk)
+    sql += f" ORDER BY {RANK}, rowid DESC LIMIT %s OFFSET %s"
+    params += [limit, offset]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
@@ -1,3 +1,1340 @@
-from django.test import TestCase
+"""Тесты бота и приложения core.
 
-# Create your tests here.
+Обработчики вызываются с поддельным ботом (FakeBot, make_update) без обращений к Telegram.
+HandlerQueryBudgetTests и AdminQueryBudgetTests проверяют бюджеты запросов к БД: каждый
+обработчик выполняется на небольшом наборе данных (SMALL строк в каждой таблице) и после его
+роста до LARGE, и число запросов не должно расти вместе с данными (N+1). Остальные классы —
+по одному на подсистему: обработка обновлений, кэши пользователей и каталога, рассылки,
+хранение фото и состояния бота, метрики, поиск, теги, места в проектах, сроки заданий,
+журнал рейтинга, вебхук и поиск проектов рядом.
+"""
+import asyncio
+import hashlib
+import itertools
+import os
+import random
+import tempfile
+import time as time_module
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from types import SimpleNamespace
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib import admin
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from telegram import Chat, Message, Update
+from telegram.error import BadRequest, Forbidden
+
+from broadcast import Broadcaster, TokenBucket
+import media_storage
+import metrics
+import organization_handlers
+from persistence import DatabasePersistence
+from media_registry import MediaRegistry, media_registry
+import scheduler
+from update_processor import ChatOrderedUpdateProcessor
+from webhook import TelegramWebhook, SECRET_HEADER
+import volunteer_handlers
+from core.admin import ProjectAdmin
+from core.cache import MISSING, UserCache, user_cache
+from core import derivatives, geo, search
+from core.catalog import project_catalog
+from core.deadlines import DeadlineQueue, START_REMINDER, END_REMINDER, EXPIRY
+from core.repository import (
+    encode_project_cursor, get_approved_projects_page, _get_approved_projects_page, search_approved_projects,
+    get_nearest_projects, _get_nearest_projects, suggest_tags, create_volunteer_project,
+    JOINED, PROJECT_FULL, LIMIT_REACHED, ALREADY_JOINED, PROJECT_UNAVAILABLE, expire_tasks, create_task_reminders,
+    rate_volunteer, free_number, get_user, create_task_broadcast,
+)
+from core.models import (
+    User, Project, Tag, ProjectTag, VolunteerProject, Task, TaskAssignment, Photo, Broadcast, BroadcastDelivery, RatingEvent,
+    MediaFile,
+)
+
+SMALL = 10
+LARGE = 10000
+
+_message_ids = itertools.count(1)
+
+
+class FakeBot:
+    """Записывает исходящие вызовы вместо отправки в Telegram"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls.append(('send_message', chat_id, text))
+        return SimpleNamespace(message_id=next(_message_ids))
+
+    async def send_photo(self, chat_id, photo, **kwargs):
+        self.calls.append(('send_photo', chat_id, photo))
+        return SimpleNamespace(
+            message_id=next(_message_ids),
+            photo=[SimpleNamespace(file_id='file-id', file_unique_id='file-unique-id')]
+        )
+
+
+class FakeMessage:
+    def __init__(self, bot, user, text=None):
+        self.bot = bot
+        self.from_user = user
+        self.chat_id = user.id
+        self.text = text
+        self.photo = None
+
+    async def reply_text(self, text, **kwargs):
+        return await self.bot.send_message(self.chat_id, text, **kwargs)
+
+    async def edit_text(self, text, **kwargs):
+        self.bot.calls.append(('edit_text', self.chat_id, text))
+
+    async def edit_caption(self, caption=None, **kwargs):
+        self.bot.calls.append(('edit_caption', self.chat_id, caption))
+
+
+class FakeQuery:
+    def __init__(self, data, message):
+        self.data = data
+        self.message = message
+        self.from_user = message.from_user
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+    async def edit_message_reply_markup(self, reply_markup=None, **kwargs):
+        self.message.bot.calls.append(('edit_reply_markup', self.message.chat_id, reply_markup))
+
+
+def make_update(telegram_id, data=None, text=None, user_data=None, photo=None):
+    """Обновление и контекст обработчика: callback_query с data или сообщение с text (или фото photo)"""
+    bot = FakeBot()
+    user = SimpleNamespace(id=int(telegram_id), username=f"user{telegram_id}", first_name='Test')
+    message = FakeMessage(bot, user, text)
+    message.photo = photo
+    query = FakeQuery(data, message) if data is not None else None
+    update = SimpleNamespace(
+        callback_query=query,
+        message=None if query else message,
+        effective_message=message,
+        effective_chat=SimpleNamespace(id=user.id),
+        effective_user=user,
+    )
+    context = SimpleNamespace(bot=bot, user_data=dict(user_data or {}), args=None, application=None)
+    return update, context
+
+
+def insert_batches(model, rows, batch_size=500):
+    """Сколько INSERT выполнит bulk_create для rows строк: SQLite ограничивает число параметров"""
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+    size = min(batch_size, connection.ops.bulk_batch_size(fields, [None] * rows))
+    return -(-rows // size)
+
+
+def seed(organizer, project, task, start, count):
+    """Добавляет count проектов организатора, волонтёров project, назначений task и фото на проверку"""
+    indexes = range(start, start + count)
+    projects = Project.objects.bulk_create([
+        Project(title=f'Project {i}', description='...', city='Almaty', creator=organizer, status='approved')
+        for i in indexes
+    ])
+    tags = Tag.objects.for_names(['clean', 'park'])
+    ProjectTag.objects.bulk_create([
+        ProjectTag(tag=tag, project=new_project) for new_project in projects for tag in tags
+    ])
+    volunteers = User.objects.bulk_create([
+        User(username=f'volunteer{i}', telegram_id=str(100000 + i)) for i in indexes
+    ])
+    VolunteerProject.objects.bulk_create([
+        VolunteerProject(volunteer=volunteer, project=project) for volunteer in volunteers
+    ])
+    TaskAssignment.objects.bulk_create([
+        TaskAssignment(task=task, volunteer=volunteer, accepted=True) for volunteer in volunteers
+    ])
+    Photo.objects.bulk_create([
+        Photo(
+            volunteer=volunteer, project=project, task=task, image=f'photos/{volunteer.id}.jpg',
+            file_id=f'file-{volunteer.id}', status='pending'
+        )
+        for volunteer in volunteers
+    ])
+
+
+@override_settings(DB_THREAD_POOL_SIZE=0)
+class HandlerQueryBudgetTests(TestCase):
+    ORGANIZER_ID = '1000'
+    VOLUNTEER_ID = '1001'
+    NEWCOMER_ID = '1002'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organizer = User.objects.create(
+            username='organizer', telegram_id=cls.ORGANIZER_ID, is_organizer=True, organization_name='Org'
+        )
+        cls.volunteer = User.objects.create(username='volunteer', telegram_id=cls.VOLUNTEER_ID)
+        cls.newcomer = User.objects.create(username='newcomer', telegram_id=cls.NEWCOMER_ID)
+        cls.project = Project.objects.create(
+            title='Main project', description='...', city='Almaty', creator=cls.organizer, status='approved'
+        )
+        cls.project.tags.add(*Tag.objects.for_names(['clean', 'park']))
+        VolunteerProject.objects.create(volunteer=cls.volunteer, project=cls.project)
+        cls.task = Task.objects.create(
+            project=cls.project, creator=cls.organizer, text='Clean the park',
+            deadline_date=date(2099, 1, 1), start_time=time(9), end_time=time(18)
+        )
+        TaskAssignment.objects.create(task=cls.task, volunteer=cls.volunteer)
+        seed(cls.organizer, cls.project, cls.task, 0, SMALL)
+
+    def run_handler(self, handler, telegram_id, data=None, text=None, user_data=None, photo=None):
+        """Вызывает обработчик с холодными кэшами пользователей и каталога и возвращает выполненные запросы"""
+        user_cache.clear()
+        project_catalog.clear()
+        update, context = make_update(telegram_id, data=data, text=text, user_data=user_data, photo=photo)
+        with CaptureQueriesContext(connection) as queries:
+            result = async_to_sync(handler)(update, context)
+        return SimpleNamespace(queries=queries.captured_queries, result=result, context=context)
+
+    def assertQueryBudget(self, budget, handler, telegram_id, data=None, text=None, user_data=None, extra=0,
+                          reset=None, photo=None):
+        """Обработчик укладывается в budget запросов на малых и больших данных.
+
+        extra — сколько запросов разрешено добавить на больших данных (например, пачки bulk_create);
+        reset — отменяет изменения первого вызова, чтобы второй прошёл по тому же пути.
+        """
+        small = self.run_handler(handler, telegram_id, data, text, user_data, photo)
+        if reset is not None:
+            reset()
+        seed(self.organizer, self.project, self.task, SMALL, LARGE - SMALL)
+        large = self.run_handler(handler, telegram_id, data, text, user_data, photo)
+        for run, rows, limit in ((small, SMALL, budget), (large, LARGE, budget + extra)):
+            if len(run.queries) > limit:
+                sql = '\n'.join(f"{i}. {query['sql'][:500]}" for i, query in enumerate(run.queries, start=1))
+                self.fail(
+                    f"{handler.__name__} executed {len(run.queries)} queries with {rows} rows, "
+                    f"budget is {limit}:\n{sql}"
+                )
+        if not extra:
+            self.assertEqual(
+                len(small.queries), len(large.queries),
+                f"{handler.__name__}: query count grows with data ({len(small.queries)} -> {len(large.queries)})"
+            )
+        return large
+
+    # volunteer_handlers.py
+
+    # Каталог проектов холодный: пользователь, три запроса каталога и проекты волонтёра
+
+    def test_list_projects(self):
+        self.assertQueryBudget(5, volunteer_handlers.list_projects, self.VOLUNTEER_ID, data='list_projects')
+
+    def test_project_pagination(self):
+        # Курсор страницы из исходных данных: новые проекты добавляются раньше него в каталоге
+        catalog = list(Project.objects.filter(status='approved').order_by('-created_at', '-id')[:10])
+        run = self.assertQueryBudget(
+            5, volunteer_handlers.handle_pagination, self.NEWCOMER_ID, data=f'next_0_{encode_project_cursor(catalog[4])}'
+        )
+        text = run.context.bot.calls[-1][2]
+        self.assertIn("страница 2", text)
+        for project in catalog[5:]:
+            self.assertIn(project.title, text)
+
+    def test_search_projects(self):
+        run = self.assertQueryBudget(4, volunteer_handlers.receive_search_query, self.NEWCOMER_ID, text='main proj')
+        self.assertIn('Main project', run.context.bot.calls[-1][2])
+
+    def test_join_project(self):
+        run = self.assertQueryBudget(5, volunteer_handlers.join_project, self.NEWCOMER_ID, data='join_project')
+        self.assertNotIn('projects', run.context.user_data)
+
+    def test_join_pagination(self):
+        catalog = list(Project.objects.filter(status='approved').order_by('-created_at', '-id')[:10])
+        run = self.assertQueryBudget(
+            5, volunteer_handlers.handle_join_pagination, self.NEWCOMER_ID,
+            data=f'join_next_0_{encode_project_cursor(catalog[4])}'
+        )
+        method, _, keyboard = run.context.bot.calls[-1]
+        self.assertEqual(method, 'edit_reply_markup')
+        buttons = [button.callback_data for row in keyboard.inline_keyboard for button in row]
+        self.assertEqual(buttons[:5], [f'join_id_{project.id}' for project in catalog[5:]])
+        self.assertTrue(buttons[5].startswith('join_prev_1_'))
+        self.assertTrue(buttons[6].startswith('join_next_1_'))
+
+    def test_handle_join_selection(self):
+        run = self.assertQueryBudget(
+            8, volunteer_handlers.handle_join_selection, self.NEWCOMER_ID, data=f'join_id_{self.project.id}',
+            reset=VolunteerProject.objects.filter(volunteer=self.newcomer).delete
+        )
+        self.assertIn(f"зарегистрированы в проекте: {self.project.title}", run.context.bot.calls[-1][2])
+
+    def test_leave_project(self):
+        self.assertQueryBudget(2, volunteer_handlers.leave_project, self.VOLUNTEER_ID, data='leave_project')
+
+    def test_profile(self):
+        self.assertQueryBudget(3, volunteer_handlers.profile, self.VOLUNTEER_ID, data='profile')
+
+    def test_task_accept(self):
+        self.assertQueryBudget(
+            4, volunteer_handlers.task_accept_decline, self.VOLUNTEER_ID, data=f'task_accept_{self.task.id}'
+        )
+
+    def test_task_completed(self):
+        run = self.assertQueryBudget(
+            4, volunteer_handlers.task_completed, self.VOLUNTEER_ID, data=f'task_completed_yes_{self.task.id}'
+        )
+        self.assertEqual(run.context.user_data['task_id'], self.task.id)
+
+    def test_task_photo_upload(self):
+        photo = [SimpleNamespace(file_id='upload-file-id', file_unique_id='upload-unique-id')]
+        with mock.patch('volunteer_handlers.save_telegram_photo', mock.AsyncMock(return_value='photos/upload.jpg')):
+            run = self.assertQueryBudget(
+                3, volunteer_handlers.task_photo_upload, self.VOLUNTEER_ID,
+                user_data={'task_id': self.task.id}, photo=photo
+            )
+        self.assertEqual(run.context.bot.calls[-1][:3], ('send_photo', self.ORGANIZER_ID, 'upload-file-id'))
+
+    # organization_handlers.py
+
+    def test_manage_volunteers(self):
+        self.assertQueryBudget(3, organization_handlers.manage_volunteers, self.ORGANIZER_ID, data='manage_volunteers')
+
+    def test_send_task_start(self):
+        self.assertQueryBudget(2, organization_handlers.send_task_start, self.ORGANIZER_ID, data='send_task')
+
+    def test_select_recipients(self):
+        user_data = {'selected_project_id': self.project.id}
+        self.assertQueryBudget(
+            2, organization_handlers.select_recipients, self.ORGANIZER_ID,
+            data='task_recipients_multiple', user_data=user_data
+        )
+
+    def confirm_task_user_data(self, recipients, selected_volunteers=()):
+        return {
+            'selected_project_id': self.project.id,
+            'task_text': 'New task',
+            'deadline_date': date(2099, 1, 1),
+            'start_time': time(9),
+            'end_time': time(18),
+            'task_photo': None,
+            'recipients': recipients,
+            'selected_volunteers': list(selected_volunteers),
+        }
+
+    def test_confirm_task_selected_volunteers(self):
+        user_data = self.confirm_task_user_data('task_recipients_multiple', [self.volunteer.id])
+        with mock.patch('organization_handlers.get_broadcaster'):
+            self.assertQueryBudget(
+                12, organization_handlers.confirm_task, self.ORGANIZER_ID,
+                data='task_confirm_send', user_data=user_data
+            )
+
+    def test_confirm_task_all_volunteers(self):
+        user_data = self.confirm_task_user_data('task_recipients_all')
+        # Назначения и доставки вставляются пачками: на LARGE строк добавляется
+        # по запросу на пачку, но не по запросу на волонтёра
+        batches = insert_batches(TaskAssignment, LARGE + 1) + insert_batches(BroadcastDelivery, LARGE + 1)
+        with mock.patch('organization_handlers.get_broadcaster'):
+            self.assertQueryBudget(
+                12, organization_handlers.confirm_task, self.ORGANIZER_ID,
+                data='task_confirm_send', user_data=user_data, extra=batches
+            )
+
+    def test_check_photos(self):
+        self.assertQueryBudget(4, organization_handlers.check_photos, self.ORGANIZER_ID, data='check_photos')
+
+    def test_photo_pagination(self):
+        self.assertQueryBudget(
+            4, organization_handlers.handle_photo_moderation_selection, self.ORGANIZER_ID, data='photo_next_0'
+        )
+
+    def test_approve_photo(self):
+        photo = Photo.objects.filter(status='pending').first()
+        user_data = {'pending_photos': [photo.id]}
+        self.assertQueryBudget(
+            3, organization_handlers.handle_photo_moderation_action, self.ORGANIZER_ID,
+            data='mod_photo_action_0_approve', user_data=user_data
+        )
+
+    def test_show_next_photo(self):
+        self.assertQueryBudget(
+            3, organization_handlers.show_next_photo, self.ORGANIZER_ID, data='photo_next_0', user_data={'photos_page': 1}
+        )
+
+    def test_rating_selection(self):
+        # Одобрение с оценкой: фото, запись в журнал рейтинга и следующее фото на проверку
+        photo = Photo.objects.filter(status='pending').first()
+        run = self.assertQueryBudget(
+            10, organization_handlers.handle_rating_selection, self.ORGANIZER_ID,
+            data='rating_5', user_data={'awaiting_rating_for': photo.id},
+            reset=lambda: Photo.objects.filter(id=photo.id).update(status='pending', rating=None)
+        )
+        self.assertEqual(RatingEvent.objects.filter(photo=photo, stars=5).count(), 2)
+        self.assertIn('5★', run.context.bot.calls[0][2])
+
+    def test_feedback_comment(self):
+        user_data = {'selected_task': self.task, 'selected_volunteer': self.volunteer, 'feedback_rating': 4}
+        self.assertQueryBudget(
+            7, organization_handlers.feedback_comment, self.ORGANIZER_ID, text='Отлично', user_data=user_data
+        )
+        self.assertEqual(RatingEvent.objects.filter(user=self.volunteer, source='task', stars=4).count(), 2)
+
+
+class ChatOrderedUpdateProcessorTests(SimpleTestCase):
+    """Обновления одного чата выполняются по порядку, разных чатов — параллельно в пределах лимита"""
+
+    def update(self, update_id, chat_id):
+        chat = Chat(id=chat_id, type='private')
+        return Update(update_id, message=Message(update_id, datetime(2024, 1, 1, tzinfo=dt_timezone.utc), chat))
+
+    async def test_order_and_concurrency(self):
+        processor = ChatOrderedUpdateProcessor(2)
+        finished, active, peak = [], set(), []
+
+        async def handle(update_id, chat_id):
+            active.add(update_id)
+            peak.append(len(active))
+            # Первое обновление чата дольше второго: без блокировки чата второе закончилось бы раньше
+            await asyncio.sleep(0.02 if update_id < 4 else 0.01)
+            active.discard(update_id)
+            finished.append((chat_id, update_id))
+
+        # Чаты 1, 2 и 3 вперемешку: по два обновления каждого
+        updates = [(1, 1), (2, 2), (3, 3), (4, 1), (5, 2), (6, 3)]
+        await asyncio.gather(*(
+            processor.process_update(self.update(update_id, chat_id), handle(update_id, chat_id))
+            for update_id, chat_id in updates
+        ))
+        for chat_id in (1, 2, 3):
+            self.assertEqual([u for c, u in finished if c == chat_id], [u for u, c in updates if c == chat_id])
+        self.assertEqual(max(peak), 2)
+        self.assertEqual(processor.pending_updates, 0)
+        self.assertEqual(processor._chat_locks, {})
+
+
+class TokenBucketTests(SimpleTestCase):
+    def acquire(self, bucket, count):
+        async def run():
+            started = time_module.monotonic()
+            for _ in range(count):
+                await bucket.acquire()
+            return time_module.monotonic() - started
+        return async_to_sync(run)()
+
+    def test_pacing(self):
+        bucket = TokenBucket(rate=50, capacity=2)
+        # Два токена запаса уходят сразу, дальше по одному каждые 20 мс
+        self.assertLess(self.acquire(bucket, 2), 0.01)
+        self.assertGreaterEqual(self.acquire(bucket, 5), 0.095)
+        bucket.pause(0.1)
+        self.assertGreaterEqual(self.acquire(bucket, 1), 0.095)
+
+
+@override_settings(DB_THREAD_POOL_SIZE=0)
+class BroadcasterTests(TestCase):
+    """Рассылка продолжается с неотправленных доставок, ошибки получателя её не останавливают"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organizer = User.objects.create(username='organizer', telegram_id='1000', is_organizer=True)
+        cls.volunteers = User.objects.bulk_create([
+            User(username=f'volunteer{i}', telegram_id=str(2000 + i)) for i in range(4)
+        ])
+        project = Project.objects.create(
+            title='Main project', description='...', city='Almaty', creator=cls.organizer, status='approved'
+        )
+        cls.task = Task.objects.create(project=project, creator=cls.organizer, text='Task')
+
+    def setUp(self):
+        self.broadcast = async_to_sync(create_task_broadcast)(self.task, self.volunteers, 'Новое задание', [])
+        self.enterContext(self.assertLogs('broadcast', 'INFO'))
+
+    def bot(self, fail=None):
+        """Бот, который записывает chat_id получателей (кроме отчёта организатору); fail(chat_id) — ошибка или None"""
+        sent = []
+
+        async def send_message(chat_id, text, **kwargs):
+            if chat_id != self.organizer.telegram_id:
+                error = fail and await fail(chat_id)
+                if error:
+                    raise error
+                sent.append(chat_id)
+            return SimpleNamespace(message_id=next(_message_ids))
+
+        return mock.Mock(send_message=mock.AsyncMock(side_effect=send_message)), sent
+
+    def broadcaster(self, bot):
+        return Broadcaster(bot, rate=1000, chat_rate=1000, workers=1)
+
+    def statuses(self):
+        return dict(BroadcastDelivery.objects.filter(broadcast=self.broadcast).values_list('chat_id', 'status'))
+
+    def test_interrupted_broadcast_resumes(self):
+        chat_ids = [user.telegram_id for user in self.volunteers]
+        stalled = asyncio.Event()
+
+        async def stall_third(chat_id):
+            if chat_id == chat_ids[2]:
+                stalled.set()
+                await asyncio.Event().wait()
+
+        async def scenario():
+            first_bot, first_sent = self.bot(stall_third)
+            first = self.broadcaster(first_bot)
+            first.start(self.broadcast.id)
+            await stalled.wait()
+            await first.stop()
+
+            second_bot, second_sent = self.bot()
+            second = self.broadcaster(second_bot)
+            await second.resume()
+            await asyncio.gather(*second._tasks.values())
+            return first_sent, second_sent
+
+        first_sent, second_sent = async_to_sync(scenario)()
+        self.assertEqual(first_sent, chat_ids[:2])
+        self.assertEqual(second_sent, chat_ids[2:])
+        self.assertEqual(set(self.statuses().values()), {'sent'})
+        self.assertEqual(Broadcast.objects.get(pk=self.broadcast.pk).status, 'completed')
+
+    def test_recipient_errors_do_not_stop_broadcast(self):
+        blocked, missing = self.volunteers[0].telegram_id, self.volunteers[1].telegram_id
+
+        async def fail(chat_id):
+            if chat_id == blocked:
+                return Forbidden('Forbidden: bot was blocked by the user')
+            if chat_id == missing:
+                return BadRequest('Chat not found')
+
+        bot, sent = self.bot(fail)
+
+        async def run():
+            await self.broadcaster(bot).start(self.broadcast.id)
+
+        async_to_sync(run)()
+        self.assertEqual(sent, [user.telegram_id for user in self.volunteers[2:]])
+        self.assertEqual(self.statuses()[blocked], 'blocked')
+        self.assertEqual(self.statuses()[missing], 'failed')
+        self.assertTrue(User.objects.get(telegram_id=blocked).bot_blocked)
+        self.assertEqual(Broadcast.objects.get(pk=self.broadcast.pk).status, 'completed')
+
+
+@override_settings(DB_THREAD_POOL_SIZE=0)
+class DatabasePersistenceTests(TestCase):
+    """user_data и шаги диалогов, сохранённые при остановке, читаются новым экземпляром без потерь"""
+
+    def test_round_trip(self):
+        user_data = {
+            'task_id': 7,
+            'deadline': date(2099, 1, 1),
+            'start': time(9, 30),
+            'created': datetime(2024, 5, 1, 12, 0, tzinfo=dt_timezone.utc),
+            'cities': ['Алматы'],
+        }
+
+        async def save():
+            persistence = DatabasePersistence()
+            await persistence.update_user_data(42, {**user_data, 'bot': FakeBot()})
+            await persistence.update_user_data(43, {'task_id': 8})
+            await persistence.update_conversation('create_task', (42, 42), 3)
+            await persistence.update_conversation('create_task', (43, 43), 5)
+            await persistence.drop_user_data(43)
+            await persistence.update_conversation('create_task', (43, 43), None)
+            await persistence.flush()
+
+        async def load():
+            persistence = DatabasePersistence()
+            return await persistence.get_user_data(), await persistence.get_conversations('create_task')
+
+        with self.assertLogs('persistence', 'ERROR') as logs:
+            async_to_sync(save)()
+        self.assertIn("Skipping non-serializable user_data['bot']", logs.output[0])
+        self.assertEqual(async_to_sync(load)(), ({42: user_data}, {(42, 42): 3}))
+
+
+class MetricsTests(TestCase):
+    """Текст метрик: накопительные корзины гистограмм, экранирование меток и запросы к БД за вызов"""
+
+    def setUp(self):
+        if metrics._db_execute_wrapper not in connection.execute_wrappers:
+            # Соединение тестовой БД могло открыться до импорта metrics
+            self.enterContext(connection.execute_wrapper(metrics._db_execute_wrapper))
+
+    def test_handler_metrics(self):
+        async def handler(update, context):
+            if context == 'fail':
+                raise ValueError('boom')
+            return await User.objects.acount()
+
+        wrapped = metrics.instrument_callback(handler, conversation='join "new"\\', state=1)
+        self.assertIs(metrics.instrument_callback(wrapped), wrapped)
+        async_to_sync(wrapped)(None, None)
+        with self.assertRaises(ValueError):
+            async_to_sync(wrapped)(None, 'fail')
+
+        lines = metrics.registry.render().splitlines()
+        labels = 'handler="handler",conversation="join \\"new\\"\\\\",state="1"'
+        self.assertIn(f'bot_handler_errors_total{{{labels},error="ValueError"}} 1', lines)
+        # Один вызов выполнил запрос, второй — нет
+        for le, count in (('0', 1), ('1', 2), ('2', 2), ('100', 2), ('+Inf', 2)):
+            self.assertIn(f'bot_handler_db_queries_bucket{{{labels},le="{le}"}} {count}', lines)
+        self.assertIn(f'bot_handler_db_queries_sum{{{labels}}} 1.0', lines)
+        self.assertIn(f'bot_handler_db_queries_count{{{labels}}} 2', lines)
+        self.assertIn('# TYPE bot_db_queries_total counter', lines)
+        self.assertTrue(any(line.startswith('bot_db_queries_total{alias="default"} ') for line in lines))
+
+
+class UserCacheTests(SimpleTestCase):
+    """LRU-кэш пользователей: счётчики, отрицательные записи, срок жизни и вытеснение"""
+
+    def setUp(self):
+        self.now = 1000.0
+        self.enterContext(mock.patch('core.cache.time.monotonic', side_effect=lambda: self.now))
+        self.cache = UserCache(max_size=2, ttl=60)
+
+    def user(self, pk):
+        return User(pk=pk, username=f'user{pk}', telegram_id=str(pk))
+
+    def test_hits_and_misses(self):
+        self.assertIsNone(self.cache.get(1))
+        self.cache.set(1, self.user(1))
+        self.assertEqual(self.cache.get('1').username, 'user1')
+        self.assertEqual(self.cache.stats(), {'size': 1, 'hits': 1, 'misses': 1, 'evictions': 0, 'hit_ratio': 0.5})
+
+    def test_missing_user_is_cached(self):
+        self.cache.set(1, None)
+        self.assertIs(self.cache.get(1), MISSING)
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_entries_expire(self):
+        self.cache.set(1, self.user(1))
+        self.now += 59
+        self.assertIsNotNone(self.cache.get(1))
+        self.now += 1
+        self.assertIsNone(self.cache.get(1))
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.set(1, self.user(1))
+        self.cache.set(2, self.user(2))
+        self.cache.get(1)
+        self.cache.set(3, self.user(3))
+        self.assertIsNone(self.cache.get(2))
+        self.assertIsNotNone(self.cache.get(1))
+        self.assertEqual(self.cache.evictions, 1)
+
+    def test_stale_read_is_not_cached(self):
+        version = self.cache.version
+        self.cache.invalidate(pk=1)
+        self.cache.set(1, self.user(1), version)
+        self.assertIsNone(self.cache.get(1))
+
+
+@override_settings(DB_THREAD_POOL_SIZE=0)
+class UserCacheInvalidationTests(TestCase):
+    """Сигналы модели User и действия админки сбрасывают кэш get_user"""
+
+    def setUp(self):
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+        self.user = User.objects.create(username='volunteer', telegram_id='1001')
+
+    def get_user(self, telegram_id='1001'):
+        return async_to_sync(get_user)(telegram_id)
+
+    def test_unregistered_user_is_cached(self):
+        with self.assertLogs('core.repository', 'WARNING'):
+            self.assertIsNone(self.get_user('2002'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(self.get_user('2002'))
+        # Регистрация сбрасывает отрицательную запись
+        User.objects.create(username='newcomer', telegram_id='2002')
+        self.assertEqual(self.get_user('2002').username, 'newcomer')
+
+    def test_save_and_delete_invalidate(self):
+        self.get_user()
+        self.user.phone_number = '+77000000000'
+        self.user.save()
+        self.assertEqual(self.get_user().phone_number, '+77000000000')
+        self.user.delete()
+        with self.assertLogs('core.repository', 'WARNING'):
+            self.assertIsNone(self.get_user())
+
+    def test_telegram_id_change_invalidates_old_key(self):
+        self.get_user()
+        self.user.telegram_id = '3003'
+        self.user.save()
+        with self.assertLogs('core.repository', 'WARNING'):
+            self.assertIsNone(self.get_user('1001'))
+
+    def test_admin_organizer_flip(self):
+        admin_user = User.objects.create_superuser(username='admin', password='admin', telegram_id='1')
+        self.client.force_login(admin_user)
+        self.assertFalse(self.get_user().is_organizer)
+        response = self.client.post('/admin/core/user/', {
+            'action': 'approve_organizer', admin.helpers.ACTION_CHECKBOX_NAME: [self.user.pk]
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(self.get_user().is_organizer)
+
+
+@override_settings(DB_THREAD_POOL_SIZE=0)
+class ProjectCatalogTests(TestCase):
+    """Каталог проектов в памяти: страницы без запросов, совпадение с БД и обновление по сигналам"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organizer = User.objects.create(username='organizer', telegram_id='1000', is_organizer=True)
+        cls.volunteer = User.objects.create(username='volunteer', telegram_id='1001')
+        cls.projects = [
+            Project.objects.create(
+                title=f'Project {i}', description='...', city='Almaty' if i % 2 else 'Astana',
+                creator=cls.organizer, status='approved'
+            )
+            for i in range(7)
+        ]
+        cls.projects[0].tags.add(*Tag.objects.for_names(['Park']))
+        cls.projects[3].tags.add(*Tag.objects.for_names(['Park', 'Clean']))
+        VolunteerProject.objects.create(volunteer=cls.volunteer, project=cls.projects[5])
+
+    def setUp(self):
+        project_catalog.clear()
+
+    def page(self, **kwargs):
+        projects, has_more = async_to_sync(get_approved_projects_page)(self.volunteer, **kwargs)
+        return [project[1] for project in projects], has_more
+
+    def test_warm_catalog_needs_no_queries(self):
+        first = self.page(limit=3)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.page(limit=3), first)
+            self.page(city='almaty', limit=3)
+            self.page(tag='park')
+
+    def test_pages_match_database(self):
+        for city, tag in ((None, None), ('ALMATY', None), (None, 'Park'), ('Almaty', 'Park'), ('Nowhere', None)):
+            after, previous = None, None
+            while True:
+                projects, has_more = async_to_sync(get_approved_projects_page)(
+                    self.volunteer, city=city, tag=tag, after=after, limit=2
+                )
+                expected, expected_more = async_to_sync(_get_approved_projects_page)(
+                    self.volunteer, city, tag, after, None, 2
+                )
+                self.assertEqual([p[1:] for p in projects], [p[1:] for p in expected], (city, tag, after))
+                self.assertEqual(has_more, expected_more)
+                if previous is not None:
+                    # Назад от первого проекта страницы — предыдущая страница
+                    back, _ = async_to_sync(get_approved_projects_page)(
+                        self.volunteer, city=city, tag=tag, before=encode_project_cursor(projects[0][0]), limit=2
+                    )
+                    self.assertEqual([p[1] for p in back], previous)
+                if not has_more:
+                    break
+                after, previous = encode_project_cursor(projects[-1][0]), [p[1] for p in projects]
+
+    def test_signals_update_catalog(self):
+        self.page()
+        pending = Project.objects.create(
+            title='Pending', description='...', city='Almaty', creator=self.organizer, status='pending'
+        )
+        ProjectAdmin(Project, admin.site).approve_projects(None, Project.objects.filter(pk=pending.pk))
+        self.projects[1].tags.add(*Tag.objects.for_names(['Beach']))
+        self.projects[2].status = 'rejected'
+        self.projects[2].save()
+        VolunteerProject.objects.create(volunteer=self.volunteer, project=self.projects[4])
+
+        titles, _ = self.page(limit=10)
+        self.assertIn('Pending', titles)
+        self.assertNotIn('Project 2', titles)
+        self.assertNotIn('Project 4', titles)
+        self.assertEqual(self.page(tag='beach'), (['Project 1'], False))
+
+
+@override_settings(DB_THREAD_POOL_SIZE=0)
+class ProjectSearchTests(TestCase):
+    """Поиск по индексу FTS5: префиксы, регистр, «ё», ранжирование и триггеры обновления индекса"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organizer = User.objects.create(username='organizer', telegram_id='1000', is_organizer=True)
+        cls.volunteer = User.objects.create(username='volunteer', telegram_id='1001')
+
+    def create_project(self, title, description='...', city='Алматы', status='approved', tags=()):
+        project = Project.objects.create(
+            title=title, description=description, city=city, creator=self.organizer, status=status
+        )
+        project.tags.add(*Tag.objects.for_names(tags))
+        return project
+
+    def search(self, text):
+        projects, _ = async_to_sync(search_approved_projects)(self.volunteer, text, limit=10)
+        return [project[1] for project in projects]
+
+    def test_prefix_case_and_letters(self):
+        self.create_project('Уборка парка', tags=['Экология'])
+        self.create_project('Ёлочный базар', description='Жасыл қала', city='Астана')
+        self.create_project('Скрытый проект', status='pending')
+        self.assertEqual(self.search('ПАРК'), ['Уборка парка'])
+        self.assertEqual(self.search('елоч'), ['Ёлочный базар'])
+        self.assertEqual(self.search('экол алм'), ['Уборка парка'])
+        self.assertEqual(self.search('қал'), ['Ёлочный базар'])
+        self.assertEqual(self.search('скрыт'), [])
+        self.assertEqual(self.search('"* NEAR('), [])
+
+    def test_title_ranks_first(self):
+        # Более новый проект при равном ранге был бы первым
+        self.create_project('Очистка реки')
+        self.create_project('Субботник', description='Уборка берега реки')
+        self.assertEqual(self.search('реки'), ['Очистка реки', 'Субботник'])
+
+    def test_old_match_ranks_among_many_new(self):
+        old = self.create_project('Уборка')
+        Project.objects.bulk_create([
+            Project(title=f'Субботник {i}', description='Уборка двора', city='Алматы',
+                    creator=self.organizer, status='approved')
+            for i in range(600)
+        ])
+        self.assertEqual(search.search_project_ids('уборка', limit=1), [old.pk])
+        self.assertEqual(len(search.search_project_ids('уборка', offset=590, limit=20)), 11)
+
+    def test_index_follows_bulk_changes(self):
+        project, joined = Project.objects.bulk_create([
+            Project(title=f'Чистый пляж {i}', description='...', city='Алматы', creator=self.organizer, status='pending')
+            for i in range(2)
+        ])
+        self.assertEqual(self.search('пляж'), [])
+        Project.objects.filter(pk__in=[project.pk, joined.pk]).update(status='approved')
+        VolunteerProject.objects.create(volunteer=self.volunteer, project=joined)
+        self.assertEqual(self.search('пляж'), ['Чистый пляж 0'])
+
+        project.tags.add(*Tag.objects.for_names(['вода']))
+        Tag.objects.filter(name='вода').update(name='море')
+        self.assertEqual(self.search('море'), ['Чистый пляж 0'])
+        project.tags.clear()
+        self.assertEqual(self.search('море'), [])
+
+        Project.objects.filter(pk=project.pk).update(status='rejected')
+        self.assertEqual(self.search('пляж'), [])
+
+
+@override_settings(DB_THREAD_POOL_SIZE=0)
+class ProjectTagTests(TestCase):
+    """Нормализованные теги: слияние написаний, фильтр одним запросом и подсказки похожих тегов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organizer = User.objects.create(username='organizer', telegram_id='1000', is_organizer=True)
+        cls.projects = [
+            Project.objects.create(title=f'Project {i}', description='...', city='Almaty', creator=cls.organizer)
+            for i in range(3)
+        ]
+        cls.projects[0].tags.add(*Tag.objects.for_names(['Экология', 'Парк']))
+        cls.projects[1].tags.add(*Tag.objects.for_names(['#экология', '  Ёлка ']))
+        cls.projects[2].tags.add(*Tag.objects.for_names(['парк']))
+
+    def test_spellings_are_merged(self):
+        self.assertEqual(list(Tag.objects.values_list('name', flat=True)), ['елка', 'парк', 'экология'])
+        self.assertEqual(Tag.objects.for_names(['ЁЛКА', '#Елка', '']), [Tag.objects.get(name='елка')])
+
+    def test_tagged_any_and_all(self):
+        with self.assertNumQueries(1):
+            any_tag = list(Project.objects.tagged(['Экология', 'парк']).order_by('id'))
+        self.assertEqual(any_tag, self.projects)
+        with self.assertNumQueries(1):
+            all_tags = list(Project.objects.tagged(['ЭКОЛОГИЯ', '#парк'], match_all=True))
+        self.assertEqual(all_tags, [self.projects[0]])
+        self.assertEqual(list(Project.objects.tagged(['ёлка'])), [self.projects[1]])
+
+    def test_suggest_tags(self):
+        suggestions = async_to_sync(suggest_tags)(['эко', 'экологя', 'Парк', 'субботник'])
+        self.assertEqual(suggestions, {'эко': ['экология'], 'экологя': ['экология']})
+
+
+@override_settings(DB_THREAD_POOL_SIZE=0)
+class ProjectCapacityTests(TestCase):
+    """Места в проектах: вместимость, лимит волонтёра и повтор при одновременном занятии места"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organizer = User.objects.create(username='organizer', telegram_id='1000', is_organizer=True)
+        cls.project = Project.objects.create(
+            title='Субботник', description='...', city='Алматы', creator=cls.organizer, status='approved', capacity=2
+        )
+        cls.other = Project.objects.create(
+            title='Посадка деревьев', description='...', city='Алматы', creator=cls.organizer, status='approved'
+        )
+        cls.volunteers = [User.objects.create(username=f'volunteer{i}', telegram_id=str(2000 + i)) for i in range(3)]
+
+    def join(self, volunteer, project):
+        result, _ = async_to_sync(create_volunteer_project)(volunteer, project.id)
+        return result
+
+    def test_capacity(self):
+        self.assertEqual([self.join(volunteer, self.project) for volunteer in self.volunteers], [JOINED, JOINED, PROJECT_FULL])
+        self.assertEqual(sorted(self.project.volunteer_projects.values_list('seat', flat=True)), [1, 2])
+        self.assertEqual(self.join(self.volunteers[0], self.project), ALREADY_JOINED)
+
+        # Вышедший волонтёр освобождает место
+        self.project.volunteer_projects.filter(volunteer=self.volunteers[0]).delete()
+        self.assertEqual(self.join(self.volunteers[2], self.project), JOINED)
+
+    def test_volunteer_limit(self):
+        self.assertEqual(self.join(self.volunteers[0], self.project), JOINED)
+        self.assertEqual(self.join(self.volunteers[0], self.other), LIMIT_REACHED)
+        with mock.patch('core.repository.MAX_PROJECTS_PER_VOLUNTEER', 2):
+            self.assertEqual(self.join(self.volunteers[0], self.other), JOINED)
+        self.assertEqual(sorted(self.volunteers[0].volunteer_projects.values_list('slot', flat=True)), [1, 2])
+
+    def test_unavailable_project(self):
+        self.project.reject()
+        self.assertEqual(self.join(self.volunteers[0], self.project), PROJECT_UNAVAILABLE)
+
+    def test_unnumbered_memberships_shrink_choice(self):
+        # Место без номера и место 5 за пределами capacity: свободен только один номер из 1..3
+        for _ in range(20):
+            self.assertEqual(free_number([None, 5], 3), 1)
+        self.assertIsNone(free_number([None, 1, 5], 3))
+
+    def test_created_membership_is_numbered(self):
+        membership = VolunteerProject.objects.create(volunteer=self.volunteers[0], project=self.project)
+        self.assertEqual(membership.slot, 1)
+        self.assertIn(membership.seat, (1, 2))
+        self.assertIsNone(VolunteerProject.objects.create(volunteer=self.volunteers[1], project=self.other).seat)
+
+    def test_taken_seat_is_retried(self):
+        VolunteerProject.objects.create(volunteer=self.volunteers[0], project=self.project, seat=1, slot=1)
+        # Первая попытка выбирает место 1, как если бы его одновременно занял другой волонтёр
+        with mock.patch('core.repository.free_number', side_effect=[1, 1, 1, 2]):
+            self.assertEqual(self.join(self.volunteers[1], self.project), JOINED)
+        self.assertEqual(self.project.volunteer_projects.get(volunteer=self.volunteers[1]).seat, 2)
+
+
+class DeadlineQueueTests(SimpleTestCase):
+    def setUp(self):
+        self.now = datetime(2030, 1, 1, 12, tzinfo=dt_timezone.utc)
+        self.queue = DeadlineQueue(timedelta(hours=1))
+        self.queue.set_waker(lambda: None)
+
+    def hours(self, n):
+        return self.now + timedelta(hours=n)
+
+    def test_events_in_time_order(self):
+        self.queue.load([
+            (1, self.hours(2), self.hours(5), False, False),
+            (2, self.hours(-3), self.hours(3), False, False),
+            # О начале уже напомнили, окончание прошло: осталось только истечение
+            (3, self.hours(-5), self.hours(-1), True, False),
+        ], now=self.now)
+        self.assertEqual(self.queue.pop_due(self.now, 10), [(EXPIRY, 3)])
+        self.assertEqual(self.queue.next_time(), self.hours(1))
+        self.assertEqual(
+            self.queue.pop_due(self.hours(10), 10),
+            [(START_REMINDER, 1), (END_REMINDER, 2), (EXPIRY, 2), (END_REMINDER, 1), (EXPIRY, 1)]
+        )
+        self.assertIsNone(self.queue.next_time())
+
+    def test_changed_task_replaces_events(self):
+        self.queue.load([(1, None, self.hours(5), False, False), (2, None, self.hours(5), False, False)], now=self.now)
+        with mock.patch('django.utils.timezone.now', return_value=self.now):
+            self.queue.schedule(1, 'open', None, self.hours(8), False, False)
+            self.queue.schedule(2, 'completed', None, self.hours(5), False, False)
+        self.assertEqual(self.queue.pop_due(self.hours(6), 10), [])
+        self.assertEqual(self.queue.pop_due(self.hours(8), 1), [(END_REMINDER, 1)])
+        self.assertEqual(self.queue.pop_due(self.hours(8), 1), [(EXPIRY, 1)])
+
+    def test_inactive_queue_ignores_changes(self):
+        self.queue.set_waker(None)
+        self.queue.schedule(1, 'open', None, self.hours(1), False, False)
+        self.assertEqual(self.queue.stats()['events'], 0)
+
+
+@override_settings(DB_THREAD_POOL_SIZE=0, TASK_TIME_ZONE='Asia/Almaty')
+class TaskDeadlineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.organizer = User.objects.create(username='organizer', telegram_id='1000', is_organizer=True)
+        cls.project = Project.objects.create(
+            title='Субботник', description='...', city='Алматы', creator=cls.organizer, status='approved'
+        )
+        cls.volunteers = [User.objects.create(username=f'volunteer{i}', telegram_id=str(2000 + i)) for i in range(3)]
+
+    def create_task(self, deadline_date, end_time=time(18)):
+        task = Task.objects.create(
+            project=self.project, creator=self.organizer, text='Собрать мусор',
+            deadline_date=deadline_date, start_time=time(9), end_time=end_time
+        )
+        accepted, completed, declined = self.volunteers
+        TaskAssignment.objects.create(task=task, volunteer=accepted, accepted=True)
+        TaskAssignment.objects.create(task=task, volunteer=completed, accepted=True, completed=True)
+        TaskAssignment.objects.create(task=task, volunteer=declined)
+        return task
+
+    def test_deadline_in_local_time(self):
+        task = self.create_task(date(2030, 6, 1))
+        self.assertEqual(task.starts_at, datetime(2030, 6, 1, 4, tzinfo=dt_timezone.utc))
+        self.assertEqual(task.deadline, datetime(2030, 6, 1, 13, tzinfo=dt_timezone.utc))
+        self.assertEqual(self.create_task(date(2030, 6, 1), end_time=None).deadline.astimezone(dt_timezone.utc).hour, 18)
+
+        # Перенос срока снова включает напоминание
+        Task.objects.filter(id=task.id).update(end_reminded=True)
+        task.refresh_from_db()
+        task.deadline_date = date(2030, 6, 2)
+        task.save(update_fields=['deadline_date'])
+        task.refresh_from_db()
+        self.assertFalse(task.end_reminded)
+        self.assertEqual(task.deadline.date(), date(2030, 6, 2))
+
+    def test_expire_tasks(self):
+        past, future = self.create_task(date(2020, 1, 1)), self.create_task(date(2099, 1, 1))
+        self.assertEqual(async_to_sync(expire_tasks)([past.id, future.id]), [past.id])
+        past.refresh_from_db()
+        self.assertEqual(past.status, 'expired')
+        self.assertTrue(past.is_expired())
+        self.assertEqual(
+            sorted(past.assignments.values_list('volunteer__username', 'expired')),
+            [('volunteer0', True), ('volunteer1', False), ('volunteer2', True)]
+        )
+        self.assertFalse(future.assignments.filter(expired=True).exists())
+
+    def test_reminders_go_to_accepted_volunteers_once(self):
+        task = self.create_task(date(2099, 1, 1))
+        broadcast_ids = async_to_sync(create_task_reminders)([task.id], END_REMINDER, lambda task, kind: task.text)
+        broadcast = Broadcast.objects.get(id__in=broadcast_ids)
+        self.assertEqual(broadcast.kind, 'reminder')
+        self.assertEqual(
+            list(BroadcastDelivery.objects.filter(broadcast=broadcast).values_list('user__username', flat=True)),
+            ['volunteer0']
+        )
+        self.assertEqual(async_to_sync(create_task_reminders)([task.id], END_REMINDER, lambda task, kind: task.text), [])
+        task.refresh_from_db()
+        self.assertTrue(task.end_reminded)
+        self.assertFalse(task.start_reminded)
+
+    def test_queryset_deadline_filters(self):
+        now = timezone.now()
+        past, soon, later = (
+            self.create_task(day) for day in (date(2020, 1, 1), (now + timedelta(hours=30)).date(), date(2099, 1, 1))
+        )
+        marked = self.create_task(date(2020, 1, 2))
+        Task.objects.filter(id=marked.id).update(status='expired')
+        undated = Task.objects.create(project=self.project, creator=self.organizer, text='Без срока')
+        TaskAssignment.objects.create(task=undated, volunteer=self.volunteers[0])
+
+        with self.assertNumQueries(1):
+            self.assertEqual(set(Task.objects.expired()), {past, marked})
+        with self.assertNumQueries(1):
+            self.assertEqual(list(Task.objects.due_within(timedelta(days=3))), [soon])
+        self.assertEqual(list(Task.objects.overdue()), [past])
+        # Выполнившему задания волонтёру они больше не показываются
+        with self.assertNumQueries(1):
+            self.assertEqual(set(Task.objects.active_for(self.volunteers[0])), {soon, later, undated})
+        self.assertEqual(list(Task.objects.active_for(self.volunteers[1])), [])
+
+    def test_scheduler_processes_due_events(self):
+        past, future = self.create_task(date(2020, 1, 1)), self.create_task(date(2099, 1, 1))
+        deadline_scheduler = scheduler.DeadlineScheduler(SimpleNamespace(), queue=DeadlineQueue(timedelta(hours=1)))
+        broadcaster = mock.Mock(start=mock.AsyncMock())
+
+        async def process():
+            deadline_scheduler._active_reminders = asyncio.Semaphore(1)
+            await deadline_scheduler._process([(EXPIRY, past.id), (START_REMINDER, future.id)])
+            await asyncio.gather(*deadline_scheduler._senders)
+
+        with mock.patch('scheduler.get_broadcaster', return_value=broadcaster):
+            async_to_sync(process)()
+        self.assertEqual(Task.objects.get(id=past.id).status, 'expired')
+        broadcast = Broadcast.objects.get(task=future)
+        self.assertIn('начнётся 2099-01-01 в 09:00', broadcast.text)
+        broadcaster.start.assert_awaited_once_with(broadcast.id)
+        self.assertEqual(deadline_scheduler.queue.stats(), {'events': 0, 'reminded': 1, 'expired': 1})
+
+
+@override_settings(DB_THREAD_POOL_SIZE=0)
+class RatingLedgerTests(TestCase):
+    """Рейтинг меняется через журнал RatingEvent и пересчитывается по нему командой recompute_ratings"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organizer = User.objects.create(username='organizer', telegram_id='1000', is_organizer=True)
+        cls.project = Project.objects.create(
+            title='Субботник', description='...', city='Алматы', creator=cls.organizer, status='approved'
+        )
+        cls.volunteer = User.objects.create(username='volunteer', telegram_id='2000', rating=10)
+
+    def test_stale_instances_do_not_lose_updates(self):
+        first, second = User.objects.get(pk=self.volunteer.pk), User.objects.get(pk=self.volunteer.pk)
+        photo = Photo.objects.create(volunteer=first, project=self.project, image='photos/1.jpg')
+        self.assertEqual(async_to_sync(rate_volunteer)(first, 5, 'photo', photo=photo), 20)
+        # Второй экземпляр прочитан до первой оценки, но её не перезаписывает
+        self.assertEqual(async_to_sync(rate_volunteer)(second, 3, 'task'), 26)
+        self.assertEqual(User.objects.get(pk=self.volunteer.pk).rating, 26)
+        self.assertEqual(
+            sorted(RatingEvent.objects.values_list('source', 'stars', 'points', 'photo')),
+            [('photo', 5, 10, photo.id), ('task', 3, 6, None)]
+        )
+
+    def test_rating_is_clamped(self):
+        self.assertEqual(self.volunteer.update_rating(95), 100)
+        self.assertEqual(self.volunteer.update_rating(-150), 0)
+        self.assertEqual(RatingEvent.objects.filter(user=self.volunteer).count(), 2)
+
+    def test_admin_edit_is_recorded(self):
+        admin_user = User.objects.create_superuser(username='admin', password='admin', telegram_id='1')
+        self.client.force_login(admin_user)
+        self.volunteer.update_rating(6, source='photo', stars=3)
+        form = self.client.get(f'/admin/core/user/{self.volunteer.pk}/change/').context['adminform'].form
+        data = {name: value for name, value in form.initial.items() if name in form.fields and value is not None}
+        data.update(password='!', rating=25, groups=[], user_permissions=[])
+        response = self.client.post(f'/admin/core/user/{self.volunteer.pk}/change/', data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(User.objects.get(pk=self.volunteer.pk).rating, 25)
+        self.assertEqual(RatingEvent.objects.get(source='manual').points, 9)
+        # Правка сохраняется при пересчёте: 6 за оценку и 9 вручную, рейтинг 10 был задан в обход журнала
+        call_command('recompute_ratings', stdout=mock.Mock())
+        self.assertEqual(User.objects.get(pk=self.volunteer.pk).rating, 15)
+
+    def test_recompute_ratings(self):
+        other = User.objects.create(username='other', telegram_id='2001', rating=50)
+        for stars in (5, 4):
+            self.volunteer.update_rating(stars * 2, source='photo', stars=stars)
+        other.update_rating(7)
+        User.objects.filter(pk=other.pk).update(rating=0)
+        with mock.patch('core.models.RATING_POINTS_PER_STAR', 3):
+            with self.assertNumQueries(4):
+                call_command('recompute_ratings', stdout=mock.Mock())
+        # Рейтинг 10, заданный при создании в обход журнала, при пересчёте не учитывается
+        self.assertEqual(User.objects.get(pk=self.volunteer.pk).rating, 27)
+        self.assertEqual(User.objects.get(pk=other.pk).rating, 7)
+        self.assertEqual(User.objects.get(pk=self.organizer.pk).rating, 0)
+
+
+class MediaRegistryTests(SimpleTestCase):
+    """Файл загружается заново, только если Telegram отклонил сам file_id"""
+
+    def setUp(self):
+        self.registry = MediaRegistry()
+        self.registry._file_ids['tasks/1.jpg'] = 'cached-id'
+        self.registry.forget = mock.AsyncMock()
+
+    def test_stale_file_id_falls_back(self):
+        stale = BadRequest('Wrong file identifier/http url specified')
+        bot = mock.Mock(send_photo=mock.AsyncMock(side_effect=[stale, 'sent']))
+        self.assertEqual(async_to_sync(self.registry.send_photo)(bot, 1, 'tasks/1.jpg', file_id='stale-id'), 'sent')
+        self.assertEqual(bot.send_photo.await_args.kwargs['photo'], 'cached-id')
+
+    def test_other_errors_are_raised(self):
+        bot = mock.Mock(send_photo=mock.AsyncMock(side_effect=BadRequest('Chat not found')))
+        with self.assertRaises(BadRequest):
+            async_to_sync(self.registry.send_photo)(bot, 1, 'tasks/1.jpg')
+        bot.send_photo.assert_awaited_once()
+        self.registry.forget.assert_not_awaited()
+
+
+class MediaStorageTests(TestCase):
+    """Фото из Telegram хранятся по содержимому и не скачиваются повторно"""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+        self.enterContext(mock.patch('media_storage.schedule_derivatives'))
+        self.enterContext(mock.patch.object(media_registry, '_file_ids', {}))
+
+    def photo_size(self, unique_id, content):
+        # Локальный Bot API сервер отдаёт путь к файлу на диске, сеть не нужна
+        source = os.path.join(self.media_root, f'{unique_id}.jpg')
+        with open(source, 'wb') as f:
+            f.write(content)
+        telegram_file = SimpleNamespace(file_path=source)
+        return SimpleNamespace(
+            file_id=f'id-{unique_id}', file_unique_id=unique_id, get_file=mock.AsyncMock(return_value=telegram_file)
+        )
+
+    def save(self, photo_size):
+        return async_to_sync(media_storage.save_telegram_photo)(photo_size)
+
+    def tmp_files(self):
+        return os.listdir(os.path.join(self.media_root, 'tmp'))
+
+    def test_same_content_stored_once(self):
+        sha256 = hashlib.sha256(b'photo').hexdigest()
+        first, second = self.save(self.photo_size('a', b'photo')), self.save(self.photo_size('b', b'photo'))
+        self.assertEqual(first, f'blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}.jpg')
+        self.assertEqual(second, first)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, os.path.dirname(first))), [f'{sha256}.jpg'])
+        self.assertEqual(self.tmp_files(), [])
+        media_storage.schedule_derivatives.assert_called_once_with(first)
+
+    def test_known_unique_id_skips_download(self):
+        path = self.save(self.photo_size('a', b'photo'))
+        again = self.photo_size('a', b'photo')
+        with self.assertLogs('media_storage', 'INFO'):
+            self.assertEqual(self.save(again), path)
+        again.get_file.assert_not_awaited()
+
+    def test_empty_download_is_rejected(self):
+        with self.assertRaisesMessage(ValueError, 'empty'):
+            self.save(self.photo_size('a', b''))
+        self.assertEqual(self.tmp_files(), [])
+        self.assertFalse(MediaFile.objects.exists())
+
+    def test_temp_file_removed_on_failure(self):
+        with mock.patch('media_storage._download', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                self.save(self.photo_size('a', b'photo'))
+        self.assertEqual(self.tmp_files(), [])
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, media_storage.BLOBS_DIR)))
+
+
+class AdminDerivativeTests(SimpleTestCase):
+    """Список фото в админке не запускает Pillow: недостающие превью ставятся в пул один раз"""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        os.makedirs(os.path.join(media_root.name, 'photos'))
+        with open(os.path.join(media_root.name, 'photos/1.jpg'), 'wb') as f:
+            f.write(b'not an image')
+        self.pool = mock.Mock()
+        self.enterContext(mock.patch('core.derivatives.get_process_pool', return_value=self.pool))
+        self.enterContext(mock.patch.object(derivatives, '_pending', set()))
+        self.enterContext(mock.patch.object(derivatives, '_failed', set()))
+
+    def image(self, name):
+        return Photo(image=name).image
+
+    def test_missing_thumbnail_is_queued_once(self):
+        for _ in range(3):
+            self.assertIsNone(derivatives.derivative_url(self.image('photos/1.jpg'), render=False))
+        self.pool.submit.assert_called_once()
+        # Неудачная попытка запоминается и не повторяется
+        done = mock.Mock(cancelled=mock.Mock(return_value=False), exception=mock.Mock(return_value=OSError('broken')))
+        with self.assertLogs('core.derivatives', 'ERROR'):
+            self.pool.submit.return_value.add_done_callback.call_args.args[0](done)
+        with mock.patch('core.derivatives.render_derivatives') as render:
+            self.assertIsNone(derivatives.derivative_url(self.image('photos/1.jpg')))
+            self.assertIsNone(derivatives.derivative_url(self.image('photos/1.jpg'), render=False))
+        render.assert_not_called()
+        self.pool.submit.assert_called_once()
+
+    def test_missing_original_is_not_queued(self):
+        self.assertIsNone(derivatives.derivative_url(self.image('photos/2.jpg'), render=False))
+        self.pool.submit.assert_not_called()
+
+
+@override_settings(TELEGRAM_WEBHOOK_SECRET='secret', TELEGRAM_WEBHOOK_PATH='/telegram/webhook')
+class WebhookSecretTests(SimpleTestCase):
+    def test_wrong_secret_is_rejected(self):
+        webhook = TelegramWebhook(django_application=None)
+        for token in (b'wrong', 'секрет'.encode(), b''):
+            sent = []
+
+            async def send(message):
+                sent.append(message)
+
+            scope = {
+                'type': 'http', 'method': 'POST', 'path': '/telegram/webhook',
+                'headers': [(SECRET_HEADER, token)] if token else [],
+            }
+            async_to_sync(webhook)(scope, mock.AsyncMock(), send)
+            self.assertEqual(sent[0]['status'], 403)
+
+
+class GridIndexTests(SimpleTestCase):
+    def test_nearest_matches_brute_force(self):
+        rnd = random.Random(1)
+        # Алматы и окрестности: плотный центр и редкие точки дальше MAX_DISTANCE_KM
+        points = {
+            i: (43.24 + rnd.gauss(0, 0.05 if i % 5 else 0.5), 76.9 + rnd.gauss(0, 0.05 if i % 5 else 0.5))
+            for i in range(2000)
+        }
+        grid = geo.GridIndex()
+        for i, (lat, lon) in points.items():
+            grid.add(i, lat, lon)
+        for i in range(0, 2000, 10):
+            grid.remove(i, *points.pop(i))
+        for lat, lon in ((43.238, 76.945), (43.5, 77.3), (44.5, 78.5)):
+            expected = sorted(
+                (distance, i) for i, point in points.items()
+                if (distance := geo.haversine_km(lat, lon, *point)) <= geo.MAX_DISTANCE_KM
+            )[:7]
+            self.assertEqual(grid.nearest(lat, lon, 7), expected)
+        self.assertEqual(grid.nearest(0, 0, 5), [])
+
+
+@override_settings(DB_THREAD_POOL_SIZE=0)
+class NearestProjectsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.organizer = User.objects.create(username='organizer', telegram_id='1000', is_organizer=True)
+        cls.volunteer = User.objects.create(username='volunteer', telegram_id='1001')
+        for title, lat, lon in (
+            ('Парк Горького', 43.2605, 76.9700), ('Медеу', 43.1577, 77.0590), ('Ботанический сад', 43.2220, 76.9140),
+            ('Кок-Тобе', 43.2330, 76.9760), ('Астана', 51.1280, 71.4300), ('Без места', None, None),
+        ):
+            Project.objects.create(
+                title=title, description='...', city='Алматы', creator=cls.organizer, status='approved',
+                latitude=lat, longitude=lon
+            )
+        VolunteerProject.objects.create(volunteer=cls.volunteer, project=Project.objects.get(title='Кок-Тобе'))
+
+    def setUp(self):
+        project_catalog.clear()
+
+    def nearest(self, func, *args):
+        return [(project[1], round(project[4], 1)) for project in async_to_sync(func)(self.volunteer, 43.2380, 76.9450, *args)]
+
+    def test_catalog_matches_database(self):
+        expected = [('Ботанический сад', 3.1), ('Парк Горького', 3.2), ('Медеу', 12.8)]
+        self.assertEqual(self.nearest(_get_nearest_projects, 5), expected)
+        self.assertEqual(self.nearest(get_nearest_projects), expected)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.nearest(get_nearest_projects), expected)
+
+    def test_approved_project_is_indexed(self):
+        self.nearest(get_nearest_projects)
+        project = Project.objects.create(
+            title='Рядом', description='...', city='Алматы', creator=self.organizer, latitude=43.2381, longitude=76.9451
+        )
+        ProjectAdmin(Project, admin.site).approve_projects(None, Project.objects.filter(pk=project.pk))
+        self.assertEqual(self.nearest(get_nearest_projects)[0], ('Рядом', 0.0))
+        project.latitude = 51.13
+        project.longitude = 71.43
+        project.save()
+        self.assertNotIn('Рядом', [title for title, _ in self.nearest(get_nearest_projects)])
+
+
+class AdminQueryBudgetTests(TestCase):
+    """Списки в админке: число запросов не зависит от количества строк на странице"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='admin', password='admin', telegram_id='1')
+        cls.project = Project.objects.create(
+            title='Main project', description='...', city='Almaty', creator=cls.admin, status='approved'
+        )
+        cls.task = Task.objects.create(project=cls.project, creator=cls.admin, text='Task')
+
+    def assertChangelistBudget(self, url, budget):
+        self.client.force_login(self.admin)
+        seed(self.admin, self.project, self.task, 0, SMALL)
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        # Больше одной страницы списка (100 строк)
+        seed(self.admin, self.project, self.task, SMALL, 200)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        sql = '\n'.join(f"{i}. {query['sql'][:500]}" for i, query in enumerate(large.captured_queries, start=1))
+        self.assertLessEqual(len(large.captured_queries), budget, sql)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries), sql)
+
+    def test_project_changelist(self):
+        self.assertChangelistBudget('/admin/core/project/', 8)
+
+    def test_photo_changelist(self):
+        self.assertChangelistBudget('/admin/core/photo/', 8)
@@ -0,0 +1,184 @@
+"""Настройка логирования бота.
+
+Обработчики бота только кладут записи в очередь (QueueHandler), а запись в файл и консоль
+выполняет отдельный поток QueueListener: медленный диск не задерживает цикл событий.
+Файл лога ротируется по времени и по размеру, старые файлы сжимаются gzip.
+
+Переменные окружения:
+    LOG_LEVEL         — уровень корневого логгера (INFO)
+    LOG_LEVELS        — уровни отдельных логгеров: "httpx=WARNING,core.repository=DEBUG"
+    LOG_FILE          — файл лога (bot.log); пустое значение отключает запись в файл
+    LOG_FORMAT        — text или json (одна JSON-запись на строку)
+    LOG_MAX_BYTES     — ротация при превышении размера (10 МБ), 0 — только по времени
+    LOG_BACKUP_COUNT  — сколько старых файлов хранить (14)
+"""
+import atexit
+import copy
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import sys
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Библиотеки, которые на INFO пишут строку на каждый запрос к Telegram
+DEFAULT_LEVELS = {
+    'httpx': logging.WARNING,
+    'httpcore': logging.WARNING,
+}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — один JSON-объект в строке, для сборщиков логов"""
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            record.exc_text = record.exc_text or self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exc_info'] = record.exc_text
+        if record.stack_info:
+            data['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """Передаёт запись в поток записи, оставляя трейсбек отдельным полем.
+
+    Стандартный QueueHandler дописывает трейсбек в текст сообщения, и JSON-формат
+    не смог бы вынести его в поле exc_info.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        # Аргументы подставляются здесь: объекты из них могут измениться до записи в файл
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class RotatingFileHandler(logging.handlers.TimedRotatingFileHandler):
+    """Ротация раз в сутки (в полночь) и дополнительно при превышении max_bytes"""
+
+    def __init__(self, filename, max_bytes=0, backup_count=0, encoding='utf-8'):
+        super().__init__(filename, when='midnight', backupCount=backup_count, encoding=encoding)
+        self.max_bytes = max_bytes
+        self.namer = self._gzip_name
+        self.rotator = self._gzip_rotate
+
+    def shouldRollover(self, record):
+        if super().shouldRollover(record):
+            return True
+        if self.max_bytes > 0 and self.stream is not None:
+            self.stream.seek(0, os.SEEK_END)
+            return self.stream.tell() >= self.max_bytes
+        return False
+
+    def rotation_filename(self, default_name):
+        name = super().rotation_filename(default_name)
+        # За сутки может быть несколько ротаций по размеру: имя не должно совпасть с прошлым
+        base, index = name[:-len('.gz')], 1
+        while os.path.exists(name):
+            name = f"{base}.{index}.gz"
+            index += 1
+        return name
+
+    def getFilesToDelete(self):
+        # Стандартная реализация не узнаёт файлы с суффиксом .gz
+        directory, base = os.path.split(self.baseFilename)
+        prefix = base + '.'
+        files = sorted(
+            (
+                os.path.join(directory, name) for name in os.listdir(directory or '.')
+                if name.startswith(prefix) and name.endswith('.gz')
+            ),
+            key=os.path.getmtime
+        )
+        if len(files) <= self.backupCount:
+            return []
+        return files[:len(files) - self.backupCount]
+
+    @staticmethod
+    def _gzip_name(name):
+        return f"{name}.gz"
+
+    @staticmethod
+    def _gzip_rotate(source, dest):
+        with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(source)
+
+
+def parse_levels(value):
+    """'httpx=WARNING,telegram=INFO' -> {'httpx': 'WARNING', 'telegram': 'INFO'}"""
+    levels = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging():
+    """Настраивает корневой логгер; повторный вызов ничего не делает"""
+    global _listener
+    if _listener is not None:
+        return
+
+    if os.getenv('LOG_FORMAT', 'text').lower() == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT)
+
+    handlers = [logging.StreamHandler()]
+    log_file = os.getenv('LOG_FILE', 'bot.log')
+    if log_file:
+        handlers.append(RotatingFileHandler(
+            log_file,
+            max_bytes=int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024))),
+            backup_count=int(os.getenv('LOG_BACKUP_COUNT', '14')),
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+
+    levels = {**DEFAULT_LEVELS, **parse_levels(os.getenv('LOG_LEVELS', ''))}
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # Дописать оставшиеся в очереди записи при выходе
+    atexit.register(stop_logging)
+
+    if sys.stdout.encoding != 'utf-8':
+        sys.stdout.reconfigure(encoding='utf-8')
+
+
+def stop_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
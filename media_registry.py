@@ -0,0 +1,102 @@
+"""Отправка файлов из media по file_id Telegram.
+
+Telegram возвращает file_id для каждого загруженного файла, и этим же ботом файл можно
+отправлять повторно без загрузки байтов. Реестр (core.models.MediaFile) хранит file_id по
+пути файла и хэшу содержимого: фото задания загружается в Telegram один раз, а все
+последующие отправки (другим волонтёрам, напоминания) ссылаются на него. Если Telegram
+отклоняет устаревший file_id, файл загружается заново.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import weakref
+
+import aiofiles
+from django.conf import settings
+from telegram.error import BadRequest
+
+from core.repository import get_media_file, find_file_id_by_hash, register_media_file, clear_media_file_id
+
+logger = logging.getLogger(__name__)
+
+# Ошибки Telegram, означающие, что устарел сам file_id. Остальные BadRequest (чат не найден,
+# слишком длинная подпись) повторятся и при загрузке файла, поэтому они пробрасываются наверх
+FILE_ID_ERRORS = ('wrong file identifier', 'wrong remote file identifier', 'file reference')
+
+
+def is_file_id_error(error):
+    message = str(error).lower()
+    return any(text in message for text in FILE_ID_ERRORS)
+
+
+class MediaRegistry:
+    def __init__(self):
+        # path -> file_id, чтобы при рассылке не обращаться к БД на каждого получателя
+        self._file_ids = {}
+        # path -> Lock: пока файл загружается первый раз, остальные отправки ждут его file_id
+        self._locks = weakref.WeakValueDictionary()
+
+    async def get_file_id(self, path):
+        file_id = self._file_ids.get(path)
+        if file_id:
+            return file_id
+        media_file = await get_media_file(path)
+        if media_file is None:
+            return None
+        file_id = media_file.file_id or await find_file_id_by_hash(media_file.sha256)
+        if file_id:
+            self._file_ids[path] = file_id
+        return file_id
+
+    async def remember(self, path, sha256, size, photo_size):
+        """Запоминает file_id файла path (photo_size — PhotoSize из сообщения или ответа Telegram)"""
+        self._file_ids[path] = photo_size.file_id
+        await register_media_file(
+            path, sha256, size, file_id=photo_size.file_id, file_unique_id=photo_size.file_unique_id
+        )
+
+    async def forget(self, file_id):
+        self._file_ids = {path: value for path, value in self._file_ids.items() if value != file_id}
+        await clear_media_file_id(file_id)
+
+    async def send_photo(self, bot, chat_id, path, file_id=None, **kwargs):
+        """Отправляет фото из media по file_id, а если его нет или он устарел — загружает файл.
+
+        file_id — уже известный file_id этого фото (например, Photo.file_id), пробуется первым.
+        """
+        if file_id:
+            try:
+                return await bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+            except BadRequest as e:
+                if not is_file_id_error(e):
+                    raise
+                logger.warning("Telegram rejected stored file_id for %s: %s", path, e)
+
+        known_file_id, file_id = file_id, await self.get_file_id(path)
+        if file_id and file_id != known_file_id:
+            try:
+                return await bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+            except BadRequest as e:
+                if not is_file_id_error(e):
+                    raise
+                logger.warning("Telegram rejected file_id for %s, uploading again: %s", path, e)
+                await self.forget(file_id)
+
+        lock = self._locks.get(path)
+        if lock is None:
+            lock = self._locks[path] = asyncio.Lock()
+        async with lock:
+            # Пока ждали, файл мог загрузить другой получатель рассылки
+            file_id = self._file_ids.get(path)
+            if file_id:
+                return await bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+            async with aiofiles.open(os.path.join(settings.MEDIA_ROOT, path), 'rb') as f:
+                data = await f.read()
+            message = await bot.send_photo(chat_id=chat_id, photo=data, **kwargs)
+            await self.remember(path, hashlib.sha256(data).hexdigest(), len(data), message.photo[-1])
+            logger.info("Uploaded %s to Telegram, file_id cached", path)
+            return message
+
+
+media_registry = MediaRegistry()
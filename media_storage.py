@@ -0,0 +1,119 @@
+"""Сохранение фото из Telegram в media с адресацией по содержимому.
+
+Файл скачивается потоком во временный файл и одновременно хэшируется, поэтому в памяти
+никогда не находится целиком. Затем он переносится в blobs/<aa>/<bb>/<sha256>.<ext>:
+одинаковые фото (повторная отправка, ретраи) хранятся один раз. По file_unique_id
+Telegram уже сохранённый файл находится без скачивания. Для нового файла в фоне
+создаются превью и веб-версия (core/derivatives.py).
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+
+import aiofiles
+import aiofiles.os
+import httpx
+from django.conf import settings
+
+from core.derivatives import schedule_derivatives, shutdown_process_pool
+from core.repository import get_media_file_by_unique_id
+from media_registry import media_registry
+
+logger = logging.getLogger(__name__)
+
+BLOBS_DIR = 'blobs'
+CHUNK_SIZE = 64 * 1024
+MAX_RETRIES = 3
+
+_http_client = None
+
+
+def get_http_client():
+    """Общий клиент для скачивания файлов: соединения с api.telegram.org переиспользуются"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(timeout=httpx.Timeout(30.0, connect=10.0))
+    return _http_client
+
+
+async def close_media_storage(application=None):
+    """post_shutdown: закрывает соединения клиента скачивания и пул создания превью"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+    await asyncio.to_thread(shutdown_process_pool)
+
+
+def blob_path(sha256, extension):
+    return os.path.join(BLOBS_DIR, sha256[:2], sha256[2:4], f"{sha256}{extension}")
+
+
+async def save_telegram_photo(photo_size):
+    """Сохраняет фото (PhotoSize) в media и возвращает путь относительно MEDIA_ROOT"""
+    media_file = await get_media_file_by_unique_id(photo_size.file_unique_id)
+    if media_file and await aiofiles.os.path.exists(os.path.join(settings.MEDIA_ROOT, media_file.path)):
+        logger.info("Photo %s already stored at %s, download skipped", photo_size.file_unique_id, media_file.path)
+        return media_file.path
+
+    telegram_file = await photo_size.get_file()
+    extension = os.path.splitext(telegram_file.file_path or '')[1].lower() or '.jpg'
+
+    tmp_dir = os.path.join(settings.MEDIA_ROOT, 'tmp')
+    await aiofiles.os.makedirs(tmp_dir, exist_ok=True)
+    # Временный файл в той же файловой системе, что и media: перенос атомарный
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix=extension)
+    os.close(fd)
+    try:
+        for attempt in range(MAX_RETRIES):
+            try:
+                sha256, size = await _download(telegram_file.file_path, tmp_path)
+                break
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                logger.warning("Attempt %s/%s to download %s failed: %s", attempt + 1, MAX_RETRIES, photo_size.file_unique_id, e)
+                if attempt == MAX_RETRIES - 1:
+                    raise
+                await asyncio.sleep(2 ** attempt)
+        if not size:
+            raise ValueError("Downloaded photo data is empty")
+
+        path = blob_path(sha256, extension)
+        full_path = os.path.join(settings.MEDIA_ROOT, path)
+        if await aiofiles.os.path.exists(full_path):
+            logger.info("Photo content already stored at %s", path)
+        else:
+            await aiofiles.os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            await aiofiles.os.replace(tmp_path, full_path)
+            logger.info("Photo saved to %s (%s bytes)", path, size)
+            schedule_derivatives(path)
+    finally:
+        if await aiofiles.os.path.exists(tmp_path):
+            await aiofiles.os.remove(tmp_path)
+
+    # Фото уже есть в Telegram: дальше его можно отправлять по file_id без загрузки
+    await media_registry.remember(path, sha256, size, photo_size)
+    return path
+
+
+async def _download(file_path, tmp_path):
+    """Скачивает файл по частям в tmp_path и возвращает (sha256, размер)"""
+    digest = hashlib.sha256()
+    size = 0
+    async with aiofiles.open(tmp_path, 'wb') as out:
+        if file_path.startswith(('http://', 'https://')):
+            async with get_http_client().stream('GET', file_path) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    await out.write(chunk)
+        else:
+            # Локальный Bot API сервер отдаёт путь к файлу на диске
+            async with aiofiles.open(file_path, 'rb') as source:
+                while chunk := await source.read(CHUNK_SIZE):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    await out.write(chunk)
+    return digest.hexdigest(), size
@@ -0,0 +1,365 @@
+"""Метрики бота в формате Prometheus.
+
+Собирается:
+- время работы каждого обработчика (по имени функции, диалогу и состоянию диалога) и его ошибки;
+- число и время запросов к БД внутри обработчика (connection.execute_wrapper);
+- запросы к Telegram Bot API: количество, время и ошибки по методам;
+- длина очереди обновлений, обновления в обработке, статистика кэша пользователей и каталога проектов.
+
+Метрики отдаются текстом на http://METRICS_HOST:METRICS_PORT/metrics (по умолчанию
+127.0.0.1:9108, METRICS_PORT=0 отключает сервер). Всё хранится в памяти процесса без
+внешних зависимостей; запросы к Telegram и БД обновляют счётчики за O(1).
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from telegram.error import TelegramError
+from telegram.ext import ApplicationHandlerStop, ConversationHandler
+from telegram.request import HTTPXRequest
+
+from core.cache import user_cache
+from core.catalog import project_catalog
+from core.deadlines import deadline_queue
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in values:
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+
+class Histogram:
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets) + (float('inf'),)
+        # label_values -> [счётчики по корзинам, сумма, количество]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            values = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._values.items()]
+        for label_values, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, label_values)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labels, label_values)} {count}"
+
+
+class Gauge:
+    """Значение читается в момент запроса метрик: func() -> число"""
+
+    def __init__(self, name, documentation, func, kind='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+        self.kind = kind
+
+    def collect(self):
+        try:
+            value = self.func()
+        except Exception as e:
+            logger.warning("Failed to collect metric %s: %s", self.name, e)
+            return
+        if value is None:
+            return
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield f"{self.name} {_format_value(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+HANDLER_LABELS = ('handler', 'conversation', 'state')
+handler_duration = registry.register(Histogram(
+    'bot_handler_duration_seconds', "Время работы обработчика", HANDLER_LABELS
+))
+handler_errors = registry.register(Counter(
+    'bot_handler_errors_total', "Исключения в обработчиках", HANDLER_LABELS + ('error',)
+))
+handler_db_queries = registry.register(Histogram(
+    'bot_handler_db_queries', "Запросов к БД за один вызов обработчика", HANDLER_LABELS, QUERY_COUNT_BUCKETS
+))
+handler_db_duration = registry.register(Histogram(
+    'bot_handler_db_seconds', "Суммарное время запросов к БД за один вызов обработчика", HANDLER_LABELS
+))
+db_queries = registry.register(Counter('bot_db_queries_total', "Запросы к БД", ('alias',)))
+db_errors = registry.register(Counter('bot_db_errors_total', "Запросы к БД, завершившиеся ошибкой", ('alias',)))
+db_duration = registry.register(Histogram('bot_db_query_duration_seconds', "Время запроса к БД", ('alias',)))
+telegram_requests = registry.register(Counter(
+    'bot_telegram_requests_total', "Запросы к Telegram Bot API по методам и статусу ответа", ('method', 'status')
+))
+telegram_duration = registry.register(Histogram(
+    'bot_telegram_request_duration_seconds', "Время запроса к Telegram Bot API", ('method',)
+))
+
+
+# Статистика запросов к БД текущего обработчика: [число запросов, время]. asgiref копирует
+# контекст в потоки sync_to_async, поэтому запросы из пула потоков попадают сюда же
+_db_stats = contextvars.ContextVar('db_stats', default=None)
+
+
+def _db_execute_wrapper(execute, sql, params, many, context):
+    alias = context['connection'].alias
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    except Exception:
+        db_errors.inc(alias)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        db_queries.inc(alias)
+        db_duration.observe(elapsed, alias)
+        stats = _db_stats.get()
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += elapsed
+
+
+def _install_db_wrapper(sender, connection, **kwargs):
+    if _db_execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_execute_wrapper)
+
+
+connection_created.connect(_install_db_wrapper, dispatch_uid='metrics_db_wrapper')
+
+
+def instrument_callback(callback, conversation='', state=''):
+    """Оборачивает callback обработчика: время, ошибки и запросы к БД за вызов"""
+    if getattr(callback, '_metrics_labels', None) is not None:
+        return callback
+    labels = (getattr(callback, '__name__', repr(callback)), conversation, str(state))
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        stats = [0, 0.0]
+        token = _db_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            raise
+        except Exception as e:
+            handler_errors.inc(*labels, type(e).__name__)
+            raise
+        finally:
+            handler_duration.observe(time.perf_counter() - started, *labels)
+            handler_db_queries.observe(stats[0], *labels)
+            handler_db_duration.observe(stats[1], *labels)
+            _db_stats.reset(token)
+
+    wrapper._metrics_labels = labels
+    return wrapper
+
+
+def _instrument_handler(handler, conversation='', state=''):
+    if isinstance(handler, ConversationHandler):
+        name = handler.name or ''
+        for entry_point in handler.entry_points:
+            _instrument_handler(entry_point, name, 'entry')
+        for conversation_state, handlers in handler.states.items():
+            for state_handler in handlers:
+                _instrument_handler(state_handler, name, conversation_state)
+        for fallback in handler.fallbacks:
+            _instrument_handler(fallback, name, 'fallback')
+    elif hasattr(handler, 'callback'):
+        handler.callback = instrument_callback(handler.callback, conversation, state)
+
+
+def instrument_application(application):
+    """Подключает метрики ко всем зарегистрированным обработчикам и очередям application"""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            _instrument_handler(handler)
+
+    registry.register(Gauge(
+        'bot_update_queue_size', "Обновления в очереди Application", application.update_queue.qsize
+    ))
+    processor = application.update_processor
+    registry.register(Gauge(
+        'bot_updates_in_flight', "Обновления, которые сейчас обрабатываются",
+        lambda: processor.current_concurrent_updates
+    ))
+    if hasattr(processor, 'pending_updates'):
+        registry.register(Gauge(
+            'bot_updates_pending', "Обновления, взятые из очереди и ещё не обработанные (включая ожидающие свой чат)",
+            lambda: processor.pending_updates
+        ))
+
+
+for _name, _documentation, _kind in (
+    ('size', "Пользователей в кэше", 'gauge'),
+    ('hits', "Попадания в кэш пользователей", 'counter'),
+    ('misses', "Промахи кэша пользователей", 'counter'),
+    ('evictions', "Вытеснения из кэша пользователей", 'counter'),
+):
+    registry.register(Gauge(
+        f'bot_user_cache_{_name}' + ('_total' if _kind == 'counter' else ''), _documentation,
+        functools.partial(lambda key: user_cache.stats()[key], _name), _kind
+    ))
+
+for _name, _documentation, _kind in (
+    ('projects', "Проектов в каталоге бота", 'gauge'),
+    ('users', "Волонтёров с закэшированным участием в проектах", 'gauge'),
+    ('hits', "Страницы каталога, отданные из памяти", 'counter'),
+    ('misses', "Чтения каталога из БД (целиком или устаревших проектов)", 'counter'),
+):
+    registry.register(Gauge(
+        f'bot_project_catalog_{_name}' + ('_total' if _kind == 'counter' else ''), _documentation,
+        functools.partial(lambda key: project_catalog.stats()[key], _name), _kind
+    ))
+
+for _name, _documentation, _kind in (
+    ('events', "События в очереди сроков заданий", 'gauge'),
+    ('reminded', "Созданные рассылки-напоминания о заданиях", 'counter'),
+    ('expired', "Задания, помеченные истёкшими", 'counter'),
+):
+    registry.register(Gauge(
+        f'bot_deadline_{_name}' + ('_total' if _kind == 'counter' else ''), _documentation,
+        functools.partial(lambda key: deadline_queue.stats()[key], _name), _kind
+    ))
+
+
+class InstrumentedHTTPXRequest(HTTPXRequest):
+    """HTTPXRequest, который считает запросы к Bot API по методам"""
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        status = 'error'
+        try:
+            code, payload = await super().do_request(url, method, request_data, **kwargs)
+            status = str(code)
+            return code, payload
+        except TelegramError as e:
+            status = type(e).__name__
+            raise
+        finally:
+            telegram_requests.inc(api_method, status)
+            telegram_duration.observe(time.perf_counter() - started, api_method)
+
+
+async def _handle_http(reader, writer):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        # Заголовки запроса не нужны, но их нужно дочитать
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b'\r\n', b'\n', b''):
+            pass
+        parts = request_line.decode('latin-1').split()
+        if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+            status, body = '200 OK', registry.render().encode('utf-8')
+        else:
+            status, body = '404 Not Found', b'Not Found\n'
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode('latin-1') + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError) as e:
+        logger.debug("Metrics request failed: %s", e)
+    finally:
+        writer.close()
+
+
+_server = None
+
+
+async def start_metrics_server(application=None):
+    """post_init: запускает HTTP-сервер метрик (если METRICS_PORT не 0)"""
+    global _server
+    if _server is not None or not settings.METRICS_PORT:
+        return
+    try:
+        _server = await asyncio.start_server(_handle_http, settings.METRICS_HOST, settings.METRICS_PORT)
+        logger.info("Metrics available at http://%s:%s/metrics", settings.METRICS_HOST, settings.METRICS_PORT)
+    except OSError as e:
+        # Порт может быть занят другим процессом бота (несколько воркеров uvicorn): бот работает и без метрик
+        logger.warning("Failed to start metrics server on %s:%s: %s", settings.METRICS_HOST, settings.METRICS_PORT, e)
+
+
+async def stop_metrics_server(application=None):
+    global _server
+    if _server is not None:
+        _server.close()
+        await _server.wait_closed()
+        _server = None
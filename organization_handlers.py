@@ -1,23 +1,26 @@
 import logging
-import os
 from datetime import datetime, time
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, ReplyKeyboardRemove, Update
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup, ReplyKeyboardRemove, Update
 from telegram.ext import CommandHandler, MessageHandler, CallbackQueryHandler, ConversationHandler, filters, ContextTypes
-from telegram.error import TimedOut
-from asgiref.sync import sync_to_async
-from django.db import transaction 
+from django.core.exceptions import ObjectDoesNotExist
 from django.utils import timezone
-import asyncio
-import traceback
-import aiofiles 
 
-from core.models import User, Project, VolunteerProject, Task, TaskAssignment, Photo
+from broadcast import get_broadcaster
+from media_registry import media_registry
+from media_storage import save_telegram_photo
+from core.repository import (
+    get_user, get_admin, create_project, get_volunteers_for_project, get_organizer_projects,
+    get_project_volunteers, get_project_memberships, create_task, create_task_broadcast,
+    get_task_assignment, get_pending_photos_for_organizer, get_photo, approve_photo, get_project, get_users_by_ids,
+    suggest_tags, rate_volunteer,
+)
+from core.models import normalize_tag
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
 # Состояния для ConversationHandler
-TITLE, DESCRIPTION, CITY, TAGS = range(4)
+TITLE, DESCRIPTION, CITY, TAGS, LOCATION = range(5)
 SELECT_PROJECT, SELECT_RECIPIENTS, SELECT_VOLUNTEERS, TASK_TEXT, TASK_DEADLINE_DATE, TASK_DEADLINE_START_TIME, TASK_DEADLINE_END_TIME, TASK_PHOTO, TASK_PHOTO_UPLOAD, CONFIRM_TASK, FEEDBACK = range(11)
 MODERATE_PHOTO, MODERATE_PHOTO_ACTION = range(2)
 
@@ -33,143 +36,12 @@ def get_org_keyboard():
          InlineKeyboardButton("🖼️ Проверить фото", callback_data="check_photos")]
     ])
 
-# Вспомогательные функции с sync_to_async
-@sync_to_async
-def get_user(telegram_id):
-    try:
-        user = User.objects.get(telegram_id=telegram_id)
-        logger.info(f"User found: {user.username} (telegram_id: {telegram_id})")
-        return user
-    except User.DoesNotExist:
-        logger.warning(f"User not found with telegram_id: {telegram_id}")
-        return None
-
-@sync_to_async
-def get_admin():
-    try:
-        admin = User.objects.filter(is_staff=True).first()
-        if admin:
-            logger.info(f"Admin found: {admin.username}")
-            return admin
-        else:
-            logger.warning("No admin found")
-            return None
-    except Exception as e:
-        logger.error(f"Error fetching admin: {e}\n{traceback.format_exc()}")
-        return None
-
-@sync_to_async
-def create_project(title, description, city, tags, creator):
-    logger.info(f"Creating project: {title} by {creator.username}")
-    try:
-        project = Project.objects.create(
-            title=title,
-            description=description,
-            city=city,
-            creator=creator,
-            status='pending'
-        )
-        project.tags.add(*tags.split(','))
-        logger.info(f"Project created: {project.title} (id: {project.id})")
-        return project
-    except Exception as e:
-        logger.error(f"Error creating project: {e}\n{traceback.format_exc()}")
-        raise
-
-@sync_to_async
-def get_volunteers_for_project(creator):
-    logger.info(f"Fetching volunteers for creator: {creator.username}")
-    try:
-        projects = Project.objects.filter(creator=creator).prefetch_related('volunteer_projects__volunteer')
-        result = []
-        for project in projects:
-            volunteers = [vp.volunteer.username for vp in project.volunteer_projects.all()]
-            result.append((project.title, volunteers))
-        logger.info(f"Found {len(result)} projects with volunteers for {creator.username}")
-        return result
-    except Exception as e:
-        logger.error(f"Error fetching volunteers: {e}\n{traceback.format_exc()}")
-        raise
-
-@sync_to_async
-def get_organizer_projects(organizer):
-    logger.info(f"Fetching projects for organizer: {organizer.username}")
-    try:
-        projects = Project.objects.filter(creator=organizer, status='approved')
-        result = [(project, project.title) for project in projects]
-        logger.info(f"Found {len(result)} projects for organizer {organizer.username}: {[p[1] for p in result]}")
-        return result
-    except Exception as e:
-        logger.error(f"Error fetching organizer projects: {e}\n{traceback.format_exc()}")
-        raise
-
-@sync_to_async
-def get_project_volunteers(project):
-    logger.info(f"Fetching volunteers for project: {project.title} (id: {project.id})")
-    try:
-        volunteer_projects = VolunteerProject.objects.filter(project=project, is_active=True).select_related('volunteer')
-        logger.info(f"Found {volunteer_projects.count()} VolunteerProject records")
-        for vp in volunteer_projects:
-            logger.info(f"VolunteerProject id={vp.id}, volunteer={vp.volunteer.username if vp.volunteer else 'None'}, is_active={vp.is_active}")
-        result = []
-        for vp in volunteer_projects:
-            if vp.volunteer:
-                logger.info(f"Found volunteer: {vp.volunteer.username} (telegram_id: {vp.volunteer.telegram_id})")
-                result.append((vp.volunteer, vp.volunteer.username, vp.volunteer.telegram_id))
-            else:
-                logger.warning(f"VolunteerProject {vp.id} has no volunteer")
-        logger.info(f"Total volunteers found: {len(result)}")
-        return result
-    except Exception as e:
-        logger.error(f"Error fetching project volunteers: {e}\n{traceback.format_exc()}")
-        raise
-
-@sync_to_async
-def create_task(project, creator, text, deadline_date, start_time, end_time, photo_path=None):
-    logger.info(f"Creating task for project: {project.title} by {creator.username}")
-    try:
-        task = Task.objects.create(project=project, creator=creator, text=text, deadline_date=deadline_date, start_time=start_time, end_time=end_time)
-        if photo_path:
-            task.task_image = photo_path
-            task.save()
-        logger.info(f"Task created: {task.id}")
-        return task
-    except Exception as e:
-        logger.error(f"Error creating task: {e}\n{traceback.format_exc()}")
-        raise
-
-@sync_to_async
-def get_pending_photos_for_organizer(organizer, page=0, per_page=PHOTOS_PER_PAGE):
-    logger.info(f"Fetching pending photos for organizer: {organizer.username}, page: {page}")
-    try:
-        photos = Photo.objects.filter(project__creator=organizer, status='pending').select_related('volunteer', 'project', 'task')
-        total = photos.count()
-        photos = photos[page * per_page:(page + 1) * per_page]
-        result = [(photo, photo.volunteer.username, photo.project.title, photo.task) for photo in photos]
-        logger.info(f"Found {len(result)} pending photos for organizer {organizer.username} on page {page}")
-        return result, total
-    except Exception as e:
-        logger.error(f"Error fetching pending photos: {e}\n{traceback.format_exc()}")
-        raise
-
-@sync_to_async
-def approve_photo(photo):
-    logger.info(f"Approving photo from {photo.volunteer.username} for project {photo.project.title}")
-    try:
-        photo.status = 'approved'
-        photo.moderated_at = timezone.now()
-        photo.save()
-        logger.info(f"Photo approved: {photo.id}")
-    except Exception as e:
-        logger.error(f"Error approving photo: {e}\n{traceback.format_exc()}")
-        raise
-
 async def reject_photo(photo, context):
-    logger.info(f"Rejecting photo from {photo.volunteer.username} for project {photo.project.title}")
+    logger.info("Rejecting photo from %s for project %s", photo.volunteer.username, photo.project.title)
     try:
         photo.status = 'rejected'
         photo.moderated_at = timezone.now()
-        await sync_to_async(photo.save)()
+        await photo.asave()
         logger.info("Photo rejected")
 
         if photo.volunteer.telegram_id:
@@ -178,10 +50,36 @@ async def reject_photo(photo, context):
                 text=f"Ваше фото для проекта {photo.project.title} отклонено организатором."
             )
     except Exception as e:
-        logger.error(f"Error rejecting photo: {e}\n{traceback.format_exc()}")
+        logger.error("Error rejecting photo: %s", e, exc_info=True)
         raise
 
 
+async def send_moderation_photo(context, chat_id, photo, volunteer_username, project_title, task):
+    """Отправляет организатору фото на проверку с кнопками модерации.
+
+    Фото отправляется по file_id, полученному от волонтёра; файл с диска читается, только если
+    Telegram его не примет. Возвращает False, если фото отправить не удалось (файла нет).
+    """
+    buttons = [
+        [InlineKeyboardButton("✅ Подтверждаю выполнение", callback_data=f"mod_photo_action_0_approve"),
+         InlineKeyboardButton("❌ Отклонить", callback_data=f"mod_photo_action_0_reject")]
+    ]
+    keyboard = InlineKeyboardMarkup(buttons)
+    logger.info("Sending photo %s with keyboard: %s", photo.id, buttons)
+    deadline_date = task.deadline_date.strftime('%d-%m-%Y') if task else "Не указана"
+    time_range = f"{task.start_time.strftime('%H:%M')} - {task.end_time.strftime('%H:%M')}" if task else "Не указано"
+    try:
+        await media_registry.send_photo(
+            context.bot, chat_id, photo.image.name, file_id=photo.file_id,
+            caption=f"Фото от {volunteer_username} (проект: {project_title})\nЗадание: {task.text if task else 'Нет задания'}\nСрок выполнение: {deadline_date}\nВремя: {time_range}",
+            reply_markup=keyboard
+        )
+    except FileNotFoundError:
+        logger.error("File not found: %s", photo.image.name)
+        return False
+    return True
+
+
 async def notify_organizer_status(user, context):
     try:
         if user.telegram_id:  # Проверяем, что telegram_id не пустой
@@ -190,17 +88,17 @@ async def notify_organizer_status(user, context):
                     chat_id=user.telegram_id,
                     text="Ваш запрос на статус организатора одобрен!"
                 )
-                logger.info(f"Notification sent to {user.username}: Status approved")
+                logger.info("Notification sent to %s: Status approved", user.username)
             else:
                 await context.bot.send_message(
                     chat_id=user.telegram_id,
                     text="Ваш запрос на статус организатора отклонён."
                 )
-                logger.info(f"Notification sent to {user.username}: Status rejected")
+                logger.info("Notification sent to %s: Status rejected", user.username)
         else:
-            logger.warning(f"No telegram_id for user {user.username}, notification not sent")
+            logger.warning("No telegram_id for user %s, notification not sent", user.username)
     except Exception as e:
-        logger.error(f"Error notifying user {user.username}: {e}\n{traceback.format_exc()}")
+        logger.error("Error notifying user %s: %s", user.username, e, exc_info=True)
 
 # Функции для создания календаря
 def create_year_keyboard():
@@ -268,13 +166,13 @@ async def notify_project_status(user, project, status, context):
                     chat_id=user.telegram_id,
                     text=message
                 )
-                logger.info(f"Notification sent to {user.username} (telegram_id: {user.telegram_id}): Project {project.title} {status}")
+                logger.info("Notification sent to %s (telegram_id: %s): Project %s %s", user.username, user.telegram_id, project.title, status)
             except Exception as e:
-                logger.error(f"Failed to send notification to {user.username}: {e}")
+                logger.error("Failed to send notification to %s: %s", user.username, e)
         else:
-            logger.warning(f"User {user.username if user else 'None'} has no telegram_id, notification not sent")
+            logger.warning("User %s has no telegram_id, notification not sent", user.username if user else 'None')
     except Exception as e:
-        logger.error(f"Error in notify_project_status: {e}\n{traceback.format_exc()}")
+        logger.error("Error in notify_project_status: %s", e, exc_info=True)
 
 def create_time_keyboard(context, is_start=True):
     buttons = []
@@ -306,7 +204,7 @@ def get_pagination_keyboard(page, total_pages):
 async def org_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.message.from_user
     telegram_id = str(user.id)
-    logger.info(f"Org menu requested by telegram_id: {telegram_id}")
+    logger.info("Org menu requested by telegram_id: %s", telegram_id)
     
     db_user = await get_user(telegram_id)
     if not db_user:
@@ -314,7 +212,7 @@ async def org_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     if not db_user.is_organizer:
-        logger.warning(f"Access denied for telegram_id: {telegram_id}, not an organizer")
+        logger.warning("Access denied for telegram_id: %s, not an organizer", telegram_id)
         if db_user.organization_name:
             await update.message.reply_text("Ваш запрос на статус организатора находится на рассмотрении.")
         else:
@@ -342,7 +240,7 @@ async def create_project_start(update, context):
         "Давайте создадим новый проект.\nВведите название проекта:",
         reply_markup=ReplyKeyboardRemove()
     )
-    logger.info(f"Started project creation for telegram_id: {telegram_id}")
+    logger.info("Started project creation for telegram_id: %s", telegram_id)
     return TITLE
 
 async def create_project_title(update, context):
@@ -351,7 +249,7 @@ async def create_project_title(update, context):
     if not context.user_data['title']:
         await update.message.reply_text("Название проекта не может быть пустым. Введите название:")
         return TITLE
-    logger.info(f"Project title set: {context.user_data['title']} for telegram_id: {telegram_id}")
+    logger.info("Project title set: %s for telegram_id: %s", context.user_data['title'], telegram_id)
     await update.message.reply_text("Введите описание проекта:")
     return DESCRIPTION
 
@@ -361,7 +259,7 @@ async def create_project_description(update, context):
     if not context.user_data['description']:
         await update.message.reply_text("Описание проекта не может быть пустым. Введите описание:")
         return DESCRIPTION
-    logger.info(f"Project description set: {context.user_data['description']} for telegram_id: {telegram_id}")
+    logger.info("Project description set: %s for telegram_id: %s", context.user_data['description'], telegram_id)
     await update.message.reply_text("Введите город проекта:")
     return CITY
 
@@ -371,25 +269,93 @@ async def create_project_city(update, context):
     if not context.user_data['city']:
         await update.message.reply_text("Город проекта не может быть пустым. Введите город:")
         return CITY
-    logger.info(f"Project city set: {context.user_data['city']} for telegram_id: {telegram_id}")
+    logger.info("Project city set: %s for telegram_id: %s", context.user_data['city'], telegram_id)
     await update.message.reply_text("Введите теги проекта (через запятую, например: уборка, экология):")
     return TAGS
 
+def get_tag_suggestions_keyboard(tags, suggestions):
+    # В callback_data индексы, а не названия: названия могут не влезть в 64 байта
+    buttons = [
+        [InlineKeyboardButton(f"{tag} → {suggestion}", callback_data=f"tag_fix_{i}_{j}")]
+        for i, tag in enumerate(tags) if tag in suggestions
+        for j, suggestion in enumerate(suggestions[tag])
+    ]
+    buttons.append([InlineKeyboardButton("Оставить как есть", callback_data="tags_keep")])
+    return InlineKeyboardMarkup(buttons)
+
+async def ask_project_location(message):
+    await message.reply_text(
+        "Отправьте место проведения, чтобы волонтёры поблизости нашли проект, или нажмите «Пропустить».",
+        reply_markup=ReplyKeyboardMarkup(
+            [[KeyboardButton("📍 Отправить геопозицию", request_location=True)], ["Пропустить"]],
+            resize_keyboard=True, one_time_keyboard=True
+        )
+    )
+    return LOCATION
+
 async def create_project_tags(update, context):
     telegram_id = context.user_data.get('telegram_id')
-    tags = update.message.text.strip()
+    tags = list(dict.fromkeys(filter(None, map(normalize_tag, update.message.text.split(',')))))
     if not tags:
         await update.message.reply_text("Теги не могут быть пустыми. Введите теги:")
         return TAGS
-    logger.info(f"Project tags set: {tags} for telegram_id: {telegram_id}")
+    logger.info("Project tags set: %s for telegram_id: %s", tags, telegram_id)
+    context.user_data['tags'] = tags
+
+    # Новые теги, похожие на существующие, предлагаем заменить: иначе «экология», «экологя» и
+    # «эко» станут тремя разными тегами и поиск по тегу найдёт только часть проектов
+    suggestions = await suggest_tags(tags)
+    if suggestions:
+        context.user_data['tag_suggestions'] = suggestions
+        await update.message.reply_text(
+            "Похожие теги уже есть. Выберите существующий, чтобы волонтёры находили проекты по одному тегу:",
+            reply_markup=get_tag_suggestions_keyboard(tags, suggestions)
+        )
+        return TAGS
+    return await ask_project_location(update.message)
+
+async def create_project_tag_choice(update, context):
+    query = update.callback_query
+    await query.answer()
+    tags = context.user_data.get('tags', [])
+    suggestions = context.user_data.get('tag_suggestions', {})
+
+    if query.data.startswith('tag_fix_'):
+        try:
+            i, j = map(int, query.data[len('tag_fix_'):].split('_'))
+            tag = tags[i]
+            replacement = suggestions.pop(tag)[j]
+        except (ValueError, IndexError, KeyError) as e:
+            logger.warning("Invalid tag suggestion callback_data %s: %s", query.data, e)
+        else:
+            # Замена может совпасть с другим введённым тегом
+            tags[i] = replacement
+            context.user_data['tags'] = list(dict.fromkeys(tags))
+            logger.info("Tag %s replaced with %s", tag, replacement)
+        if suggestions:
+            await query.message.edit_reply_markup(
+                reply_markup=get_tag_suggestions_keyboard(context.user_data['tags'], suggestions)
+            )
+            return TAGS
+
+    context.user_data.pop('tag_suggestions', None)
+    await query.message.reply_text(f"Теги проекта: {', '.join(context.user_data['tags'])}")
+    return await ask_project_location(query.message)
+
+async def create_project_location(update, context):
+    telegram_id = context.user_data.get('telegram_id')
+    location = update.message.location
+    latitude, longitude = (location.latitude, location.longitude) if location else (None, None)
+    logger.info("Project location set: %s, %s for telegram_id: %s", latitude, longitude, telegram_id)
 
     db_user = await get_user(telegram_id)
     title = context.user_data['title']
     description = context.user_data['description']
     city = context.user_data['city']
+    tags = context.user_data['tags']
 
     try:
-        project = await create_project(title, description, city, tags, db_user)
+        project = await create_project(title, description, city, tags, db_user, latitude=latitude, longitude=longitude)
         await update.message.reply_text(
             f"Проект '{project.title}' создан и отправлен на модерацию!",
             reply_markup=get_org_keyboard()
@@ -402,13 +368,13 @@ async def create_project_tags(update, context):
                     chat_id=admin.telegram_id,
                     text=f"Создан новый проект '{project.title}' от {db_user.username}. Проверьте его в админ-панели."
                 )
-                logger.info(f"Admin {admin.username} (telegram_id: {admin.telegram_id}) notified about new project: {project.title}")
+                logger.info("Admin %s (telegram_id: %s) notified about new project: %s", admin.username, admin.telegram_id, project.title)
             except Exception as e:
-                logger.error(f"Failed to notify admin about new project: {e}\n{traceback.format_exc()}")
+                logger.error("Failed to notify admin about new project: %s", e, exc_info=True)
         else:
-            logger.warning(f"Admin not found or telegram_id missing for admin: {admin.username if admin else 'None'}")
+            logger.warning("Admin not found or telegram_id missing for admin: %s", admin.username if admin else 'None')
     except Exception as e:
-        logger.error(f"Error in create_project_tags: {e}\n{traceback.format_exc()}")
+        logger.error("Error in create_project_location: %s", e, exc_info=True)
         await update.message.reply_text("Ошибка при создании проекта. Попробуйте снова.")
         return ConversationHandler.END
 
@@ -451,7 +417,7 @@ async def manage_volunteers(update, context):
             response += f"Проект: {project_title}\nВолонтёры: {volunteers_text}\n\n"
         await query.message.reply_text(response)
     except Exception as e:
-        logger.error(f"Error in manage_volunteers: {e}\n{traceback.format_exc()}")
+        logger.error("Error in manage_volunteers: %s", e, exc_info=True)
         await query.message.reply_text("Ошибка при получении списка волонтёров.")
 
 async def send_task_start(update, context):
@@ -479,11 +445,11 @@ async def send_task_start(update, context):
         keyboard = InlineKeyboardMarkup(buttons)
         await query.message.reply_text("Выберите проект для отправки задания:", reply_markup=keyboard)
 
-        context.user_data['projects'] = projects
-        context.user_data['organizer'] = db_user
+        # В user_data только id и названия: состояние сохраняется между перезапусками (persistence.py)
+        context.user_data['projects'] = [[project.id, title] for project, title in projects]
         return SELECT_PROJECT
     except Exception as e:
-        logger.error(f"Error in send_task_start: {e}\n{traceback.format_exc()}")
+        logger.error("Error in send_task_start: %s", e, exc_info=True)
         await query.message.reply_text("Ошибка при выборе проекта.")
         return ConversationHandler.END
 
@@ -499,14 +465,14 @@ async def select_project(update, context):
     try:
         choice = int(query.data.split('_')[2])
     except (ValueError, IndexError) as e:
-        logger.error(f"Invalid callback_data format: {query.data}, error: {e}\n{traceback.format_exc()}")
+        logger.error("Invalid callback_data format: %s, error: %s", query.data, e, exc_info=True)
         await query.message.reply_text("Ошибка: неверный выбор проекта.")
         return ConversationHandler.END
 
     projects = context.user_data.get('projects', [])
     if 0 <= choice < len(projects):
-        project = projects[choice][0]
-        context.user_data['selected_project'] = project
+        project_id, project_title = projects[choice]
+        context.user_data['selected_project_id'] = project_id
         buttons = [
             [InlineKeyboardButton("Всем волонтёрам", callback_data="task_recipients_all"),
              InlineKeyboardButton("Одному волонтёру", callback_data="task_recipients_one")],
@@ -515,7 +481,7 @@ async def select_project(update, context):
         ]
         keyboard = InlineKeyboardMarkup(buttons)
         await query.message.reply_text(
-            f"Проект: {project.title}\nКому отправить задание?",
+            f"Проект: {project_title}\nКому отправить задание?",
             reply_markup=keyboard
         )
         return SELECT_RECIPIENTS
@@ -532,15 +498,15 @@ async def select_recipients(update, context):
         context.user_data.clear()
         return ConversationHandler.END
 
-    project = context.user_data.get('selected_project')
     if query.data == "task_recipients_all":
-        context.user_data['recipients'] = 'all'
+        context.user_data['recipients'] = query.data
         await query.message.reply_text("Введите текст задания:")
         return TASK_TEXT
     elif query.data in ["task_recipients_one", "task_recipients_multiple"]:
         context.user_data['recipients'] = query.data
         try:
-            volunteers = await get_project_volunteers(project)
+            project = await get_project(context.user_data.get('selected_project_id'))
+            volunteers = await get_project_volunteers(project) if project else []
             if not volunteers:
                 await query.message.reply_text("В этом проекте нет волонтёров.")
                 return ConversationHandler.END
@@ -557,11 +523,11 @@ async def select_recipients(update, context):
                 "Выберите одного волонтёра:" if query.data == "task_recipients_one" else "Выберите волонтёров (нажмите 'Готово' после выбора):",
                 reply_markup=keyboard
             )
-            context.user_data['volunteers'] = volunteers
+            context.user_data['volunteers'] = [[volunteer.id, username] for volunteer, username, _ in volunteers]
             context.user_data['selected_volunteers'] = []
             return SELECT_VOLUNTEERS
         except Exception as e:
-            logger.error(f"Error in select_recipients: {e}\n{traceback.format_exc()}")
+            logger.error("Error in select_recipients: %s", e, exc_info=True)
             await query.message.reply_text("Ошибка при выборе волонтёров.")
             return ConversationHandler.END
 
@@ -585,25 +551,25 @@ async def select_volunteers(update, context):
     try:
         choice = int(query.data.split('_')[2])
     except (ValueError, IndexError) as e:
-        logger.error(f"Invalid callback_data format: {query.data}, error: {e}\n{traceback.format_exc()}")
+        logger.error("Invalid callback_data format: %s, error: %s", query.data, e, exc_info=True)
         await query.message.reply_text("Ошибка: неверный выбор волонтёра.")
         return SELECT_VOLUNTEERS
 
     volunteers = context.user_data.get('volunteers', [])
     if 0 <= choice < len(volunteers):
-        volunteer = volunteers[choice][0]
+        volunteer_id, volunteer_username = volunteers[choice]
         if context.user_data['recipients'] == "task_recipients_one":
-            context.user_data['selected_volunteers'] = [volunteer]
+            context.user_data['selected_volunteers'] = [volunteer_id]
             await query.message.reply_text("Введите текст задания:")
             return TASK_TEXT
         else:
             selected_volunteers = context.user_data.get('selected_volunteers', [])
-            if volunteer not in selected_volunteers:
-                selected_volunteers.append(volunteer)
+            if volunteer_id not in selected_volunteers:
+                selected_volunteers.append(volunteer_id)
                 context.user_data['selected_volunteers'] = selected_volunteers
-                await query.message.reply_text(f"Выбран волонтёр: {volunteer.username}. Выберите ещё или нажмите 'Готово'.")
+                await query.message.reply_text(f"Выбран волонтёр: {volunteer_username}. Выберите ещё или нажмите 'Готово'.")
             else:
-                await query.message.reply_text(f"Волонтёр {volunteer.username} уже выбран. Выберите другого или нажмите 'Готово'.")
+                await query.message.reply_text(f"Волонтёр {volunteer_username} уже выбран. Выберите другого или нажмите 'Готово'.")
             return SELECT_VOLUNTEERS
     else:
         await query.message.reply_text("Неверный выбор волонтёра.")
@@ -614,8 +580,8 @@ async def task_text(update, context):
     if not context.user_data['task_text']:
         await update.message.reply_text("Текст задания не может быть пустым. Введите текст:")
         return TASK_TEXT
-    logger.info(f"Task text set: {context.user_data['task_text']}")
-    keyboard = await sync_to_async(create_year_keyboard)()
+    logger.info("Task text set: %s", context.user_data['task_text'])
+    keyboard = create_year_keyboard()
     await update.message.reply_text("Выберите дату и срок выполнение:", reply_markup=keyboard)
     return TASK_DEADLINE_DATE
 
@@ -631,11 +597,11 @@ async def task_deadline_date_year(update, context):
     try:
         year = int(query.data.split('_')[3])
         context.user_data['deadline_date_year'] = year
-        keyboard = await sync_to_async(create_month_keyboard)(year)
+        keyboard = create_month_keyboard(year)
         await query.message.reply_text(f"Вы выбрали год: {year}\nВыберите месяц:", reply_markup=keyboard)
         return TASK_DEADLINE_DATE
     except (ValueError, IndexError) as e:
-        logger.error(f"Invalid year selection: {query.data}, error: {e}\n{traceback.format_exc()}")
+        logger.error("Invalid year selection: %s, error: %s", query.data, e, exc_info=True)
         await query.message.reply_text("Ошибка: неверный выбор года.")
         return TASK_DEADLINE_DATE
 
@@ -652,11 +618,11 @@ async def task_deadline_date_month(update, context):
         month = int(query.data.split('_')[3])
         context.user_data['deadline_date_month'] = month
         year = context.user_data['deadline_date_year']
-        keyboard = await sync_to_async(create_day_keyboard)(year, month)
+        keyboard = create_day_keyboard(year, month)
         await query.message.reply_text(f"Вы выбрали месяц: {month}\nВыберите день:", reply_markup=keyboard)
         return TASK_DEADLINE_DATE
     except (ValueError, IndexError) as e:
-        logger.error(f"Invalid month selection: {query.data}, error: {e}\n{traceback.format_exc()}")
+        logger.error("Invalid month selection: %s, error: %s", query.data, e, exc_info=True)
         await query.message.reply_text("Ошибка: неверный выбор месяца.")
         return TASK_DEADLINE_DATE
 
@@ -675,11 +641,11 @@ async def task_deadline_date_day(update, context):
         month = context.user_data['deadline_date_month']
         deadline_date = datetime(year, month, day).date()
         context.user_data['deadline_date'] = deadline_date
-        keyboard = await sync_to_async(create_time_keyboard)(context, True)
+        keyboard = create_time_keyboard(context, True)
         await query.message.reply_text(f"Вы выбрали дату: {deadline_date}\nВыберите начальное время:", reply_markup=keyboard)
         return TASK_DEADLINE_START_TIME
     except (ValueError, IndexError) as e:
-        logger.error(f"Invalid day selection: {query.data}, error: {e}\n{traceback.format_exc()}")
+        logger.error("Invalid day selection: %s, error: %s", query.data, e, exc_info=True)
         await query.message.reply_text("Ошибка: неверный выбор дня.")
         return TASK_DEADLINE_DATE
 
@@ -696,11 +662,11 @@ async def task_deadline_start_time(update, context):
         hour = int(query.data.split('_')[3])
         start_time = time(hour, 0)
         context.user_data['start_time'] = start_time
-        keyboard = await sync_to_async(create_time_keyboard)(context, False)
+        keyboard = create_time_keyboard(context, False)
         await query.message.reply_text(f"Вы выбрали начальное время: {start_time.strftime('%H:%M')}\nВыберите конечное время:", reply_markup=keyboard)
         return TASK_DEADLINE_END_TIME
     except (ValueError, IndexError) as e:
-        logger.error(f"Invalid start time selection: {query.data}, error: {e}\n{traceback.format_exc()}")
+        logger.error("Invalid start time selection: %s, error: %s", query.data, e, exc_info=True)
         await query.message.reply_text("Ошибка: неверный выбор времени.")
         return TASK_DEADLINE_START_TIME
 
@@ -730,7 +696,7 @@ async def task_deadline_end_time(update, context):
         return TASK_PHOTO
 
     except (ValueError, IndexError) as e:
-        logger.error(f"Invalid end time selection: {query.data}, error: {e}\n{traceback.format_exc()}")
+        logger.error("Invalid end time selection: %s, error: %s", query.data, e, exc_info=True)
         await query.message.reply_text("Ошибка: неверный выбор времени.")
         return TASK_DEADLINE_END_TIME
 
@@ -766,41 +732,9 @@ async def task_photo(update, context):
 async def task_photo_upload(update, context):
     if update.message.photo:
         try:
-            photo_file = await update.message.photo[-1].get_file()
-            current_date = datetime.now()
-            year, month, day = current_date.year, current_date.month, current_date.day
-            save_dir = os.path.join("media", f"tasks/{year}/{month}/{day}")
-            await aiofiles.os.makedirs(save_dir, exist_ok=True)  # Асинхронное создание директории
-            telegram_id = str(update.message.from_user.id)
-            file_name = f"{telegram_id}_{photo_file.file_id}.jpg"
-            file_path = os.path.join(save_dir, file_name)
-
-            # Увеличение тайм-аута и повторные попытки
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    photo_data = await photo_file.download_as_bytearray()  # Тайм-аут 30 секунд
-                    if not photo_data:
-                        raise ValueError("Downloaded photo data is empty")
-                    async with aiofiles.open(file_path, 'wb') as f:
-                        await f.write(photo_data)
-                    logger.info(f"Photo saved to {file_path}")
-                    break
-                except TimedOut as e:  # Используем импортированный TimedOut
-                    logger.warning(f"Attempt {attempt + 1}/{max_retries} failed with timeout: {e}")
-                    if attempt == max_retries - 1:
-                        raise
-                    await asyncio.sleep(2 ** attempt)  # Экспоненциальная задержка между попытками
-
-                try:
-                    photo_data = await photo_file.download_as_bytearray()
-                except Exception as e:
-                    logger.error(f"Error downloading photo: {e}")
-                    await context.bot.send_message(chat_id=update.effective_chat.id, text="Ошибка при загрузке фото. Попробуйте снова.")
-                return
-
-            # Сохраняем относительный путь для базы данных
-            db_file_path = os.path.join(f"tasks/{year}/{month}/{day}", file_name)
+            # Фото скачивается потоком и хранится по хэшу содержимого; там же запоминается его file_id,
+            # чтобы рассылка задания отправляла фото без повторной загрузки
+            db_file_path = await save_telegram_photo(update.message.photo[-1])
             context.user_data['task_photo'] = db_file_path
             buttons = [
                 [InlineKeyboardButton("Отправить", callback_data="task_confirm_send"),
@@ -816,7 +750,7 @@ async def task_photo_upload(update, context):
             )
             return CONFIRM_TASK
         except Exception as e:
-            logger.error(f"Error uploading photo for task: {e}\n{traceback.format_exc()}")
+            logger.error("Error uploading photo for task: %s", e, exc_info=True)
             await update.message.reply_text("Ошибка при загрузке фото. Попробуйте снова.")
             return TASK_PHOTO_UPLOAD
     else:
@@ -833,8 +767,6 @@ async def confirm_task(update, context):
         return ConversationHandler.END
 
     if query.data == "task_confirm_send":
-        project = context.user_data.get('selected_project')
-        organizer = context.user_data.get('organizer')
         text = context.user_data.get('task_text')
         deadline_date = context.user_data.get('deadline_date')
         start_time = context.user_data.get('start_time')
@@ -844,25 +776,29 @@ async def confirm_task(update, context):
         selected_volunteers = context.user_data.get('selected_volunteers', [])
 
         try:
+            project = await get_project(context.user_data.get('selected_project_id'))
+            organizer = await get_user(str(query.from_user.id))
+            if not project or not organizer:
+                await query.message.reply_text("Проект не найден.", reply_markup=get_org_keyboard())
+                context.user_data.clear()
+                return ConversationHandler.END
             task = await create_task(project, organizer, text, deadline_date, start_time, end_time, photo_path)
             
             if recipients == "task_recipients_all":
                 # Получаем волонтёров с отладочными логами
-                volunteers_data = await sync_to_async(list)(VolunteerProject.objects.filter(
-                    project=project
-                ).select_related('volunteer'))
-                logger.info(f"Found {len(volunteers_data)} VolunteerProject records for project {project.title}")
+                volunteers_data = await get_project_memberships(project)
+                logger.info("Found %s VolunteerProject records for project %s", len(volunteers_data), project.title)
                 
                 volunteers = []
                 for vp in volunteers_data:
                     if vp.volunteer and vp.volunteer.telegram_id:
                         volunteers.append(vp.volunteer)
-                        logger.info(f"Volunteer added: {vp.volunteer.username} (telegram_id: {vp.volunteer.telegram_id})")
+                        logger.info("Volunteer added: %s (telegram_id: %s)", vp.volunteer.username, vp.volunteer.telegram_id)
                     else:
-                        logger.warning(f"Skipping VolunteerProject id={vp.id}: no volunteer or telegram_id")
+                        logger.warning("Skipping VolunteerProject id=%s: no volunteer or telegram_id", vp.id)
                 
                 if not volunteers:
-                    logger.warning(f"No valid volunteers found for project {project.title}")
+                    logger.warning("No valid volunteers found for project %s", project.title)
                     await query.message.reply_text(
                         "Задание создано, но в проекте нет активных волонтёров с действительными telegram_id. "
                         "Проверьте список волонтёров в проекте через 'Просмотреть волонтёров'.",
@@ -870,7 +806,7 @@ async def confirm_task(update, context):
                     )
                     return ConversationHandler.END
             else:
-                volunteers = [v for v in selected_volunteers if v.telegram_id]
+                volunteers = [v for v in await get_users_by_ids(selected_volunteers) if v.telegram_id]
 
             if not volunteers:
                 await query.message.reply_text(
@@ -879,133 +815,90 @@ async def confirm_task(update, context):
                 )
                 return ConversationHandler.END
 
-            success_count = 0
-            for volunteer in volunteers:
-                try:
-                    await sync_to_async(TaskAssignment.objects.create)(
-                        task=task, 
-                        volunteer=volunteer
-                    )
-                    
-                    buttons = [
-                        [InlineKeyboardButton("Да, хочу работать", callback_data=f"task_accept_{task.id}")],
-                        [InlineKeyboardButton("Нет, не хочу", callback_data=f"task_decline_{task.id}")]
-                    ]
-                    keyboard = InlineKeyboardMarkup(buttons)
-                    
-                    deadline_date_str = deadline_date.strftime('%d-%m-%Y')
-                    time_range = f"{start_time.strftime('%H:%M')} - {end_time.strftime('%H:%M')}"
-                    
-                    message_text = (
-                        f"Новое задание для проекта {project.title}:\n"
-                        f"{text}\n"
-                        f"Срок выполнения: {deadline_date_str}\n"
-                        f"Время: {time_range}\n"
-                        "Хотите работать над этим заданием?"
-                    )
+            deadline_date_str = deadline_date.strftime('%d-%m-%Y')
+            time_range = f"{start_time.strftime('%H:%M')} - {end_time.strftime('%H:%M')}"
+            message_text = (
+                f"Новое задание для проекта {project.title}:\n"
+                f"{text}\n"
+                f"Срок выполнения: {deadline_date_str}\n"
+                f"Время: {time_range}\n"
+                "Хотите работать над этим заданием?"
+            )
+            buttons = [
+                [["Да, хочу работать", f"task_accept_{task.id}"]],
+                [["Нет, не хочу", f"task_decline_{task.id}"]]
+            ]
 
-                    if photo_path:
-                        try:
-                            async with aiofiles.open(os.path.join("media", photo_path), 'rb') as photo_file:
-                                await context.bot.send_photo(
-                                    chat_id=volunteer.telegram_id,
-                                    photo=await photo_file.read(),
-                                    caption=message_text,
-                                    reply_markup=keyboard
-                                )
-                                success_count += 1
-                        except Exception as e:
-                            logger.error(f"Failed to send photo task to {volunteer.username}: {e}")
-                    else:
-                        await context.bot.send_message(
-                            chat_id=volunteer.telegram_id,
-                            text=message_text,
-                            reply_markup=keyboard
-                        )
-                        success_count += 1
-                except Exception as e:
-                    logger.error(f"Failed to send task to {volunteer.username}: {e}\n{traceback.format_exc()}")
+            # Назначения и список получателей сохраняются одной транзакцией, а сообщения
+            # отправляются в фоне с учётом лимитов Telegram; отчёт придёт организатору
+            broadcast = await create_task_broadcast(task, volunteers, message_text, buttons)
+            get_broadcaster(context.application).start(broadcast.id)
 
             await query.message.reply_text(
-                f"Задание отправлено {success_count} волонтёрам из {len(volunteers)}!",
+                f"Задание создано, рассылка {len(volunteers)} волонтёрам запущена. "
+                "Когда она завершится, вы получите отчёт о доставке.",
                 reply_markup=get_org_keyboard()
             )
             
             context.user_data.clear()
             return ConversationHandler.END
         except Exception as e:
-            logger.error(f"Error in confirm_task: {e}\n{traceback.format_exc()}")
+            logger.error("Error in confirm_task: %s", e, exc_info=True)
             await query.message.reply_text("Ошибка при отправке задания.")
             return ConversationHandler.END
                 
 async def check_photos(update, context):
     query = update.callback_query
     await query.answer() if query else None  # Безопасная обработка, если query отсутствует
-    logger.info(f"Entering check_photos with callback_data: {getattr(query, 'data', 'No callback data')}")
-    logger.info(f"context.user_data at start: {await sync_to_async(lambda: str(context.user_data))()}")
+    logger.info("Entering check_photos with callback_data: %s", getattr(query, 'data', 'No callback data'))
+    logger.debug("context.user_data keys at start: %s", list(context.user_data))
 
     user = query.from_user if query else update.message.from_user
     telegram_id = str(user.id)
     db_user = await get_user(telegram_id)
     if not db_user or not db_user.is_organizer:
-        logger.warning(f"Access denied for telegram_id: {telegram_id}, not an organizer")
+        logger.warning("Access denied for telegram_id: %s, not an organizer", telegram_id)
         await (update.message.reply_text if not query else query.message.reply_text)("У вас нет прав организатора.")
         return ConversationHandler.END
 
     page = context.user_data.get('photos_page', 0)
     try:
-        photos, total = await get_pending_photos_for_organizer(db_user, page)
-        logger.info(f"Fetched photos: {len(photos)} photos, total: {total}")
+        photos, total = await get_pending_photos_for_organizer(db_user, page, PHOTOS_PER_PAGE)
+        logger.info("Fetched photos: %s photos, total: %s", len(photos), total)
         if not photos:
             logger.info("No pending photos found")
             await (update.message.reply_text if not query else query.message.reply_text)("Нет фото, ожидающих проверки.")
             return ConversationHandler.END
 
         total_pages = (total + PHOTOS_PER_PAGE - 1) // PHOTOS_PER_PAGE
-        context.user_data['pending_photos'] = photos
+        context.user_data['pending_photos'] = [item[0].id for item in photos]
         context.user_data['photos_page'] = page
-        context.user_data['selected_photo'] = photos[0][0]  # Сохраняем первое фото
-        logger.info(f"Saved pending_photos: {len(photos)} photos, page: {page}, total_pages: {total_pages}, selected_photo: {photos[0][0].id}")
+        context.user_data['selected_photo'] = photos[0][0].id  # Сохраняем первое фото
+        logger.info("Saved pending_photos: %s photos, page: %s, total_pages: %s, selected_photo: %s", len(photos), page, total_pages, photos[0][0].id)
 
         photo, volunteer_username, project_title, task = photos[0]
-        logger.info(f"Processing photo: id={photo.id}, path={photo.image.path}")
-        if not await sync_to_async(os.path.exists)(photo.image.path):
-            logger.error(f"File not found: {photo.image.path}")
-            await query.message.reply_text("Ошибка: файл фото не найден.")
+        logger.info("Processing photo: id=%s, path=%s", photo.id, photo.image.name)
+        if not await send_moderation_photo(context, update.effective_chat.id, photo, volunteer_username, project_title, task):
+            await (update.message.reply_text if not query else query.message.reply_text)("Ошибка: файл фото не найден.")
             return ConversationHandler.END
 
-        async with aiofiles.open(photo.image.path, 'rb') as photo_file:
-            buttons = [
-                [InlineKeyboardButton("✅ Подтверждаю выполнение", callback_data=f"mod_photo_action_0_approve"),
-                 InlineKeyboardButton("❌ Отклонить", callback_data=f"mod_photo_action_0_reject")]
-            ]
-            keyboard = InlineKeyboardMarkup(buttons)
-            logger.info(f"Sending photo with keyboard: {buttons}")
-            deadline_date = task.deadline_date.strftime('%d-%m-%Y') if task else "Не указана"
-            time_range = f"{task.start_time.strftime('%H:%M')} - {task.end_time.strftime('%H:%M')}" if task else "Не указано"
-            await (update.message.reply_photo if not query else query.message.reply_photo)(
-                photo=await photo_file.read(),
-                caption=f"Фото от {volunteer_username} (проект: {project_title})\nЗадание: {task.text if task else 'Нет задания'}\nСрок выполнение: {deadline_date}\nВремя: {time_range}",
-                reply_markup=keyboard
-            )
-
         keyboard = get_pagination_keyboard(page, total_pages)
         await (update.message.reply_text if not query else query.message.reply_text)(
             f"Фото, ожидающие проверки (страница {page + 1} из {total_pages}):",
             reply_markup=keyboard
         )
-        logger.info(f"Transitioning to MODERATE_PHOTO state")
+        logger.info("Transitioning to MODERATE_PHOTO state")
         return MODERATE_PHOTO
     except Exception as e:
-        logger.error(f"Error in check_photos: {e}\n{traceback.format_exc()}")
+        logger.error("Error in check_photos: %s", e, exc_info=True)
         await (update.message.reply_text if not query else query.message.reply_text)(f"Ошибка при отображении фото: {str(e)}")
         return ConversationHandler.END
 
 async def handle_photo_moderation_selection(update, context):
     query = update.callback_query
     await query.answer()
-    logger.info(f"Received callback_data in handle_photo_moderation_selection: {query.data}")
-    logger.info(f"context.user_data in handle_photo_moderation_selection: {await sync_to_async(lambda: str(context.user_data))()}")
+    logger.info("Received callback_data in handle_photo_moderation_selection: %s", query.data)
+    logger.debug("context.user_data keys in handle_photo_moderation_selection: %s", list(context.user_data))
 
     if query.data == "cancel_moderate":
         logger.info("Canceling photo moderation")
@@ -1014,16 +907,16 @@ async def handle_photo_moderation_selection(update, context):
         return ConversationHandler.END
 
     if not query.data.startswith("photo_"):
-        logger.warning(f"Unexpected callback_data in handle_photo_moderation_selection: {query.data}")
+        logger.warning("Unexpected callback_data in handle_photo_moderation_selection: %s", query.data)
         await query.message.reply_text("Ошибка: неверная команда.")
         return MODERATE_PHOTO
 
     try:
         action, page = query.data.split('_')[1:3]
         page = int(page)
-        logger.info(f"Pagination action: {action}, page: {page}")
+        logger.info("Pagination action: %s, page: %s", action, page)
     except (ValueError, IndexError) as e:
-        logger.error(f"Invalid pagination callback_data: {query.data}, error: {e}\n{traceback.format_exc()}")
+        logger.error("Invalid pagination callback_data: %s, error: %s", query.data, e, exc_info=True)
         await query.message.reply_text("Ошибка: неверный формат пагинации.")
         return MODERATE_PHOTO
 
@@ -1032,7 +925,7 @@ async def handle_photo_moderation_selection(update, context):
     elif action == "next":
         page += 1
     else:
-        logger.error(f"Unknown pagination action: {action}")
+        logger.error("Unknown pagination action: %s", action)
         await query.message.reply_text("Ошибка: неизвестное действие пагинации.")
         return MODERATE_PHOTO
 
@@ -1042,11 +935,11 @@ async def handle_photo_moderation_selection(update, context):
     db_user = await get_user(telegram_id)
     try:
         context.user_data['photos_page'] = page
-        photos, total = await get_pending_photos_for_organizer(db_user, page)
+        photos, total = await get_pending_photos_for_organizer(db_user, page, PHOTOS_PER_PAGE)
         total_pages = (total + PHOTOS_PER_PAGE - 1) // PHOTOS_PER_PAGE
-        context.user_data['pending_photos'] = photos
-        context.user_data['selected_photo'] = photos[0][0] if photos else None
-        logger.info(f"Updated pending_photos: {len(photos)} photos, page: {page}, total_pages: {total_pages}")
+        context.user_data['pending_photos'] = [item[0].id for item in photos]
+        context.user_data['selected_photo'] = photos[0][0].id if photos else None
+        logger.info("Updated pending_photos: %s photos, page: %s, total_pages: %s", len(photos), page, total_pages)
 
         if not photos:
             logger.info("No photos on this page")
@@ -1055,26 +948,10 @@ async def handle_photo_moderation_selection(update, context):
             return ConversationHandler.END
 
         photo, volunteer_username, project_title, task = photos[0]
-        if not await sync_to_async(os.path.exists)(photo.image.path):
-            logger.error(f"File not found: {photo.image.path}")
-            await query.message.reply_text(f"Ошибка: файл фото {photo.image.path} не найден.")
+        if not await send_moderation_photo(context, query.message.chat_id, photo, volunteer_username, project_title, task):
+            await query.message.reply_text(f"Ошибка: файл фото {photo.image.name} не найден.")
             return ConversationHandler.END
 
-        async with aiofiles.open(photo.image.path, 'rb') as photo_file:
-            buttons = [
-                [InlineKeyboardButton("✅ Подтверждаю выполнение", callback_data=f"mod_photo_action_0_approve"),
-                 InlineKeyboardButton("❌ Отклонить", callback_data=f"mod_photo_action_0_reject")]
-            ]
-            keyboard = InlineKeyboardMarkup(buttons)
-            logger.info(f"Sending photo with keyboard: {buttons}")
-            deadline_date = task.deadline_date.strftime('%d-%m-%Y') if task else "Не указана"
-            time_range = f"{task.start_time.strftime('%H:%M')} - {task.end_time.strftime('%H:%M')}" if task else "Не указано"
-            await query.message.reply_photo(
-                photo=await photo_file.read(),
-                caption=f"Фото от {volunteer_username} (проект: {project_title})\nЗадание: {task.text if task else 'Нет задания'}\nСрок выполнение: {deadline_date}\nВремя: {time_range}",
-                reply_markup=keyboard
-            )
-
         keyboard = get_pagination_keyboard(page, total_pages)
         await query.message.reply_text(
             f"Фото, ожидающие проверки (страница {page + 1} из {total_pages}):",
@@ -1082,14 +959,14 @@ async def handle_photo_moderation_selection(update, context):
         )
         return MODERATE_PHOTO
     except Exception as e:
-        logger.error(f"Error in handle_photo_moderation_selection: {e}\n{traceback.format_exc()}")
+        logger.error("Error in handle_photo_moderation_selection: %s", e, exc_info=True)
         await query.message.reply_text(f"Ошибка при обработке пагинации: {str(e)}")
         return MODERATE_PHOTO
 
 async def handle_photo_moderation_action(update, context):
     query = update.callback_query
     await query.answer()
-    logger.info(f"Processing photo moderation action with data: {query.data}")
+    logger.info("Processing photo moderation action with data: %s", query.data)
 
     if not context.user_data.get('pending_photos'):
         logger.error("No pending_photos in context.user_data")
@@ -1099,24 +976,30 @@ async def handle_photo_moderation_action(update, context):
     try:
         parts = query.data.split('_')
         if len(parts) != 5 or parts[0:3] != ['mod', 'photo', 'action']:
-            logger.error(f"Invalid callback_data structure: {query.data}")
+            logger.error("Invalid callback_data structure: %s", query.data)
             await query.message.reply_text("Ошибка: неверный формат команды.")
             return ConversationHandler.END
         choice = int(parts[3])
         action = parts[4]
     except (ValueError, IndexError) as e:
-        logger.error(f"Invalid callback_data format: {query.data}, error: {e}")
+        logger.error("Invalid callback_data format: %s, error: %s", query.data, e)
         await query.message.reply_text("Ошибка: неверный формат данных.")
         return ConversationHandler.END
 
     photos = context.user_data.get('pending_photos', [])
     if not (0 <= choice < len(photos)):
-        logger.error(f"Invalid photo choice: {choice}, available photos: {len(photos)}")
+        logger.error("Invalid photo choice: %s, available photos: %s", choice, len(photos))
         await query.message.reply_text("Ошибка: выбранное фото недоступно.")
         return ConversationHandler.END
 
-    photo, volunteer_username, project_title, task = photos[choice]
-    context.user_data['selected_photo'] = photo
+    try:
+        photo = await get_photo(photos[choice])
+    except ObjectDoesNotExist:
+        logger.warning("Photo %s no longer exists", photos[choice])
+        await query.message.reply_text("Ошибка: выбранное фото недоступно.")
+        return ConversationHandler.END
+    volunteer_username, project_title, task = photo.volunteer.username, photo.project.title, photo.task
+    context.user_data['selected_photo'] = photo.id
 
     try:
         if action == "approve":
@@ -1140,22 +1023,22 @@ async def handle_photo_moderation_action(update, context):
             )
             return await show_next_photo(update, context)
         else:
-            logger.error(f"Unknown action: {action}")
+            logger.error("Unknown action: %s", action)
             await query.message.reply_text("Ошибка: неизвестное действие.")
             return MODERATE_PHOTO
     except Exception as e:
-        logger.error(f"Failed to process action '{action}' for photo {photo.id}: {e}")
+        logger.error("Failed to process action '%s' for photo %s: %s", action, photo.id, e)
         await query.message.reply_text(f"Ошибка при обработке фото: {str(e)}")
         return ConversationHandler.END
     
 # Обработчик команды /moderate_photos
 async def moderate_photos_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    logger.info(f"Received /moderate_photos command from telegram_id: {update.message.from_user.id}")
+    logger.info("Received /moderate_photos command from telegram_id: %s", update.message.from_user.id)
     user = update.message.from_user
     telegram_id = str(user.id)
     db_user = await get_user(telegram_id)
     if not db_user or not db_user.is_organizer:
-        logger.warning(f"Access denied for telegram_id: {telegram_id}, not an organizer")
+        logger.warning("Access denied for telegram_id: %s, not an organizer", telegram_id)
         await update.message.reply_text("У вас нет прав организатора.")
         return
 
@@ -1199,24 +1082,22 @@ async def handle_rating_selection(update, context):
 
     try:
         photo_id = context.user_data['awaiting_rating_for']
-        photo = await sync_to_async(Photo.objects.select_related('volunteer').get)(id=photo_id)
+        photo = await get_photo(photo_id)
 
         if query.data == "rating_skip":
             rating = None
             message = "Оценка пропущена."
             photo.status = 'approved'
             photo.moderated_at = timezone.now()
-            await sync_to_async(photo.save)()
+            await photo.asave()
         else:
             rating = int(query.data.split('_')[1])
             photo.rating = rating
             photo.status = 'approved'
             photo.moderated_at = timezone.now()
-            await sync_to_async(photo.save)()
+            await photo.asave()
             if rating:
-                volunteer = photo.volunteer
-                volunteer.rating = min(100, volunteer.rating + rating * 2)
-                await sync_to_async(volunteer.save)()
+                await rate_volunteer(photo.volunteer, rating, 'photo', photo=photo)
             message = f"Оценка {rating}★ сохранена."
 
         if photo.volunteer.telegram_id:
@@ -1234,7 +1115,7 @@ async def handle_rating_selection(update, context):
         await query.message.edit_text(f"{message} Спасибо!")
         return await show_next_photo(update, context)
     except Exception as e:
-        logger.error(f"Error handling rating: {e}\n{traceback.format_exc()}")
+        logger.error("Error handling rating: %s", e, exc_info=True)
         await query.message.reply_text("Ошибка при сохранении оценки.")
         return MODERATE_PHOTO
     
@@ -1247,36 +1128,18 @@ async def show_next_photo(update, context):
     db_user = await get_user(telegram_id)
     
     try:
-        photos, total = await get_pending_photos_for_organizer(db_user, page)
+        photos, total = await get_pending_photos_for_organizer(db_user, page, PHOTOS_PER_PAGE)
         total_pages = (total + PHOTOS_PER_PAGE - 1) // PHOTOS_PER_PAGE
         
         if photos:
             photo, volunteer_username, project_title, task = photos[0]
-            context.user_data['pending_photos'] = photos
-            context.user_data['selected_photo'] = photo
+            context.user_data['pending_photos'] = [item[0].id for item in photos]
+            context.user_data['selected_photo'] = photo.id
             
-            if not await sync_to_async(os.path.exists)(photo.image.path):
-                logger.error(f"File not found: {photo.image.path}")
-                await query.message.reply_text(f"Ошибка: файл фото {photo.image.path} не найден.")
+            if not await send_moderation_photo(context, query.message.chat_id, photo, volunteer_username, project_title, task):
+                await query.message.reply_text(f"Ошибка: файл фото {photo.image.name} не найден.")
                 return ConversationHandler.END
 
-            async with aiofiles.open(photo.image.path, 'rb') as photo_file:
-                buttons = [
-                    [InlineKeyboardButton("✅ Подтверждаю выполнение", callback_data=f"mod_photo_action_0_approve"),
-                     InlineKeyboardButton("❌ Отклонить", callback_data=f"mod_photo_action_0_reject")]
-                ]
-                keyboard = InlineKeyboardMarkup(buttons)
-                
-                deadline_date = task.deadline_date.strftime('%d-%m-%Y') if task else "Не указана"
-                time_range = f"{task.start_time.strftime('%H:%M')} - {task.end_time.strftime('%H:%M')}" if task else "Не указано"
-                
-                await context.bot.send_photo(
-                    chat_id=query.message.chat_id,
-                    photo=await photo_file.read(),
-                    caption=f"Фото от {volunteer_username} (проект: {project_title})\nЗадание: {task.text if task else 'Нет задания'}\nСрок выполнение: {deadline_date}\nВремя: {time_range}",
-                    reply_markup=keyboard
-                )
-
             keyboard = get_pagination_keyboard(page, total_pages)
             await context.bot.send_message(
                 chat_id=query.message.chat_id,
@@ -1293,7 +1156,7 @@ async def show_next_photo(update, context):
             context.user_data.clear()
             return ConversationHandler.END
     except Exception as e:
-        logger.error(f"Error showing next photo: {e}\n{traceback.format_exc()}")
+        logger.error("Error showing next photo: %s", e, exc_info=True)
         await query.message.reply_text(f"Ошибка при загрузке следующего фото: {str(e)}")
         return ConversationHandler.END
 
@@ -1312,7 +1175,7 @@ async def feedback_rating(update, context):
         await query.message.reply_text("Напишите комментарий (или отправьте /skip чтобы пропустить):")
         return FEEDBACK
     except Exception as e:
-        logger.error(f"Error in feedback_rating: {e}")
+        logger.error("Error in feedback_rating: %s", e)
         await query.message.reply_text("Ошибка. Попробуйте снова.")
         return FEEDBACK
 
@@ -1333,18 +1196,17 @@ async def feedback_comment(update, context):
 
     try:
         # Получаем assignment и обновляем его
-        assignment = await sync_to_async(TaskAssignment.objects.get)(task=task, volunteer=volunteer)
+        assignment = await get_task_assignment(task, volunteer)
         assignment.rating = rating
         assignment.feedback = comment
-        await sync_to_async(assignment.save)()
+        await assignment.asave()
 
         # Обновляем рейтинг волонтера
-        volunteer.rating = min(100, volunteer.rating + rating * 2)  # Более консервативное увеличение
-        await sync_to_async(volunteer.save)()
+        await rate_volunteer(volunteer, rating, 'task', assignment=assignment)
 
         await update.message.reply_text("Отзыв сохранён!", reply_markup=get_org_keyboard())
     except Exception as e:
-        logger.error(f"Error saving feedback: {e}\n{traceback.format_exc()}")
+        logger.error("Error saving feedback: %s", e, exc_info=True)
         await update.message.reply_text("Ошибка при сохранении отзыва.")
 
     context.user_data.clear()
@@ -1361,13 +1223,19 @@ def register_handlers(application):
             TITLE: [MessageHandler(filters.TEXT & ~filters.COMMAND, create_project_title)],
             DESCRIPTION: [MessageHandler(filters.TEXT & ~filters.COMMAND, create_project_description)],
             CITY: [MessageHandler(filters.TEXT & ~filters.COMMAND, create_project_city)],
-            TAGS: [MessageHandler(filters.TEXT & ~filters.COMMAND, create_project_tags)],
+            TAGS: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, create_project_tags),
+                CallbackQueryHandler(create_project_tag_choice, pattern=r"^(tag_fix_|tags_keep)")
+            ],
+            LOCATION: [MessageHandler(filters.LOCATION | (filters.TEXT & ~filters.COMMAND), create_project_location)],
         },
         fallbacks=[
             CommandHandler("cancel", cancel),
             CallbackQueryHandler(create_project_cancel, pattern=r"^cancel_task")
         ],
-        per_message=False
+        per_message=False,
+        name='create_project',
+        persistent=True
     )
     application.add_handler(create_project_conv)
 
@@ -1394,7 +1262,9 @@ def register_handlers(application):
     fallbacks=[
         CallbackQueryHandler(create_project_cancel, pattern=r"^cancel_task")
     ],
-    per_message=False
+    per_message=False,
+    name='send_task',
+    persistent=True
 )
     application.add_handler(send_task_conv)
 
@@ -1416,7 +1286,9 @@ def register_handlers(application):
     fallbacks=[
         CallbackQueryHandler(handle_photo_moderation_selection, pattern=r"^cancel_moderate")
     ],
-    per_message=False
+    per_message=False,
+    name='moderate_photo',
+    persistent=True
 )
     application.add_handler(moderate_photo_conv)
     
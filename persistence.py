@@ -0,0 +1,166 @@
+"""Сохранение состояния бота между перезапусками.
+
+user_data, chat_data и шаги диалогов (ConversationHandler с persistent=True) хранятся в
+таблице core.models.BotState в виде компактного JSON. В user_data поэтому кладутся только
+id и простые значения, а объекты моделей обработчики загружают заново по id. Даты и время
+(срок задания, часы начала и окончания) сериализуются с пометкой типа и восстанавливаются.
+
+Application передаёт изменения раз в update_interval секунд; все они записываются в БД
+одной транзакцией, а при остановке бота — сразу. При запуске состояние читается одним
+запросом на вид данных, так что незаконченная отправка задания или проверка фото
+продолжается после перезапуска с того же шага.
+"""
+import asyncio
+import json
+import logging
+from datetime import date, datetime, time
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from core.repository import load_bot_state, save_bot_state
+
+logger = logging.getLogger(__name__)
+
+USER_DATA = 'user_data'
+CHAT_DATA = 'chat_data'
+CONVERSATION = 'conversation:'
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'__type__': 'datetime', 'value': value.isoformat()}
+    if isinstance(value, date):
+        return {'__type__': 'date', 'value': value.isoformat()}
+    if isinstance(value, time):
+        return {'__type__': 'time', 'value': value.isoformat()}
+    raise TypeError(f"{type(value).__name__} is not serializable, store its id instead")
+
+
+def _decode_value(obj):
+    kind = obj.get('__type__')
+    if kind == 'datetime':
+        return datetime.fromisoformat(obj['value'])
+    if kind == 'date':
+        return date.fromisoformat(obj['value'])
+    if kind == 'time':
+        return time.fromisoformat(obj['value'])
+    return obj
+
+
+def dumps(value):
+    return json.dumps(value, default=_encode_value, ensure_ascii=False, separators=(',', ':'))
+
+
+def loads(data):
+    return json.loads(data, object_hook=_decode_value)
+
+
+class DatabasePersistence(BasePersistence):
+    """Persistence для python-telegram-bot поверх таблицы BotState.
+
+    bot_data и callback_data бот не использует, поэтому они не сохраняются.
+    """
+
+    def __init__(self, update_interval=60):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=True, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        # (kind, key) -> JSON или None (удалить); записывается одной транзакцией
+        self._pending = {}
+        self._write_task = None
+
+    def _encode_data(self, kind, key, data):
+        """JSON словаря data; значения, которые нельзя сохранить, пропускаются с ошибкой в логе"""
+        try:
+            return dumps(data)
+        except TypeError:
+            pass
+        encoded = {}
+        for name, value in data.items():
+            try:
+                dumps(value)
+            except TypeError as e:
+                logger.error("Skipping non-serializable %s[%r] for %s: %s", kind, name, key, e)
+            else:
+                encoded[name] = value
+        return dumps(encoded)
+
+    def _schedule(self, kind, key, data):
+        self._pending[(kind, str(key))] = data
+        if self._write_task is None or self._write_task.done():
+            # Application вызывает update_* для всех изменившихся записей подряд:
+            # запись выполняется после них и сохраняет всю пачку сразу
+            self._write_task = asyncio.create_task(self._write())
+
+    async def _write(self):
+        await asyncio.sleep(0)
+        while self._pending:
+            changes, self._pending = self._pending, {}
+            try:
+                await save_bot_state(changes)
+            except Exception as e:
+                logger.error("Failed to save %s bot state records: %s", len(changes), e, exc_info=True)
+                # Вернуть несохранённое, если его не перезаписали более новые данные
+                self._pending = {**changes, **self._pending}
+                return
+            logger.debug("Saved %s bot state records", len(changes))
+
+    async def _load(self, kind):
+        return {key: loads(data) for key, data in await load_bot_state(kind)}
+
+    async def get_user_data(self):
+        data = await self._load(USER_DATA)
+        logger.info("Loaded user_data for %s users", len(data))
+        return {int(key): value for key, value in data.items()}
+
+    async def get_chat_data(self):
+        return {int(key): value for key, value in (await self._load(CHAT_DATA)).items()}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        data = await self._load(CONVERSATION + name)
+        return {tuple(json.loads(key)): state for key, state in data.items()}
+
+    async def update_user_data(self, user_id, data):
+        self._schedule(USER_DATA, user_id, self._encode_data(USER_DATA, user_id, data) if data else None)
+
+    async def update_chat_data(self, chat_id, data):
+        self._schedule(CHAT_DATA, chat_id, self._encode_data(CHAT_DATA, chat_id, data) if data else None)
+
+    async def update_conversation(self, name, key, new_state):
+        self._schedule(CONVERSATION + name, json.dumps(key), None if new_state is None else dumps(new_state))
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_user_data(self, user_id):
+        self._schedule(USER_DATA, user_id, None)
+
+    async def drop_chat_data(self, chat_id):
+        self._schedule(CHAT_DATA, chat_id, None)
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        """Вызывается при остановке Application: дописывает всё, что ещё не сохранено"""
+        if self._write_task is not None:
+            await self._write_task
+        await self._write()
+        if self._pending:
+            logger.error("%s bot state records were not saved on shutdown", len(self._pending))
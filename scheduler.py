@@ -0,0 +1,150 @@
+"""Напоминания о заданиях и истечение их сроков.
+
+При запуске бота сроки активных заданий загружаются в очередь core.deadlines.deadline_queue,
+после чего планировщик спит до ближайшего события. Пока бот работает, новые и изменённые
+задания попадают в очередь по сигналам. Наступившие события обрабатываются пачками:
+- истёкшие задания и их невыполненные назначения помечаются expired двумя UPDATE на пачку;
+- напоминания волонтёрам, принявшим задание, уходят рассылками broadcast.py, то есть с
+  лимитами Telegram и с продолжением после перезапуска.
+
+JobQueue PTB не используется: ей нужен APScheduler, а одна куча в памяти дешевле отдельной
+задачи на каждое из 100 тысяч заданий.
+"""
+import asyncio
+import logging
+import time
+import weakref
+
+from django.conf import settings
+from django.utils import timezone
+
+from broadcast import get_broadcaster
+from core.deadlines import START_REMINDER, END_REMINDER, EXPIRY, deadline_queue
+from core.repository import get_pending_deadlines, expire_tasks, create_task_reminders
+
+logger = logging.getLogger(__name__)
+
+# Сколько событий обрабатывать за раз
+BATCH_SIZE = 500
+# Сколько рассылок-напоминаний отправлять одновременно; остальные ждут в БД
+MAX_ACTIVE_REMINDERS = 20
+# Пауза после ошибки БД перед следующей попыткой
+RETRY_DELAY = 30
+
+
+def reminder_text(task, kind):
+    date_str = task.deadline_date.strftime('%Y-%m-%d')
+    if kind == START_REMINDER:
+        return (
+            f"Напоминание: задание проекта «{task.project.title}» начнётся {date_str} "
+            f"в {task.start_time.strftime('%H:%M')}.\n\n{task.text}"
+        )
+    end_time = task.end_time.strftime('%H:%M') if task.end_time else '23:59'
+    return (
+        f"Напоминание: задание проекта «{task.project.title}» нужно выполнить до {end_time} {date_str}. "
+        f"Не забудьте отправить фото для проверки.\n\n{task.text}"
+    )
+
+
+class DeadlineScheduler:
+    def __init__(self, application, queue=deadline_queue, reload_interval=None):
+        self.application = application
+        self.queue = queue
+        self.reload_interval = reload_interval or settings.TASK_SCHEDULER_RELOAD
+        self._task = None
+        self._wakeup = None
+        self._reload_at = 0.0
+        self._senders = set()
+        self._active_reminders = None
+
+    def start(self):
+        if self._task is not None and not self._task.done():
+            return self._task
+        loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._active_reminders = asyncio.Semaphore(MAX_ACTIVE_REMINDERS)
+        # Сигналы Task приходят из потоков пула БД
+        self.queue.set_waker(lambda: loop.call_soon_threadsafe(self._wakeup.set))
+        self._task = asyncio.create_task(self._run(), name='deadline-scheduler')
+        return self._task
+
+    async def stop(self):
+        """Останавливает планировщик; недоставленные напоминания остаются в БД и будут отправлены позже"""
+        self.queue.set_waker(None)
+        tasks = [task for task in (self._task, *self._senders) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def reload(self):
+        """Перечитывает сроки активных заданий одним запросом по индексу (status, deadline)"""
+        self.queue.begin_load()
+        rows = await get_pending_deadlines()
+        self.queue.load(rows)
+        self._reload_at = time.monotonic() + self.reload_interval
+
+    async def _run(self):
+        while True:
+            try:
+                if time.monotonic() >= self._reload_at:
+                    await self.reload()
+                # Сброс до расчёта ожидания: событие, добавленное после него, разбудит планировщик
+                self._wakeup.clear()
+                due = self.queue.pop_due(timezone.now(), BATCH_SIZE)
+                if due:
+                    await self._process(due)
+                    continue
+                timeout = self._reload_at - time.monotonic()
+                next_time = self.queue.next_time()
+                if next_time is not None:
+                    timeout = min(timeout, (next_time - timezone.now()).total_seconds())
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), max(timeout, 0))
+                except TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Необработанные события вернутся в очередь при следующей перезагрузке
+                logger.error("Deadline scheduler failed: %s", e, exc_info=True)
+                self._reload_at = time.monotonic() + RETRY_DELAY
+                await asyncio.sleep(RETRY_DELAY)
+
+    async def _process(self, due):
+        expired = [task_id for kind, task_id in due if kind == EXPIRY]
+        if expired:
+            expired_ids = await expire_tasks(expired)
+            self.queue.expired += len(expired_ids)
+        for kind in (START_REMINDER, END_REMINDER):
+            task_ids = [task_id for event_kind, task_id in due if event_kind == kind]
+            if task_ids:
+                broadcast_ids = await create_task_reminders(task_ids, kind, reminder_text)
+                self.queue.reminded += len(broadcast_ids)
+                for broadcast_id in broadcast_ids:
+                    sender = asyncio.create_task(self._send(broadcast_id), name=f"reminder-{broadcast_id}")
+                    self._senders.add(sender)
+                    sender.add_done_callback(self._senders.discard)
+
+    async def _send(self, broadcast_id):
+        async with self._active_reminders:
+            await get_broadcaster(self.application).start(broadcast_id)
+
+
+_schedulers = weakref.WeakKeyDictionary()
+
+
+def get_deadline_scheduler(application):
+    scheduler = _schedulers.get(application)
+    if scheduler is None:
+        scheduler = _schedulers[application] = DeadlineScheduler(application)
+    return scheduler
+
+
+async def start_deadline_scheduler(application):
+    """post_init: загружает сроки заданий и запускает планировщик"""
+    get_deadline_scheduler(application).start()
+
+
+async def stop_deadline_scheduler(application):
+    """post_stop: останавливает планировщик до остановки рассылок"""
+    await get_deadline_scheduler(application).stop()
@@ -0,0 +1,93 @@
+"""Параллельная обработка обновлений с сохранением порядка внутри одного чата.
+
+Обновления из разных чатов обрабатываются одновременно (не больше заданного лимита), а
+обновления одного чата — строго по очереди. Это нужно ConversationHandler'ам: состояние
+разговора меняется по ключу (chat_id, user_id), и два обновления одного пользователя,
+обработанные параллельно, сломали бы переходы между состояниями.
+"""
+import asyncio
+import sys
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    __slots__ = ('_concurrency', '_limit', '_chat_locks', '_pending', '_running')
+
+    def __init__(self, max_concurrent_updates):
+        if max_concurrent_updates < 1:
+            raise ValueError("`max_concurrent_updates` must be a positive integer!")
+        # Базовый класс создаёт семафор по max_concurrent_updates. Он не должен ограничивать:
+        # иначе обновления одного чата, ожидающие своей очереди, занимали бы слоты и блокировали
+        # остальные чаты. Настоящий лимит — self._limit, он берётся уже после блокировки чата
+        self._concurrency = sys.maxsize
+        super().__init__(sys.maxsize)
+        self._concurrency = max_concurrent_updates
+        self._limit = asyncio.Semaphore(max_concurrent_updates)
+        # chat_id -> [Lock, число обновлений этого чата в обработке или в ожидании]
+        self._chat_locks = {}
+        self._pending = 0
+        self._running = 0
+
+    @property
+    def max_concurrent_updates(self):
+        return self._concurrency
+
+    @property
+    def current_concurrent_updates(self):
+        return self._running
+
+    @property
+    def pending_updates(self):
+        """Обновления, взятые из очереди, но ещё не обработанные (включая ожидающие своего чата)."""
+        return self._pending
+
+    @staticmethod
+    def chat_key(update):
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat:
+            return update.effective_chat.id
+        if update.effective_user:
+            return update.effective_user.id
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        self._pending += 1
+        key = self.chat_key(update)
+        try:
+            if key is None:
+                async with self._limit:
+                    await self._run(coroutine)
+                return
+
+            entry = self._chat_locks.get(key)
+            if entry is None:
+                entry = self._chat_locks[key] = [asyncio.Lock(), 0]
+            entry[1] += 1
+            try:
+                # asyncio.Lock пропускает ожидающих в порядке FIFO, поэтому обновления чата
+                # выполняются в том порядке, в котором пришли
+                async with entry[0]:
+                    async with self._limit:
+                        await self._run(coroutine)
+            finally:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._chat_locks[key]
+        finally:
+            self._pending -= 1
+
+    async def _run(self, coroutine):
+        self._running += 1
+        try:
+            await coroutine
+        finally:
+            self._running -= 1
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
@@ -1,16 +1,15 @@
 import logging
-import asyncio
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import CommandHandler, MessageHandler, CallbackQueryHandler, ConversationHandler, filters
-from asgiref.sync import sync_to_async
-from django.db import transaction
-from django.utils import timezone
-import aiofiles
-import aiofiles.os as aio_os
-import os
-import traceback
 
-from core.models import User, Project, Photo, VolunteerProject, Task, TaskAssignment
+from media_registry import media_registry
+from media_storage import save_telegram_photo
+from core.repository import (
+    MAX_PROJECTS_PER_VOLUNTEER, get_user, create_photo, get_approved_projects_page,
+    encode_project_cursor, search_approved_projects, get_nearest_projects, create_volunteer_project,
+    get_volunteer_projects, get_volunteer_project, delete_volunteer_project, get_task, get_task_assignment,
+    update_task_assignment, get_active_tasks, JOINED, PROJECT_FULL, LIMIT_REACHED, ALREADY_JOINED,
+)
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -18,138 +17,34 @@ logger = logging.getLogger(__name__)
 # Количество проектов на странице
 PROJECTS_PER_PAGE = 5
 
-# Максимальное количество проектов для волонтёра
-MAX_PROJECTS_PER_VOLUNTEER = 1
-
 # Состояния для ConversationHandler
-TASK_CONFIRM, TASK_COMPLETED, TASK_PHOTO_UPLOAD = range(3)
+TASK_CONFIRM, TASK_COMPLETED, TASK_PHOTO_UPLOAD, SEARCH_QUERY, NEARBY_LOCATION = range(5)
 
 # Основная клавиатура для волонтёров
 def get_volunteer_keyboard():
     return InlineKeyboardMarkup([
         [InlineKeyboardButton("📋 Список проектов", callback_data="list_projects"),
          InlineKeyboardButton("➕ Присоединиться к проекту", callback_data="join_project")],
+        [InlineKeyboardButton("🔍 Поиск проектов", callback_data="search_projects"),
+         InlineKeyboardButton("📍 Проекты рядом", callback_data="nearby_projects")],
         [InlineKeyboardButton("👤 Мой профиль", callback_data="profile"),
          InlineKeyboardButton("🚪 Выйти из проекта", callback_data="leave_project")]
     ])
 
-# Вспомогательные функции с sync_to_async
-@sync_to_async
-def get_user(telegram_id):
-    try:
-        user = User.objects.get(telegram_id=telegram_id)
-        logger.info(f"User found: {user.username} (telegram_id: {telegram_id})")
-        return user
-    except User.DoesNotExist:
-        logger.warning(f"User not found with telegram_id: {telegram_id}")
-        return None
-
-@sync_to_async
-def get_volunteer_project(volunteer):
-    logger.info(f"Fetching volunteer project for {volunteer.username}")
-    volunteer_project = VolunteerProject.objects.filter(volunteer=volunteer).select_related('project').first()
-    if volunteer_project:
-        logger.info(f"Volunteer project found: {volunteer_project.project.title}")
-        return volunteer_project, volunteer_project.project.title
-    logger.info(f"No volunteer project found for {volunteer.username}")
-    return None, None
-
-@sync_to_async
-def create_photo(volunteer, project, file_path, task=None):
-    logger.info(f"Creating photo for volunteer {volunteer.username} in project {project.title}")
-    photo = Photo.objects.create(volunteer=volunteer, project=project, image=file_path, status='pending', task=task)
-    logger.info(f"Photo created: {photo.id}")
-    return photo
-
-@sync_to_async
-def get_approved_projects(volunteer, city=None, tag=None):
-    logger.info(f"Fetching approved projects for volunteer {volunteer.username} (city={city}, tag={tag})")
-    projects = Project.objects.filter(status='approved')
-    if city:
-        projects = projects.filter(city__iexact=city)
-    if tag:
-        projects = projects.filter(tags__name__in=[tag])
-    
-    joined_project_ids = VolunteerProject.objects.filter(volunteer=volunteer).values_list('project__id', flat=True)
-    projects = projects.exclude(id__in=joined_project_ids)
-    
-    result = [(project, project.title, project.city, [tag.name for tag in project.tags.all()]) for project in projects]
-    logger.info(f"Found {len(result)} approved projects for volunteer {volunteer.username}: {[p[1] for p in result]}")
-    return result
-
-@sync_to_async
-def create_volunteer_project(volunteer, project):
-    logger.info(f"Creating volunteer project for {volunteer.username} in project {project.title}")
-    current_projects = VolunteerProject.objects.filter(volunteer=volunteer)
-    if current_projects.count() >= MAX_PROJECTS_PER_VOLUNTEER:
-        logger.warning(f"Volunteer {volunteer.username} has reached the maximum number of projects: {MAX_PROJECTS_PER_VOLUNTEER}")
-        return None, None
-
-    try:
-        with transaction.atomic():
-            volunteer_project = VolunteerProject.objects.create(volunteer=volunteer, project=project)
-            logger.info(f"Volunteer project created: {volunteer_project.id}")
-        transaction.commit()  # Явное завершение транзакции
-        return volunteer_project, project.title
-    except Exception as e:
-        logger.error(f"Failed to create VolunteerProject for {volunteer.username} in project {project.title}: {e}\n{traceback.format_exc()}")
-        return None, None
-
-@sync_to_async
-def get_volunteer_projects(volunteer):
-    logger.info(f"Fetching projects for volunteer {volunteer.username}")
-    volunteer_projects = VolunteerProject.objects.filter(volunteer=volunteer).select_related('project')
-    result = [(vp, vp.project.title) for vp in volunteer_projects]
-    logger.info(f"Found {len(result)} projects for volunteer {volunteer.username}: {[r[1] for r in result]}")
-    return result
-
-@sync_to_async
-def delete_volunteer_project(volunteer_project):
-    logger.info(f"Deleting volunteer project {volunteer_project.id}")
-    volunteer_project.delete()
-    logger.info(f"Volunteer project {volunteer_project.id} deleted")
-
-@sync_to_async
-def get_task(task_id):
-    try:
-        task = Task.objects.select_related('project__creator').get(id=task_id)
-        logger.info(f"Task {task_id} loaded with project and creator")
-        return task
-    except Task.DoesNotExist:
-        logger.warning(f"Task {task_id} not found")
-        return None
-
-@sync_to_async
-def update_task_assignment(task, volunteer, accepted=None, completed=None):
-    try:
-        assignment = TaskAssignment.objects.get(task=task, volunteer=volunteer)
-        if accepted is not None:
-            assignment.accepted = accepted
-        if completed is not None:
-            assignment.completed = completed
-            assignment.completed_at = timezone.now()
-        assignment.save()
-        return assignment
-    except TaskAssignment.DoesNotExist:
-        logger.error(f"TaskAssignment not found for task {task.id} and volunteer {volunteer.username}")
-        return None
-
-@sync_to_async
-def get_current_date():
-    return timezone.now()
-
-def get_pagination_keyboard(page, total_pages):
+def get_pagination_keyboard(page, prev_cursor=None, next_cursor=None):
+    # Курсор (created_at и id крайнего проекта страницы) передаётся в callback_data:
+    # соседняя страница читается из БД по индексу, без подсчёта и пропуска предыдущих
     buttons = []
-    if page > 0:
-        buttons.append(InlineKeyboardButton("⬅️ Предыдущая", callback_data=f"prev_{page}"))
-    if page < total_pages - 1:
-        buttons.append(InlineKeyboardButton("Следующая ➡️", callback_data=f"next_{page}"))
+    if prev_cursor:
+        buttons.append(InlineKeyboardButton("⬅️ Предыдущая", callback_data=f"prev_{page}_{prev_cursor}"))
+    if next_cursor:
+        buttons.append(InlineKeyboardButton("Следующая ➡️", callback_data=f"next_{page}_{next_cursor}"))
     return InlineKeyboardMarkup([buttons])
 
 async def volunteer_menu(update, context):
     user = update.message.from_user
     telegram_id = str(user.id)
-    logger.info(f"Volunteer menu requested by telegram_id: {telegram_id}")
+    logger.info("Volunteer menu requested by telegram_id: %s", telegram_id)
     db_user = await get_user(telegram_id)
     if not db_user:
         await update.message.reply_text("Вы не зарегистрированы. Создайте аккаунт.")
@@ -163,13 +58,14 @@ async def volunteer_menu(update, context):
 async def list_projects(update, context):
     query = update.callback_query
     await query.answer()
+    await show_projects_page(update, context)
 
+async def show_projects_page(update, context, page=0, after=None, before=None):
+    query = update.callback_query
     args = context.args if context.args is not None else []
     city = args[0] if len(args) > 0 else None
     tag = args[1] if len(args) > 1 else None
 
-    page = context.user_data.get('projects_page', 0)
-
     user = query.from_user
     telegram_id = str(user.id)
     db_user = await get_user(telegram_id)
@@ -177,37 +73,175 @@ async def list_projects(update, context):
         await query.message.reply_text("Вы не зарегистрированы. Создайте аккаунт.")
         return
 
-    projects = await get_approved_projects(db_user, city=city, tag=tag)
+    projects, has_more = await get_approved_projects_page(
+        db_user, city=city, tag=tag, after=after, before=before, limit=PROJECTS_PER_PAGE
+    )
     if not projects:
         await query.message.reply_text("Нет доступных проектов по вашему запросу.")
         return
 
-    total_projects = len(projects)
-    total_pages = (total_projects + PROJECTS_PER_PAGE - 1) // PROJECTS_PER_PAGE
+    # has_more относится к направлению листания: назад — есть ли страницы раньше, вперёд — дальше
+    has_prev = has_more if before else page > 0
+    has_next = True if before else has_more
     start_idx = page * PROJECTS_PER_PAGE
-    end_idx = min(start_idx + PROJECTS_PER_PAGE, total_projects)
-    current_projects = projects[start_idx:end_idx]
+    project_list = "\n".join([f"{i+1+start_idx}. {project[1]} ({project[2]}) - Теги: {', '.join(project[3])}" for i, project in enumerate(projects)])
+    reply_text = f"Доступные проекты (страница {page+1}):\n{project_list}\n\nЧтобы присоединиться, используйте 'Присоединиться к проекту'"
 
-    project_list = "\n".join([f"{i+1+start_idx}. {project[1]} ({project[2]}) - Теги: {', '.join(project[3])}" for i, project in enumerate(current_projects)])
-    reply_text = f"Доступные проекты (страница {page+1} из {total_pages}):\n{project_list}\n\nЧтобы присоединиться, используйте 'Присоединиться к проекту'"
-
-    keyboard = get_pagination_keyboard(page, total_pages)
+    keyboard = get_pagination_keyboard(
+        page,
+        prev_cursor=encode_project_cursor(projects[0][0]) if has_prev else None,
+        next_cursor=encode_project_cursor(projects[-1][0]) if has_next else None
+    )
     await query.message.reply_text(reply_text, reply_markup=keyboard)
 
 async def handle_pagination(update, context):
     query = update.callback_query
     await query.answer()
 
-    action, page = query.data.split('_')
-    page = int(page)
+    try:
+        action, page, cursor = query.data.split('_', 2)
+        page = int(page)
+    except ValueError as e:
+        # Кнопки старого формата (prev_<страница>) без курсора: показываем каталог с начала
+        logger.warning("Outdated pagination callback_data %s: %s", query.data, e)
+        await show_projects_page(update, context)
+        return
 
     if action == "prev":
-        page -= 1
-    elif action == "next":
-        page += 1
+        await show_projects_page(update, context, page=max(0, page - 1), before=cursor)
+    else:
+        await show_projects_page(update, context, page=page + 1, after=cursor)
+
+async def search_command(update, context):
+    """/search <слова>: сразу показывает результаты, без слов — просит ввести запрос"""
+    if context.args:
+        context.user_data['search_query'] = ' '.join(context.args)
+        await show_search_results(update, context)
+        return ConversationHandler.END
+    await update.message.reply_text("Напишите, что искать: название, город или тег проекта.")
+    return SEARCH_QUERY
+
+async def search_start(update, context):
+    query = update.callback_query
+    await query.answer()
+    await query.message.reply_text("Напишите, что искать: название, город или тег проекта.")
+    return SEARCH_QUERY
+
+async def receive_search_query(update, context):
+    context.user_data['search_query'] = update.message.text
+    await show_search_results(update, context)
+    return ConversationHandler.END
+
+async def cancel_search(update, context):
+    await update.message.reply_text("Поиск отменён.")
+    return ConversationHandler.END
+
+async def handle_search_pagination(update, context):
+    query = update.callback_query
+    await query.answer()
+    try:
+        page = max(0, int(query.data.rsplit('_', 1)[1]))
+    except ValueError as e:
+        logger.warning("Invalid search pagination callback_data %s: %s", query.data, e)
+        page = 0
+    await show_search_results(update, context, page=page)
+
+async def show_search_results(update, context, page=0):
+    message = update.effective_message
+    text = context.user_data.get('search_query')
+    if not text:
+        await message.reply_text("Поиск устарел. Отправьте /search и слова для поиска.")
+        return
+
+    db_user = await get_user(str(update.effective_user.id))
+    if not db_user:
+        await message.reply_text("Вы не зарегистрированы. Создайте аккаунт.")
+        return
+
+    projects, has_more = await search_approved_projects(db_user, text, page=page, limit=PROJECTS_PER_PAGE)
+    if not projects:
+        await message.reply_text(f"По запросу «{text}» ничего не найдено.")
+        return
+
+    start_idx = page * PROJECTS_PER_PAGE
+    project_list = "\n".join([f"{i+1+start_idx}. {project[1]} ({project[2]}) - Теги: {', '.join(project[3])}" for i, project in enumerate(projects)])
+    reply_text = f"Результаты поиска «{text}» (страница {page+1}):\n{project_list}\n\nЧтобы присоединиться, используйте 'Присоединиться к проекту'"
+
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("⬅️ Предыдущая", callback_data=f"search_page_{page - 1}"))
+    if has_more:
+        buttons.append(InlineKeyboardButton("Следующая ➡️", callback_data=f"search_page_{page + 1}"))
+    await message.reply_text(reply_text, reply_markup=InlineKeyboardMarkup([buttons]))
+
+async def nearby_start(update, context):
+    """Просит геопозицию: кнопка запроса местоположения бывает только в обычной клавиатуре"""
+    if update.callback_query:
+        await update.callback_query.answer()
+    await update.effective_message.reply_text(
+        "Отправьте свою геопозицию, и я покажу ближайшие проекты.",
+        reply_markup=ReplyKeyboardMarkup(
+            [[KeyboardButton("📍 Отправить геопозицию", request_location=True)]],
+            resize_keyboard=True, one_time_keyboard=True
+        )
+    )
+    return NEARBY_LOCATION
+
+async def receive_nearby_location(update, context):
+    location = update.message.location
+    db_user = await get_user(str(update.effective_user.id))
+    if not db_user:
+        await update.message.reply_text("Вы не зарегистрированы. Создайте аккаунт.", reply_markup=ReplyKeyboardRemove())
+        return ConversationHandler.END
+
+    projects = await get_nearest_projects(db_user, location.latitude, location.longitude, limit=PROJECTS_PER_PAGE)
+    if not projects:
+        await update.message.reply_text("Рядом с вами пока нет проектов.", reply_markup=ReplyKeyboardRemove())
+        return ConversationHandler.END
+
+    project_list = "\n".join([
+        f"{i+1}. {project[1]} ({project[2]}, {project[4]:.1f} км) - Теги: {', '.join(project[3])}"
+        for i, project in enumerate(projects)
+    ])
+    await update.message.reply_text(
+        f"Ближайшие проекты:\n{project_list}\n\nЧтобы присоединиться, используйте 'Присоединиться к проекту'",
+        reply_markup=ReplyKeyboardRemove()
+    )
+    return ConversationHandler.END
+
+async def cancel_nearby(update, context):
+    await update.message.reply_text("Поиск проектов рядом отменён.", reply_markup=ReplyKeyboardRemove())
+    return ConversationHandler.END
+
+async def get_join_keyboard(db_user, page=0, after=None, before=None):
+    """Страница проектов для вступления; None — проектов нет.
 
-    context.user_data['projects_page'] = page
-    await list_projects(update, context)
+    В callback_data кнопок id проекта, а навигация листает каталог по курсору, как «Список
+    проектов»: список проектов пользователя нигде не хранится, а в клавиатуре не больше
+    PROJECTS_PER_PAGE проектов при любом размере каталога.
+    """
+    projects, has_more = await get_approved_projects_page(db_user, after=after, before=before, limit=PROJECTS_PER_PAGE)
+    if not projects:
+        return None
+
+    has_prev = has_more if before else page > 0
+    has_next = True if before else has_more
+    buttons = [
+        [InlineKeyboardButton(f"{project[1]} ({project[2]})", callback_data=f"join_id_{project[0].id}")]
+        for project in projects
+    ]
+    navigation = []
+    if has_prev:
+        navigation.append(InlineKeyboardButton(
+            "⬅️ Предыдущая", callback_data=f"join_prev_{page}_{encode_project_cursor(projects[0][0])}"
+        ))
+    if has_next:
+        navigation.append(InlineKeyboardButton(
+            "Следующая ➡️", callback_data=f"join_next_{page}_{encode_project_cursor(projects[-1][0])}"
+        ))
+    if navigation:
+        buttons.append(navigation)
+    return InlineKeyboardMarkup(buttons)
 
 async def join_project(update, context):
     query = update.callback_query
@@ -220,49 +254,76 @@ async def join_project(update, context):
         await query.message.reply_text("Вы не зарегистрированы. Создайте аккаунт.")
         return
 
-    projects = await get_approved_projects(db_user)
-    if not projects:
+    # Список проектов, сохранённый прежними версиями бота
+    context.user_data.pop('projects', None)
+
+    keyboard = await get_join_keyboard(db_user)
+    if keyboard is None:
         await query.message.reply_text("Нет доступных проектов для участия.")
         return
-
-    buttons = [
-        [InlineKeyboardButton(f"{project[1]} ({project[2]})", callback_data=f"join_{i}")]
-        for i, project in enumerate(projects)
-    ]
-    keyboard = InlineKeyboardMarkup(buttons)
     await query.message.reply_text("Выберите проект для участия:", reply_markup=keyboard)
 
-    context.user_data['projects'] = projects
-    context.user_data['db_user'] = db_user
+async def handle_join_pagination(update, context):
+    query = update.callback_query
+    await query.answer()
+
+    try:
+        _, action, page, cursor = query.data.split('_', 3)
+        page = int(page)
+    except ValueError as e:
+        logger.error("Invalid callback_data format: %s, error: %s", query.data, e, exc_info=True)
+        await query.message.reply_text("Ошибка: неверная страница.")
+        return
+
+    db_user = await get_user(str(query.from_user.id))
+    if not db_user:
+        await query.message.reply_text("Вы не зарегистрированы. Создайте аккаунт.")
+        return
+
+    if action == "prev":
+        keyboard = await get_join_keyboard(db_user, page=max(0, page - 1), before=cursor)
+    else:
+        keyboard = await get_join_keyboard(db_user, page=page + 1, after=cursor)
+    if keyboard is None:
+        await query.message.reply_text("Нет доступных проектов для участия.")
+        return
+    # Листание меняет кнопки того же сообщения, а не присылает новое
+    await query.edit_message_reply_markup(reply_markup=keyboard)
 
 async def handle_join_selection(update, context):
     query = update.callback_query
     await query.answer()
 
+    if not query.data.startswith('join_id_'):
+        # Кнопки старого формата join_<номер в списке>: без списка в user_data номер ничего не значит
+        logger.warning("Outdated join callback_data %s", query.data)
+        await query.message.reply_text("Список проектов устарел, откройте его заново.", reply_markup=get_volunteer_keyboard())
+        return
     try:
-        choice = int(query.data.split('_')[1])
-    except (ValueError, IndexError) as e:
-        logger.error(f"Invalid callback_data format: {query.data}, error: {e}\n{traceback.format_exc()}")
+        project_id = int(query.data[len('join_id_'):])
+    except ValueError as e:
+        logger.error("Invalid callback_data format: %s, error: %s", query.data, e, exc_info=True)
         await query.message.reply_text("Ошибка: неверный выбор проекта.")
         return
 
-    projects = context.user_data.get('projects', [])
-    db_user = context.user_data.get('db_user')
-
-    if 0 <= choice < len(projects):
-        project = projects[choice][0]
-        volunteer_project, project_title = await create_volunteer_project(db_user, project)
-        if volunteer_project:
-            await asyncio.sleep(1)  # Даём время на фиксацию транзакции
-            await query.message.reply_text(f"Вы успешно зарегистрированы в проекте: {project_title}!")
-        else:
-            await query.message.reply_text(f"Вы не можете присоединиться к проекту: вы уже участвуете в максимальном количестве проектов ({MAX_PROJECTS_PER_VOLUNTEER}).")
+    db_user = await get_user(str(query.from_user.id))
+    if not db_user:
+        await query.message.reply_text("Вы не зарегистрированы. Создайте аккаунт.")
+        return
+
+    # Проект могли снять с публикации или заполнить после того, как клавиатура была отправлена
+    result, project = await create_volunteer_project(db_user, project_id)
+    if result == JOINED:
+        await query.message.reply_text(f"Вы успешно зарегистрированы в проекте: {project.title}!")
+    elif result == ALREADY_JOINED:
+        await query.message.reply_text(f"Вы уже участвуете в проекте: {project.title}.")
+    elif result == PROJECT_FULL:
+        await query.message.reply_text(f"В проекте «{project.title}» не осталось мест. Выберите другой проект.")
+    elif result == LIMIT_REACHED:
+        await query.message.reply_text(f"Вы не можете присоединиться к проекту: вы уже участвуете в максимальном количестве проектов ({MAX_PROJECTS_PER_VOLUNTEER}).")
     else:
         await query.message.reply_text("Неверный выбор проекта.")
 
-    context.user_data.pop('projects', None)
-    context.user_data.pop('db_user', None)
-
 async def leave_project(update, context):
     query = update.callback_query
     await query.answer()
@@ -287,7 +348,7 @@ async def leave_project(update, context):
     keyboard = InlineKeyboardMarkup(buttons)
     await query.message.reply_text("Выберите проект, из которого хотите выйти:", reply_markup=keyboard)
 
-    context.user_data['volunteer_projects'] = projects
+    context.user_data['volunteer_projects'] = [[volunteer_project.id, title] for volunteer_project, title in projects]
 
 async def handle_leave_selection(update, context):
     query = update.callback_query
@@ -301,14 +362,17 @@ async def handle_leave_selection(update, context):
     try:
         choice = int(query.data.split('_')[1])
     except (ValueError, IndexError) as e:
-        logger.error(f"Invalid callback_data format: {query.data}, error: {e}\n{traceback.format_exc()}")
+        logger.error("Invalid callback_data format: %s, error: %s", query.data, e, exc_info=True)
         await query.message.reply_text("Ошибка: неверный выбор проекта.")
         return
 
     projects = context.user_data.get('volunteer_projects', [])
-    if 0 <= choice < len(projects):
-        volunteer_project = projects[choice][0]
-        project_title = projects[choice][1]
+    db_user = await get_user(str(query.from_user.id))
+    volunteer_project = None
+    if db_user and 0 <= choice < len(projects):
+        volunteer_project_id, project_title = projects[choice]
+        volunteer_project = await get_volunteer_project(volunteer_project_id, db_user)
+    if volunteer_project:
         await delete_volunteer_project(volunteer_project)
         await query.message.reply_text(f"Вы успешно вышли из проекта: {project_title}!")
     else:
@@ -327,19 +391,29 @@ async def profile(update, context):
         await query.message.reply_text("Вы не зарегистрированы. Создайте аккаунт.")
         return
 
-    volunteer_projects = await sync_to_async(lambda: list(VolunteerProject.objects.filter(volunteer=db_user).select_related('project')))()
-    project_titles = [vp.project.title for vp in volunteer_projects]
+    volunteer_projects = await get_volunteer_projects(db_user)
+    project_titles = [title for _, title in volunteer_projects]
     projects_text = "\n".join(project_titles) if project_titles else "Вы не участвуете в проектах."
 
+    # Только задания, которые ещё можно выполнить: отбор по сроку делает БД
+    tasks = await get_active_tasks(db_user)
+    tasks_text = "\n".join(
+        f"{task.project.title}: до {task.deadline_date.strftime('%Y-%m-%d')} "
+        f"{task.end_time.strftime('%H:%M') if task.end_time else '23:59'}" if task.deadline_date
+        else f"{task.project.title}: без срока"
+        for task in tasks
+    ) if tasks else "Нет активных заданий."
+
     await query.message.reply_text(
         f"Ваш профиль:\nИмя: {db_user.username}\nРейтинг: {db_user.rating}\nПроекты:\n{projects_text}"
+        f"\nЗадания:\n{tasks_text}"
     )
 
 async def task_accept_decline(update, context):
     query = update.callback_query
     await query.answer()
 
-    logger.info(f"Processing task_accept_decline with callback_data: {query.data}")
+    logger.info("Processing task_accept_decline with callback_data: %s", query.data)
     user = await get_user(str(query.from_user.id))
     if not user:
         await query.message.reply_text("Пользователь не найден.")
@@ -347,37 +421,38 @@ async def task_accept_decline(update, context):
 
     try:
         task_id = int(query.data.split('_')[2])
-        task = await sync_to_async(Task.objects.get)(id=task_id)
-        project = await sync_to_async(Project.objects.get)(id=task.project_id)
-        project_title = project.title
-        assignment = await sync_to_async(TaskAssignment.objects.get)(task=task, volunteer=user)
+        task = await get_task(task_id)
+        project_title = task.project.title
+        assignment = await get_task_assignment(task, user)
 
-        if query.data.startswith("task_accept"):
+        if query.data.startswith("task_accept") and task.is_expired():
+            await query.message.reply_text(f"Срок задания для проекта {project_title} уже истёк.")
+        elif query.data.startswith("task_accept"):
             assignment.accepted = True
-            await sync_to_async(assignment.save)()
+            await assignment.asave()
             # Используем deadline_date, start_time, end_time вместо deadline
             deadline_date_str = task.deadline_date.strftime('%Y-%m-%d') if task.deadline_date else "Не указана"
             time_range = f"{task.start_time.strftime('%H:%M') if task.start_time else '00:00'} - {task.end_time.strftime('%H:%M') if task.end_time else '23:59'}"
             await query.message.reply_text(f"Вы приняли задание для проекта {project_title}. Выполните его до {deadline_date_str} {time_range} и отправьте фото для проверки.")
             # Переход к загрузке фото
-            context.user_data['task'] = task  # Сохраняем задачу для следующего шага
+            context.user_data['task_id'] = task.id  # Сохраняем задачу для следующего шага
             await query.message.reply_text("Пожалуйста, прикрепите фото, подтверждающее выполнение задания:")
             return TASK_PHOTO_UPLOAD
         elif query.data.startswith("task_decline"):
             assignment.accepted = False
-            await sync_to_async(assignment.save)()
+            await assignment.asave()
             await query.message.reply_text(f"Вы отказались от задания для проекта {project_title}.")
 
         return ConversationHandler.END
     except Exception as e:
-        logger.error(f"Error in task_accept_decline: {e}\n{traceback.format_exc()}")
+        logger.error("Error in task_accept_decline: %s", e, exc_info=True)
         await query.message.reply_text("Ошибка при обработке задания.")
         return ConversationHandler.END
 
 async def task_confirm(update, context):
     query = update.callback_query
     await query.answer()
-    logger.info(f"Processing task_confirm with callback_data: {query.data}")
+    logger.info("Processing task_confirm with callback_data: %s", query.data)
 
     user = query.from_user
     telegram_id = str(user.id)
@@ -389,7 +464,7 @@ async def task_confirm(update, context):
     try:
         task_id = int(query.data.split('_')[2])
     except (ValueError, IndexError) as e:
-        logger.error(f"Invalid callback_data format: {query.data}, error: {e}\n{traceback.format_exc()}")
+        logger.error("Invalid callback_data format: %s, error: %s", query.data, e, exc_info=True)
         await query.message.reply_text("Ошибка: неверный формат данных.")
         return ConversationHandler.END
 
@@ -398,7 +473,7 @@ async def task_confirm(update, context):
         await query.message.reply_text("Задание не найдено.")
         return ConversationHandler.END
 
-    if task.deadline and task.deadline < timezone.now():
+    if task.is_expired():
         await query.message.reply_text("Дедлайн для этого задания истёк.")
         return ConversationHandler.END
 
@@ -413,7 +488,7 @@ async def task_confirm(update, context):
 async def task_completed(update, context):
     query = update.callback_query
     await query.answer()
-    logger.info(f"Processing task_completed with callback_data: {query.data}")
+    logger.info("Processing task_completed with callback_data: %s", query.data)
 
     user = query.from_user
     telegram_id = str(user.id)
@@ -424,7 +499,7 @@ async def task_completed(update, context):
 
     parts = query.data.split('_')
     if len(parts) != 4 or parts[0] != "task" or parts[1] != "completed":
-        logger.error(f"Invalid callback_data format: {query.data}")
+        logger.error("Invalid callback_data format: %s", query.data)
         await query.message.reply_text("Ошибка: неверный формат данных.")
         return ConversationHandler.END
 
@@ -432,7 +507,7 @@ async def task_completed(update, context):
     try:
         task_id = int(parts[3])
     except ValueError as e:
-        logger.error(f"Invalid task_id in callback_data: {query.data}, error: {e}\n{traceback.format_exc()}")
+        logger.error("Invalid task_id in callback_data: %s, error: %s", query.data, e, exc_info=True)
         await query.message.reply_text("Ошибка: неверный формат данных.")
         return ConversationHandler.END
 
@@ -441,7 +516,7 @@ async def task_completed(update, context):
         await query.message.reply_text("Задание не найдено.")
         return ConversationHandler.END
 
-    if task.deadline and task.deadline < await get_current_date():
+    if task.is_expired():
         await query.message.reply_text("Дедлайн для этого задания истёк.")
         return ConversationHandler.END
 
@@ -451,7 +526,7 @@ async def task_completed(update, context):
             await query.message.reply_text("Ошибка: задание не назначено вам.")
             return ConversationHandler.END
         await query.message.reply_text("Пожалуйста, прикрепите фото, подтверждающее выполнение задания:")
-        context.user_data['task'] = task  
+        context.user_data['task_id'] = task.id
         return TASK_PHOTO_UPLOAD
     else:
         await update_task_assignment(task, db_user, completed=False)
@@ -461,78 +536,60 @@ async def task_completed(update, context):
 async def task_photo_upload(update, context):
     user = update.message.from_user
     telegram_id = str(user.id)
-    logger.info(f"Processing photo upload for user {telegram_id}")
+    logger.info("Processing photo upload for user %s", telegram_id)
     db_user = await get_user(telegram_id)
     if not db_user:
         await update.message.reply_text("Вы не зарегистрированы. Создайте аккаунт.")
         return ConversationHandler.END
 
-    task = context.user_data.get('task')
+    task_id = context.user_data.get('task_id')
+    task = await get_task(task_id) if task_id else None
     if not task:
         await update.message.reply_text("Задание не найдено.")
         context.user_data.clear()
         return ConversationHandler.END
 
-    logger.info("Checking task deadline")
-    current_date = await get_current_date()
-    if task.deadline_date and task.deadline_date < current_date.date():
+    if task.is_expired():
         await update.message.reply_text("Дедлайн для этого задания истёк.")
         context.user_data.clear()
         return ConversationHandler.END
 
-    # Используем sync_to_async для доступа к связанным полям
-    logger.info("Accessing task.project")
-    project = await sync_to_async(lambda: task.project)()
-    logger.info("Project accessed successfully")
+    # Задание загружено через get_task вместе с проектом и организатором
+    project = task.project
 
     if update.message.photo:
         try:
-            photo_file = await update.message.photo[-1].get_file()
-            current_date = await get_current_date()
-            year, month, day = current_date.year, current_date.month, current_date.day
-            save_dir = os.path.join("media", f"photos/{year}/{month}/{day}")
-            await aio_os.makedirs(save_dir, exist_ok=True)
-            file_name = f"{telegram_id}_{photo_file.file_id}.jpg"
-            full_path = os.path.join(save_dir, file_name)
-
-            photo_data = await photo_file.download_as_bytearray()
-            if not photo_data:
-                raise ValueError("Downloaded photo data is empty")
-            
-            async with aiofiles.open(full_path, 'wb') as f:
-                await f.write(photo_data)
-            logger.info(f"Photo saved to {full_path}")
-
-            db_file_path = os.path.join(f"photos/{year}/{month}/{day}", file_name)
-            
-            photo = await create_photo(db_user, project, db_file_path, task)
-            logger.info(f"Photo saved with path: {photo.image.path}")
+            photo_size = update.message.photo[-1]
+            # Скачивается потоком, повторная отправка того же фото не создаёт копию файла
+            db_file_path = await save_telegram_photo(photo_size)
+
+            photo = await create_photo(
+                db_user, project, db_file_path, task,
+                file_id=photo_size.file_id, file_unique_id=photo_size.file_unique_id
+            )
+            logger.info("Photo saved with path: %s", photo.image.path)
             await update.message.reply_text("Фото загружено и отправлено на проверку организатору.")
 
-            logger.info("Accessing project.creator")
-            organizer = await sync_to_async(lambda: project.creator)()
-            logger.info(f"Organizer accessed: {organizer.telegram_id}")
+            organizer = project.creator
             try:
-                logger.info(f"Sending photo to organizer {organizer.telegram_id}")
-                async with aiofiles.open(full_path, 'rb') as photo_file:
-                    photo_bytes = await photo_file.read()
-                await context.bot.send_photo(
-                    chat_id=organizer.telegram_id,
-                    photo=photo_bytes,
+                logger.info("Sending photo to organizer %s", organizer.telegram_id)
+                # Фото уже в Telegram: пересылаем по file_id без чтения файла и повторной загрузки
+                await media_registry.send_photo(
+                    context.bot, organizer.telegram_id, db_file_path, file_id=photo_size.file_id,
                     caption = f'Новое фото от волонтёра {db_user.username} для проекта {project.title} (задание: {task.text}) ожидает проверки.\nНажмите на кнопку "Проверить кнопку" для модерации.'
                 )
             except Exception as e:
-                logger.error(f"Failed to notify organizer {organizer.username} about new photo: {e}\n{traceback.format_exc()}")
+                logger.error("Failed to notify organizer %s about new photo: %s", organizer.username, e, exc_info=True)
                 await update.message.reply_text("Фото загружено, но не удалось уведомить организатора. Свяжитесь с поддержкой.")
 
             context.user_data.clear()
             return ConversationHandler.END
         except ValueError as e:
-            logger.error(f"Photo upload failed: {e}\n{traceback.format_exc()}")
+            logger.error("Photo upload failed: %s", e, exc_info=True)
             await update.message.reply_text("Ошибка: загруженное фото пустое. Попробуйте снова.")
             return TASK_PHOTO_UPLOAD
         except Exception as e:
-            logger.error(f"Unexpected error uploading photo: {e}\n{traceback.format_exc()}")
+            logger.error("Unexpected error uploading photo: %s", e, exc_info=True)
             await update.message.reply_text("Ошибка при загрузке фото. Попробуйте снова.")
             return TASK_PHOTO_UPLOAD
     else:
@@ -540,7 +597,7 @@ async def task_photo_upload(update, context):
         return TASK_PHOTO_UPLOAD
 
 async def error_handler(update, context):
-    logger.error(f"Update {update} caused error {context.error}\n{traceback.format_exc()}")
+    logger.error("Update %s caused error %s", update, context.error, exc_info=context.error)
     if update and update.effective_message:
         await update.effective_message.reply_text("Произошла ошибка при обработке вашего сообщения. Попробуйте снова.")
 
@@ -552,6 +609,8 @@ def register_handlers(application):
     application.add_handler(CallbackQueryHandler(join_project, pattern=r"^join_project"))
     application.add_handler(CallbackQueryHandler(profile, pattern=r"^profile"))
     application.add_handler(CallbackQueryHandler(handle_pagination, pattern=r"^(prev|next)_"))
+    application.add_handler(CallbackQueryHandler(handle_search_pagination, pattern=r"^search_page_"))
+    application.add_handler(CallbackQueryHandler(handle_join_pagination, pattern=r"^join_(prev|next)_"))
     application.add_handler(CallbackQueryHandler(handle_join_selection, pattern=r"^join_"))
     application.add_handler(CallbackQueryHandler(leave_project, pattern=r"^leave_project"))
     application.add_handler(CallbackQueryHandler(handle_leave_selection, pattern=r"^(leave_|cancel_leave)"))
@@ -567,6 +626,39 @@ def register_handlers(application):
         },
         fallbacks=[
             CallbackQueryHandler(task_completed, pattern=r"^task_completed_no_")
-        ]
+        ],
+        name='task',
+        persistent=True
     )
     application.add_handler(task_conv)
+
+    search_conv = ConversationHandler(
+        entry_points=[
+            CommandHandler("search", search_command),
+            CallbackQueryHandler(search_start, pattern=r"^search_projects$")
+        ],
+        states={
+            SEARCH_QUERY: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_search_query)]
+        },
+        fallbacks=[
+            CommandHandler("cancel", cancel_search),
+            CommandHandler("search", search_command)
+        ],
+        name='search',
+        persistent=True
+    )
+    application.add_handler(search_conv)
+
+    nearby_conv = ConversationHandler(
+        entry_points=[
+            CommandHandler("nearby", nearby_start),
+            CallbackQueryHandler(nearby_start, pattern=r"^nearby_projects$")
+        ],
+        states={
+            NEARBY_LOCATION: [MessageHandler(filters.LOCATION, receive_nearby_location)]
+        },
+        fallbacks=[CommandHandler("cancel", cancel_nearby)],
+        name='nearby',
+        persistent=True
+    )
+    application.add_handler(nearby_conv)
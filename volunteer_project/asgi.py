@@ -2,6 +2,8 @@
 ASGI config for volunteer_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Requests to TELEGRAM_WEBHOOK_PATH are served by the Telegram bot (see webhook.py),
+everything else goes to Django.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +15,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'volunteer_project.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Импорт после get_asgi_application(): webhook использует настройки Django
+from webhook import TelegramWebhook
+
+application = TelegramWebhook(django_application)
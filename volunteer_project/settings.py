@@ -12,10 +12,14 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+from dotenv import load_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Переменные окружения из .env (токен бота, настройки webhook)
+load_dotenv(BASE_DIR / '.env')
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -39,6 +43,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'core',
+    # Таблицы тегов теперь в core (Tag, ProjectTag); taggit нужен только старым миграциям
     'taggit',
     'rest_framework',
     'about_site',
@@ -85,9 +90,47 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Соединения в потоках пула бота переиспользуются вместо открытия на каждый запрос
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # WAL позволяет читать параллельно с записью, IMMEDIATE и timeout убирают
+            # ошибки "database is locked" при одновременных транзакциях из разных потоков
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
+# Размер пула потоков для синхронной работы с БД из бота (core/repository.py).
+# 0 — выполнять в одном потоке через sync_to_async (используется в тестах)
+DB_THREAD_POOL_SIZE = int(os.getenv('DB_THREAD_POOL_SIZE', '8'))
+
+# Кэш пользователей бота по telegram_id (core/cache.py): максимальное число записей и
+# время жизни записи в секундах. 0 в любом из параметров отключает кэш
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '300'))
+
+# Каталог одобренных проектов в памяти бота (core/catalog.py): не реже чем раз в столько секунд
+# перечитывается целиком, чтобы подхватить изменения из других процессов. 0 отключает каталог
+PROJECT_CATALOG_TTL = int(os.getenv('PROJECT_CATALOG_TTL', '300'))
+
+# Во скольких проектах волонтёр может участвовать одновременно. Число мест в проекте задаётся
+# полем Project.capacity в админке
+MAX_PROJECTS_PER_VOLUNTEER = int(os.getenv('MAX_PROJECTS_PER_VOLUNTEER', '1'))
+
+# Сроки заданий (scheduler.py): за сколько минут до начала и до окончания задания напоминать
+# принявшим его волонтёрам и в каком часовом поясе организаторы указывают дату и время задания
+TASK_REMINDER_MINUTES = int(os.getenv('TASK_REMINDER_MINUTES', '60'))
+TASK_TIME_ZONE = os.getenv('TASK_TIME_ZONE', 'Asia/Almaty')
+# Раз в столько секунд планировщик перечитывает сроки заданий из БД: так подхватываются
+# изменения, сделанные в другом процессе (админка)
+TASK_SCHEDULER_RELOAD = int(os.getenv('TASK_SCHEDULER_RELOAD', '3600'))
+
+# Число процессов, создающих превью и веб-версии фото (core/derivatives.py)
+DERIVATIVE_WORKERS = int(os.getenv('DERIVATIVE_WORKERS', '2'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -134,4 +177,29 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-AUTH_USER_MODEL = 'core.User'
\ No newline at end of file
+AUTH_USER_MODEL = 'core.User'
+
+# Настройки Telegram-бота
+TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+# Публичный адрес webhook, который регистрируется в Telegram (например, https://example.com/telegram/webhook/).
+# Если не задан, webhook в Telegram не регистрируется и обновления можно присылать локально.
+TELEGRAM_WEBHOOK_URL = os.getenv('TELEGRAM_WEBHOOK_URL')
+# Путь, по которому ASGI-приложение принимает обновления
+TELEGRAM_WEBHOOK_PATH = os.getenv('TELEGRAM_WEBHOOK_PATH', '/telegram/webhook/')
+# Секрет из заголовка X-Telegram-Bot-Api-Secret-Token; без него режим webhook выключен
+TELEGRAM_WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET')
+# Максимальное число обновлений, ожидающих обработки; при переполнении Telegram получает 503 и повторит запрос
+TELEGRAM_UPDATE_QUEUE_SIZE = int(os.getenv('TELEGRAM_UPDATE_QUEUE_SIZE', '1000'))
+# Сколько обновлений из разных чатов обрабатывается одновременно (внутри одного чата — строго по очереди)
+TELEGRAM_CONCURRENT_UPDATES = int(os.getenv('TELEGRAM_CONCURRENT_UPDATES', '32'))
+# Рассылки (broadcast.py): сообщений в секунду на весь бот (лимит Telegram — около 30),
+# сообщений в секунду в один чат и число одновременных отправок
+TELEGRAM_BROADCAST_RATE = float(os.getenv('TELEGRAM_BROADCAST_RATE', '25'))
+TELEGRAM_BROADCAST_CHAT_RATE = float(os.getenv('TELEGRAM_BROADCAST_CHAT_RATE', '1'))
+TELEGRAM_BROADCAST_WORKERS = int(os.getenv('TELEGRAM_BROADCAST_WORKERS', '20'))
+# Как часто (в секундах) состояние диалогов и user_data сохраняется в БД (persistence.py)
+TELEGRAM_PERSISTENCE_INTERVAL = float(os.getenv('TELEGRAM_PERSISTENCE_INTERVAL', '10'))
+
+# HTTP-сервер метрик Prometheus (metrics.py); METRICS_PORT=0 отключает его
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
@@ -0,0 +1,168 @@
+"""Приём обновлений Telegram через webhook внутри ASGI-приложения Django.
+
+Telegram отправляет обновления POST-запросом на TELEGRAM_WEBHOOK_PATH. Запрос проверяется
+по секрету из заголовка X-Telegram-Bot-Api-Secret-Token, обновление кладётся в ограниченную
+очередь Application, а все остальные запросы передаются Django без изменений.
+"""
+import asyncio
+import hmac
+import json
+import logging
+
+from django.conf import settings
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+# Обновления Telegram занимают единицы килобайт, больше мегабайта не принимаем
+MAX_BODY_SIZE = 1024 * 1024
+
+SECRET_HEADER = b'x-telegram-bot-api-secret-token'
+
+
+class TelegramWebhook:
+    """ASGI-обёртка над приложением Django, которая обслуживает webhook бота.
+
+    Бот запускается и останавливается через ASGI lifespan (uvicorn, hypercorn), поэтому
+    отдельный процесс с run_polling в режиме webhook не нужен.
+    """
+
+    def __init__(self, django_application):
+        self.django_application = django_application
+        self.path = settings.TELEGRAM_WEBHOOK_PATH
+        self.secret = settings.TELEGRAM_WEBHOOK_SECRET
+        self.bot_application = None
+
+    @property
+    def enabled(self):
+        return bool(self.secret)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http' and scope['path'] == self.path and self.enabled:
+            await self.handle_update(scope, receive, send)
+        else:
+            await self.django_application(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    if self.enabled:
+                        await self.start_bot()
+                except Exception as e:
+                    logger.error("Failed to start webhook bot: %s", e, exc_info=True)
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                try:
+                    await self.stop_bot()
+                except Exception as e:
+                    logger.error("Failed to stop webhook bot: %s", e, exc_info=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def start_bot(self):
+        # Импорт здесь: bot.py настраивает логирование и регистрирует обработчики
+        from bot import build_application
+
+        application = build_application(webhook=True)
+        await application.initialize()
+        # run_polling вызывает post_init/post_stop сам, здесь повторяем его порядок
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        self.bot_application = application
+        logger.info("Webhook bot started, accepting updates on %s", self.path)
+
+        if settings.TELEGRAM_WEBHOOK_URL:
+            await application.bot.set_webhook(
+                url=settings.TELEGRAM_WEBHOOK_URL,
+                secret_token=self.secret,
+                allowed_updates=Update.ALL_TYPES,
+            )
+            logger.info("Webhook registered in Telegram: %s", settings.TELEGRAM_WEBHOOK_URL)
+        else:
+            logger.info("TELEGRAM_WEBHOOK_URL not set, webhook is not registered in Telegram")
+
+    async def stop_bot(self):
+        application = self.bot_application
+        if application is None:
+            return
+        self.bot_application = None
+        # Webhook в Telegram не удаляем: пока процесс перезапускается, обновления ждут на стороне Telegram
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+        logger.info("Webhook bot stopped")
+
+    async def handle_update(self, scope, receive, send):
+        if scope['method'] != 'POST':
+            await self.respond(send, 405)
+            return
+
+        headers = dict(scope['headers'])
+        # Байты, а не строки: compare_digest не принимает строки с не-ASCII символами
+        if not hmac.compare_digest(headers.get(SECRET_HEADER, b''), self.secret.encode()):
+            logger.warning("Webhook request rejected: invalid secret token")
+            await self.respond(send, 403)
+            return
+
+        body = await self.read_body(receive)
+        if body is None:
+            await self.respond(send, 413)
+            return
+
+        application = self.bot_application
+        if application is None or not application.running:
+            await self.respond(send, 503)
+            return
+
+        try:
+            update = Update.de_json(json.loads(body), application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning("Webhook request rejected: malformed update (%s)", e)
+            await self.respond(send, 400)
+            return
+
+        # Обновления забираются из очереди сразу и ждут обработки уже в update processor,
+        # поэтому лимит считаем по обоим
+        queue = application.update_queue
+        backlog = queue.qsize() + application.update_processor.pending_updates
+        try:
+            if backlog >= queue.maxsize > 0:
+                raise asyncio.QueueFull
+            queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # Telegram повторит доставку позже, ничего не теряется
+            logger.warning("Update backlog is full (%s), update %s deferred", queue.maxsize, update.update_id)
+            await self.respond(send, 503)
+            return
+
+        await self.respond(send, 200)
+
+    async def read_body(self, receive):
+        body = bytearray()
+        more_body = True
+        while more_body:
+            message = await receive()
+            body.extend(message.get('body', b''))
+            if len(body) > MAX_BODY_SIZE:
+                return None
+            more_body = message.get('more_body', False)
+        return bytes(body)
+
+    async def respond(self, send, status):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'text/plain; charset=utf-8'), (b'content-length', b'0')],
+        })
+        await send({'type': 'http.response.body', 'body': b''})